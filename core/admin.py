@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Department, Professor, Student, Course, Enrollment, Material, Announcement, User
+from .models import Department, Professor, Student, Course, Enrollment, Material, MaterialUpload, Announcement, User
 
 @admin.register(User)
 class UserAdmin(admin.ModelAdmin):
@@ -34,7 +34,7 @@ class StudentAdmin(admin.ModelAdmin):
 
 @admin.register(Course)
 class CourseAdmin(admin.ModelAdmin):
-    list_display = ("id", "code", "title", "department", "capacity", "credit_hours")
+    list_display = ("id", "code", "title", "department", "capacity", "approved_count", "credit_hours")
     list_filter = ("department",)
     search_fields = ("code", "title")
     filter_horizontal = ("professors",)
@@ -57,6 +57,13 @@ class MaterialAdmin(admin.ModelAdmin):
 
 
 
+@admin.register(MaterialUpload)
+class MaterialUploadAdmin(admin.ModelAdmin):
+    list_display = ("id", "filename", "course", "uploaded_by", "received", "size", "created_at")
+    search_fields = ("filename", "title", "course__title")
+
+
+
 @admin.register(Announcement)
 class AnnouncementAdmin(admin.ModelAdmin):
     list_display = ("id", "title", "course", "posted_by", "created_at")
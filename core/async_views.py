@@ -0,0 +1,136 @@
+"""
+Async variants of the read-heavy endpoints, mounted under /api/async/.
+
+They return the same JSON as the DRF views but read through Django's async
+ORM, so under ucms/asgi.py a request waiting on the database holds a
+coroutine instead of a worker thread. Rows are loaded with everything the
+serializers touch (select_related/prefetch_related) because a lazy query
+inside an async view raises SynchronousOnlyOperation.
+
+They are not faster per request. Django's async ORM still runs every
+query through sync_to_async on a single thread, so at the same concurrency
+AsyncReadBenchmark (UCMS_BENCHMARKS=1) shows them below the threaded WSGI
+views in both throughput and p99. They pay off when requests mostly wait
+(slow clients, many idle connections), not for raw request rate.
+"""
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse, HttpResponseNotAllowed, JsonResponse
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+
+from .authentication import authenticate_request
+from .caching import accessible_course_ids
+from .models import Course, Material, Announcement
+from .pagination import InvalidCursor, apaginate
+from .serializers import (
+    CourseListSerializer,
+    CourseDetailSerializer,
+    EnrollmentSerializer,
+    MaterialSerializer,
+    AnnouncementSerializer,
+)
+
+
+COURSES = Course.objects.select_related('department').prefetch_related('professors__user')
+
+
+class Denied(Exception):
+    def __init__(self, detail, status):
+        self.response = JsonResponse({"detail": detail}, status=status)
+
+
+def _render(data):
+    return HttpResponse(JSONRenderer().render(data), content_type='application/json')
+
+
+async def _get_user(request):
+    try:
+        user = await sync_to_async(authenticate_request)(request)
+    except AuthenticationFailed as e:
+        raise Denied(str(e.detail), 401)
+    if user is None:
+        raise Denied("Authentication credentials were not provided.", 401)
+    return user
+
+
+async def _get_course(pk):
+    try:
+        return await COURSES.aget(pk=pk)
+    except Course.DoesNotExist:
+        raise Denied("No Course matches the given query.", 404)
+
+
+async def _page(request, queryset, ordering):
+    try:
+        return await apaginate(request, queryset, ordering)
+    except InvalidCursor:
+        raise Denied("Invalid cursor", 404)
+
+
+def _render_page(request, rows, next_url, serializer_class):
+    serializer = serializer_class(rows, many=True, context={'request': Request(request)})
+    return _render({"next": next_url, "previous": None, "results": serializer.data})
+
+
+def async_endpoint(view):
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method != 'GET':
+            return HttpResponseNotAllowed(['GET'])
+        try:
+            request.user = user = await _get_user(request)
+            return await view(request, user, *args, **kwargs)
+        except Denied as denied:
+            return denied.response
+    return wrapper
+
+
+async def _visible(queryset, user):
+    if user.role in ('student', 'professor'):
+        course_ids = await sync_to_async(accessible_course_ids)(user)
+        return queryset.filter(course_id__in=course_ids)
+    return queryset
+
+
+@async_endpoint
+async def course_list(request, user):
+    rows, next_url = await _page(request, COURSES, ('id',))
+    return _render_page(request, rows, next_url, CourseListSerializer)
+
+
+@async_endpoint
+async def course_detail(request, user, pk):
+    course = await _get_course(pk)
+    return _render(CourseDetailSerializer(course, context={'request': Request(request)}).data)
+
+
+@async_endpoint
+async def course_students(request, user, pk):
+    course = await _get_course(pk)
+    if user.role != 'admin' and not (
+        user.role == 'professor' and any(p.user_id == user.pk for p in course.professors.all())
+    ):
+        raise Denied("Not allowed", 403)
+
+    enrollments = course.enrollments.filter(status='approved').select_related('student__user')
+    rows, next_url = await _page(request, enrollments, ('-created_at', '-id'))
+    for enrollment in rows:
+        enrollment.course = course
+    return _render_page(request, rows, next_url, EnrollmentSerializer)
+
+
+@async_endpoint
+async def announcement_list(request, user):
+    queryset = await _visible(Announcement.objects.select_related('course', 'posted_by__user'), user)
+    rows, next_url = await _page(request, queryset, ('-created_at', '-id'))
+    return _render_page(request, rows, next_url, AnnouncementSerializer)
+
+
+@async_endpoint
+async def material_list(request, user):
+    queryset = await _visible(Material.objects.select_related('course', 'uploaded_by__user'), user)
+    rows, next_url = await _page(request, queryset, ('-created_at', '-id'))
+    return _render_page(request, rows, next_url, MaterialSerializer)
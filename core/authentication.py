@@ -0,0 +1,136 @@
+import hashlib
+
+from django.utils.functional import cached_property
+from django.utils.translation import gettext_lazy as _
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from .caching import cached_auth_state
+from .models import Professor, Student
+
+
+def auth_version(password_hash, role):
+    """
+    Fingerprint embedded in tokens as the ``ver`` claim. Changing the
+    password or the role changes it, which revokes stateless tokens.
+    """
+    return hashlib.sha256(f"{password_hash}:{role}".encode()).hexdigest()[:16]
+
+
+class ProfileJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that loads the user together with its Student or
+    Professor profile in a single query. The instance lives on request.user
+    for the rest of the request, so ``request.user.student`` and
+    ``request.user.professor`` in views, serializers and permissions no
+    longer cost a query each.
+    """
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(_("Token contained no recognizable user identification")) from e
+
+        try:
+            user = self.user_model.objects.select_related("student", "professor").get(
+                **{api_settings.USER_ID_FIELD: user_id}
+            )
+        except self.user_model.DoesNotExist as e:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found") from e
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+
+        return user
+
+
+class ClaimsUser(TokenUser):
+    """
+    Request user built from the token claims alone. ``role`` comes from the
+    claim of the same name; ``student`` and ``professor`` are unsaved,
+    pk-only instances that can be used in filters and FK assignments
+    without loading the profile rows.
+    """
+
+    def __getattr__(self, attr):
+        # TokenUser exposes every claim as an attribute and returns None for
+        # anything else, which confuses duck-typing checks in the ORM.
+        raise AttributeError(attr)
+
+    @cached_property
+    def role(self):
+        return self.token["role"]
+
+    @cached_property
+    def student(self):
+        return self._profile(Student, "student_id")
+
+    @cached_property
+    def professor(self):
+        return self._profile(Professor, "professor_id")
+
+    def _profile(self, model, claim):
+        pk = self.token.get(claim)
+        if pk is None:
+            raise model.DoesNotExist(f"User has no {model._meta.model_name}.")
+        return model(pk=pk, user_id=self.pk)
+
+
+class StatelessJWTAuthentication(ProfileJWTAuthentication):
+    """
+    Opt-in authentication that skips the per-request user query on reads.
+
+    For GET/HEAD/OPTIONS requests carrying a token with the role claims, the
+    user is a ClaimsUser built from the token. Revocation is still enforced
+    through cached_auth_state(), a short-TTL cache of (is_active, ver) that
+    is dropped whenever the user row is saved. Writes, and tokens issued
+    before the claims existed, fall back to ProfileJWTAuthentication.
+    """
+    read_only = False
+
+    def authenticate(self, request):
+        self.read_only = request.method in SAFE_METHODS
+        return super().authenticate(request)
+
+    def get_user(self, validated_token):
+        if not self.read_only or "ver" not in validated_token or "role" not in validated_token:
+            return super().get_user(validated_token)
+
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(_("Token contained no recognizable user identification")) from e
+
+        is_active, version = cached_auth_state(user_id, auth_version)
+        if version is None:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+        if api_settings.CHECK_USER_IS_ACTIVE and not is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        if validated_token["ver"] != version:
+            raise AuthenticationFailed(_("The user's credentials have changed."), code="token_outdated")
+
+        return ClaimsUser(validated_token)
+
+
+def authenticate_request(request):
+    """
+    Run the API's authentication classes against a plain Django request,
+    for views that live outside DRF (the async endpoints). Returns the
+    user or None; raises AuthenticationFailed for a bad token.
+    """
+    # rest_framework.views loads the authentication classes, this module included.
+    from rest_framework.views import APIView
+    for authentication_class in APIView.authentication_classes:
+        result = authentication_class().authenticate(request)
+        if result is not None:
+            return result[0]
+    return None
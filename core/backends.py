@@ -0,0 +1,52 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.hashers import get_hasher, identify_hasher
+
+from rest_framework.request import Request
+
+from .hashers import LoginBusy, hash_pool
+
+
+class PooledModelBackend(ModelBackend):
+    """
+    ModelBackend that verifies passwords in the bounded hash pool
+    (core.hashers.HashPool). The user lookup and any rehash write stay on
+    the request thread and its database connection; only the CPU-bound
+    hashing moves, and a saturated pool answers 503 instead of piling up.
+    """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        try:
+            return self._authenticate(username, password, **kwargs)
+        except LoginBusy:
+            # DRF turns LoginBusy into a 503; Django's own login views (the
+            # admin, session logins) would answer 500, so there the attempt
+            # simply fails.
+            if isinstance(request, Request):
+                raise
+            return None
+
+    def _authenticate(self, username, password, **kwargs):
+        UserModel = get_user_model()
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+        pool = hash_pool()
+        try:
+            user = UserModel._default_manager.get_by_natural_key(username)
+        except UserModel.DoesNotExist:
+            # Hash anyway so unknown usernames take as long as known ones.
+            pool.make_password(password)
+            return None
+
+        if not user.has_usable_password() or not pool.check_password(password, user.password):
+            return None
+        preferred = get_hasher('default')
+        if identify_hasher(user.password).algorithm != preferred.algorithm or preferred.must_update(user.password):
+            # Hasher or its settings changed since this hash was made: re-encode now.
+            user.password = pool.make_password(password)
+            user.save(update_fields=['password'])
+        if self.user_can_authenticate(user):
+            return user
+        return None
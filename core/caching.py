@@ -0,0 +1,204 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from .db import replica_reads
+from .models import credentials_changed, User, Department, Professor, Student, Course, Enrollment, Announcement
+
+
+ACCESSIBLE_COURSES_TTL = getattr(settings, 'UCMS_ACCESSIBLE_COURSES_TTL', 300)
+AUTH_STATE_TTL = getattr(settings, 'UCMS_AUTH_STATE_TTL', 30)
+CATALOG_CACHE_TTL = getattr(settings, 'UCMS_CATALOG_CACHE_TTL', 600)
+REBUILD_LOCK_TTL = getattr(settings, 'UCMS_REBUILD_LOCK_TTL', 10)
+REBUILD_WAIT = getattr(settings, 'UCMS_REBUILD_WAIT', 2)
+
+
+def _accessible_courses_key(user_id):
+    return f"core:accessible-courses:{user_id}"
+
+
+def accessible_course_ids(user):
+    """
+    IDs of the courses whose materials and announcements ``user`` may see:
+    approved enrollments for students, assigned courses for professors.
+
+    The set is cached per user and dropped by the receivers below whenever
+    an enrollment or a course's professors change.
+    """
+    key = _accessible_courses_key(user.pk)
+    course_ids = cache.get(key)
+    if course_ids is None:
+        if user.role == 'student':
+            course_ids = Enrollment.objects.filter(student__user_id=user.pk, status='approved').values_list('course_id', flat=True)
+        elif user.role == 'professor':
+            course_ids = Course.professors.through.objects.filter(professor__user_id=user.pk).values_list('course_id', flat=True)
+        else:
+            course_ids = []
+        with replica_reads(False):
+            course_ids = list(course_ids)
+        cache.set(key, course_ids, ACCESSIBLE_COURSES_TTL)
+    return course_ids
+
+
+def invalidate_accessible_courses(user_ids):
+    # After commit: a reader that refilled the entry from pre-commit rows in
+    # the meantime would otherwise keep it for the whole TTL.
+    keys = [_accessible_courses_key(user_id) for user_id in user_ids]
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def invalidate_student_access(student_ids):
+    invalidate_accessible_courses(list(Student.objects.filter(pk__in=student_ids).values_list('user_id', flat=True)))
+
+
+def _auth_state_key(user_id):
+    return f"core:auth-state:{user_id}"
+
+
+def cached_auth_state(user_id, version_for):
+    """
+    Return ``(is_active, version)`` for a user, where ``version`` is
+    ``version_for(password_hash, role)`` or None if the user is gone. Cached
+    for UCMS_AUTH_STATE_TTL seconds and dropped when the user is saved or
+    its credentials change through QuerySet.update()/bulk_update(). Raw SQL
+    and other writes that bypass the User manager are not seen: tokens stay
+    valid until the entry expires.
+    """
+    key = _auth_state_key(user_id)
+    state = cache.get(key)
+    if state is None:
+        row = User.objects.filter(pk=user_id).values_list('is_active', 'password', 'role').first()
+        state = (row[0], version_for(row[1], row[2])) if row else (False, None)
+        cache.set(key, state, AUTH_STATE_TTL)
+    return state
+
+
+def invalidate_auth_state(user_ids):
+    keys = [_auth_state_key(user_id) for user_id in user_ids]
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def _content_version_key(name):
+    return f"core:content-version:{name}"
+
+
+def content_version(name):
+    """
+    Version of a group of rows (``'catalog'``, ``'announcements'``), used as
+    an HTTP validator. The version is the time of the last change in
+    nanoseconds, so a version lost from the cache comes back newer rather
+    than repeating an old one.
+    """
+    return cache.get_or_set(_content_version_key(name), time.time_ns, None)
+
+
+def bump_content_version(*names):
+    """
+    Move ``names`` to a new version once the current transaction commits
+    (right away outside one), so no reader pairs the new version with rows
+    it cannot see yet.
+    """
+    def bump():
+        now = time.time_ns()
+        cache.set_many({_content_version_key(name): now for name in names}, None)
+    transaction.on_commit(bump)
+
+
+def _on_primary(build):
+    # Shared entries outlive replica lag, so fill them from the primary.
+    def wrapper():
+        with replica_reads(False):
+            return build()
+    return wrapper
+
+
+def get_or_build(key, build, timeout):
+    """
+    Return the cached value for ``key``, calling ``build()`` to fill it on a
+    miss. Only the worker holding the ``<key>:lock`` entry rebuilds; the rest
+    poll for its result for up to UCMS_REBUILD_WAIT seconds and then build
+    for themselves rather than fail.
+    """
+    value = cache.get(key)
+    if value is not None:
+        return value
+    build = _on_primary(build)
+    lock_key = f"{key}:lock"
+    deadline = time.monotonic() + REBUILD_WAIT
+    while not cache.add(lock_key, 1, REBUILD_LOCK_TTL):
+        time.sleep(0.05)
+        value = cache.get(key)
+        if value is not None:
+            return value
+        if time.monotonic() >= deadline:
+            return build()
+    try:
+        # The previous lock holder may have filled the key just now.
+        value = cache.get(key)
+        if value is None:
+            value = build()
+            cache.set(key, value, timeout)
+    finally:
+        cache.delete(lock_key)
+    return value
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, instance, update_fields=None, **kwargs):
+    invalidate_auth_state([instance.pk])
+    # Professor names are part of the course catalog; logins only touch
+    # last_login, or the password when it is rehashed.
+    if instance.role == 'professor' and not (update_fields and update_fields <= {'last_login', 'password'}):
+        bump_content_version('catalog')
+
+
+@receiver(credentials_changed, sender=User)
+def credentials_updated(sender, user_ids, **kwargs):
+    invalidate_auth_state(user_ids)
+
+
+@receiver(post_save, sender=Enrollment)
+@receiver(post_delete, sender=Enrollment)
+def enrollment_changed(sender, instance, **kwargs):
+    # Enrollments change which announcements a student sees, possibly by
+    # adding older ones that would not move the newest created_at.
+    bump_content_version('catalog', 'announcements')
+    if Enrollment.student.is_cached(instance):
+        invalidate_accessible_courses([instance.student.user_id])
+    else:
+        invalidate_student_access([instance.student_id])
+
+
+@receiver(m2m_changed, sender=Course.professors.through)
+def course_professors_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action.startswith('post_'):
+        bump_content_version('catalog', 'announcements')
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if reverse:
+        invalidate_accessible_courses([instance.user_id])
+    elif action == 'pre_clear':
+        invalidate_accessible_courses(instance.professors.values_list('user_id', flat=True))
+    else:
+        invalidate_accessible_courses(Professor.objects.filter(pk__in=pk_set).values_list('user_id', flat=True))
+
+
+@receiver(post_save, sender=Course)
+@receiver(post_delete, sender=Course)
+@receiver(post_save, sender=Department)
+@receiver(post_delete, sender=Department)
+@receiver(post_save, sender=Professor)
+@receiver(post_delete, sender=Professor)
+def catalog_changed(sender, instance, **kwargs):
+    bump_content_version('catalog')
+
+
+@receiver(post_save, sender=Announcement)
+@receiver(post_delete, sender=Announcement)
+def announcement_changed(sender, instance, **kwargs):
+    bump_content_version('announcements')
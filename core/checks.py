@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.core.checks import Error, register
+
+# Cache backends that each worker process keeps to itself.
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@register()
+def replica_stickiness_cache(app_configs, **kwargs):
+    """Read-your-writes pins live in the cache; with replicas it must be shared by every worker."""
+    backend = settings.CACHES.get('default', {}).get('BACKEND')
+    if getattr(settings, 'UCMS_READ_REPLICAS', []) and backend in PROCESS_LOCAL_CACHES:
+        return [
+            Error(
+                "Read replicas are configured but the default cache is process-local.",
+                hint="Set UCMS_REDIS_URL (or another shared cache) so a user who just wrote "
+                     "reads from the primary on every worker.",
+                id='core.E001',
+            )
+        ]
+    return []
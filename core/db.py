@@ -0,0 +1,104 @@
+import functools
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections
+
+
+# Whether reads in the current request/task may go to a replica.
+_replica_reads = ContextVar('ucms_replica_reads', default=False)
+
+
+def is_lock_error(exc):
+    """SQLite "database is locked"/"table is locked", MySQL lock wait timeouts and deadlocks."""
+    return 'lock' in str(exc).lower()
+
+
+def retry_on_locked(func=None, *, attempts=None, delay=None, using=DEFAULT_DB_ALIAS):
+    """
+    Re-run ``func`` when it fails on a lock (see is_lock_error), with
+    jittered exponential backoff, up to ``attempts`` tries in all
+    (UCMS_DB_LOCK_RETRIES by default). Each try may itself wait out the
+    database lock timeout, so the two together bound how long a request
+    can block on a lock.
+
+    Only the outermost transaction is retried: inside an atomic block the
+    error is raised unchanged, because the enclosing work has to be redone
+    too. ``func`` must therefore do all its writes in its own transaction.
+    """
+    if func is None:
+        return functools.partial(retry_on_locked, attempts=attempts, delay=delay, using=using)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        tries = attempts or getattr(settings, 'UCMS_DB_LOCK_RETRIES', 3)
+        pause = getattr(settings, 'UCMS_DB_LOCK_RETRY_DELAY', 0.05) if delay is None else delay
+        for attempt in range(1, tries + 1):
+            try:
+                return func(*args, **kwargs)
+            except OperationalError as exc:
+                if attempt == tries or not is_lock_error(exc) or connections[using].in_atomic_block:
+                    raise
+                time.sleep(pause * 2 ** (attempt - 1) * random.uniform(0.5, 1.5))
+
+    return wrapper
+
+
+@contextmanager
+def replica_reads(enabled=True):
+    """Let core reads in this block go to a replica (or, with False, not)."""
+    token = _replica_reads.set(enabled)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def _sticky_key(user_id):
+    return f"core:db-primary:{user_id}"
+
+
+def pin_to_primary(user_id):
+    """Send ``user_id``'s reads to the primary for UCMS_REPLICA_STICKY_SECONDS, covering replica lag."""
+    cache.set(_sticky_key(user_id), 1, getattr(settings, 'UCMS_REPLICA_STICKY_SECONDS', 5))
+
+
+def pinned_to_primary(user_id):
+    return user_id is not None and cache.get(_sticky_key(user_id)) is not None
+
+
+class ReplicaRouter:
+    """
+    Route core reads to one of UCMS_READ_REPLICAS while replica_reads() is
+    on, and everything else (all writes, reads outside it, other apps) to
+    the primary.
+
+    Rows fetched through a model instance (related managers, prefetches)
+    stay on the database the instance came from, so a request never mixes
+    a replica's view of a course with the primary's view of its roster.
+    """
+
+    def db_for_read(self, model, **hints):
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            return instance._state.db
+        replicas = getattr(settings, 'UCMS_READ_REPLICAS', [])
+        if replicas and model._meta.app_label == 'core' and _replica_reads.get():
+            return random.choice(replicas)
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas copy the primary's schema; never migrate them directly.
+        if db in getattr(settings, 'UCMS_READ_REPLICAS', []):
+            return False
+        return None
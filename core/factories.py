@@ -0,0 +1,140 @@
+"""
+Seeded, reproducible data set for performance tests and load runs.
+
+``seed_data(scale=1.0)`` builds a registration-day sized university: 5,000
+courses, 50,000 students, 500,000 enrollments, with professors,
+announcements and materials. Smaller scales shrink every table together
+so the same shape runs in the regular test suite (UCMS_PERF_SCALE).
+"""
+import math
+import random
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .caching import bump_content_version
+from .models import User, Department, Professor, Student, Course, Enrollment, Material, Announcement
+
+
+FULL_SCALE = {
+    'departments': 20,
+    'professors': 500,
+    'courses': 5000,
+    'students': 50000,
+    'enrollments_per_student': 10,
+    'posts_per_course': 2,
+}
+
+SEED_PASSWORD = "seed-pass-1234"
+
+
+def seed_counts(scale):
+    counts = {name: max(2, math.ceil(value * scale)) for name, value in FULL_SCALE.items()}
+    counts['enrollments_per_student'] = min(FULL_SCALE['enrollments_per_student'], counts['courses'] // 2)
+    counts['posts_per_course'] = FULL_SCALE['posts_per_course']
+    return counts
+
+
+@transaction.atomic
+def seed_data(scale=1.0, seed=0, batch_size=5000):
+    """
+    Create the data set and return ``{'counts': ..., 'admin': user,
+    'professor': user, 'student': user}``; the sample professor teaches and
+    the sample student is approved in the first course. Every user's
+    password is SEED_PASSWORD.
+    """
+    rng = random.Random(seed)
+    counts = seed_counts(scale)
+    password = make_password(SEED_PASSWORD)
+
+    def users(prefix, role, n):
+        return User.objects.bulk_create(
+            [
+                User(username=f"{prefix}{i}", role=role, password=password,
+                     first_name=prefix.title(), last_name=str(i), email=f"{prefix}{i}@seed.ucms.edu")
+                for i in range(n)
+            ],
+            batch_size=batch_size,
+        )
+
+    departments = Department.objects.bulk_create(
+        [Department(name=f"Department {i}", code=f"D{i:03}") for i in range(counts['departments'])]
+    )
+    admin = User.objects.create(username="seed-admin", role="admin", password=password, is_staff=True)
+    professors = Professor.objects.bulk_create(
+        [
+            Professor(user=user, department=departments[i % len(departments)], office=f"B-{i}")
+            for i, user in enumerate(users("prof", "professor", counts['professors']))
+        ],
+        batch_size=batch_size,
+    )
+    students = Student.objects.bulk_create(
+        [
+            Student(user=user, national_id=f"SEED{i:08}", department=departments[i % len(departments)], academic_year=str(1 + i % 4))
+            for i, user in enumerate(users("student", "student", counts['students']))
+        ],
+        batch_size=batch_size,
+    )
+
+    per_course = counts['students'] * counts['enrollments_per_student'] / counts['courses']
+    courses = Course.objects.bulk_create(
+        [
+            Course(code=f"C{i:05}", title=f"Course {i}", department=departments[i % len(departments)],
+                   capacity=max(30, math.ceil(per_course * 2)), credit_hours=rng.choice((2, 3, 4)))
+            for i in range(counts['courses'])
+        ],
+        batch_size=batch_size,
+    )
+    Course.professors.through.objects.bulk_create(
+        [
+            Course.professors.through(course_id=course.pk, professor_id=professors[i % len(professors)].pk)
+            for i, course in enumerate(courses)
+        ],
+        batch_size=batch_size,
+    )
+
+    course_ids = [course.pk for course in courses]
+    enrollments = []
+    for i, student in enumerate(students):
+        picks = rng.sample(course_ids, counts['enrollments_per_student'])
+        if i == 0 and course_ids[0] not in picks:
+            # The sample student is always in the first course.
+            picks[0] = course_ids[0]
+        for course_id in picks:
+            status = 'approved' if rng.random() < 0.9 or i == 0 else 'pending'
+            enrollments.append(Enrollment(student_id=student.pk, course_id=course_id, status=status))
+        if len(enrollments) >= batch_size:
+            Enrollment.objects.bulk_create(enrollments)
+            enrollments = []
+    Enrollment.objects.bulk_create(enrollments)
+
+    approved = (
+        Enrollment.objects.filter(course=OuterRef('pk'), status='approved')
+        .order_by().values('course').annotate(total=Count('pk')).values('total')
+    )
+    Course.objects.update(approved_count=Coalesce(Subquery(approved), 0))
+
+    posts = []
+    for i, course in enumerate(courses):
+        professor = professors[i % len(professors)]
+        for n in range(counts['posts_per_course']):
+            posts.append(Announcement(course=course, posted_by=professor, title=f"Week {n}", body="Reading list"))
+    Announcement.objects.bulk_create(posts, batch_size=batch_size)
+    Material.objects.bulk_create(
+        [
+            Material(course=post.course, uploaded_by=post.posted_by, title=f"Slides {post.title}",
+                     file=f"materials/seed/{post.course.pk}-{n}.pdf", size=0)
+            for n, post in enumerate(posts)
+        ],
+        batch_size=batch_size,
+    )
+
+    bump_content_version('catalog', 'announcements')
+    return {
+        'counts': counts,
+        'admin': admin,
+        'professor': professors[0].user,
+        'student': students[0].user,
+    }
@@ -0,0 +1,142 @@
+import hashlib
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils.http import content_disposition_header
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+class ChecksumUploadHandler(TemporaryFileUploadHandler):
+    """
+    Stream uploads straight to a temporary file, computing their SHA-256 on
+    the way through. The digest is left on the uploaded file as ``sha256``
+    so Material can de-duplicate it without reading the file again.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.digest = hashlib.sha256()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.digest.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        upload = super().file_complete(file_size)
+        upload.sha256 = self.digest.hexdigest()
+        return upload
+
+
+class StagedFile(File):
+    """
+    A finished staging file (see MaterialUpload). Exposing
+    temporary_file_path() lets FileSystemStorage move it into place
+    instead of copying it.
+    """
+
+    def temporary_file_path(self):
+        return self.file.name
+
+
+def file_sha256(content):
+    """SHA-256 of a File, reusing the digest ChecksumUploadHandler computed."""
+    checksum = getattr(content, "sha256", None)
+    if checksum:
+        return checksum
+    digest = hashlib.sha256()
+    for chunk in content.chunks(STREAM_CHUNK_SIZE):
+        digest.update(chunk)
+    content.seek(0)
+    return digest.hexdigest()
+
+
+def serve_file(request, field_file, filename, etag=None):
+    """
+    Download response for a stored file with ETag/If-None-Match and single
+    ``Range: bytes=`` support.
+
+    When UCMS_SENDFILE_HEADER is set (``X-Accel-Redirect`` for nginx,
+    ``X-Sendfile`` for Apache) the body is left to the front-end server;
+    otherwise the file is streamed with FileResponse, which lets the WSGI
+    server use its zero-copy file wrapper.
+    """
+    if etag and etag in _parse_etags(request.headers.get("If-None-Match", "")):
+        response = HttpResponseNotModified()
+        response["ETag"] = etag
+        return response
+
+    size = field_file.size
+    content_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    start, end = _parse_range(request.headers.get("Range"), size)
+    if etag and request.headers.get("If-Range") not in (None, etag):
+        start, end = None, None
+
+    sendfile_header = getattr(settings, "UCMS_SENDFILE_HEADER", None)
+    if sendfile_header:
+        response = HttpResponse(content_type=content_type)
+        response[sendfile_header] = _sendfile_location(sendfile_header, field_file)
+    elif start is None:
+        response = FileResponse(field_file.open("rb"), content_type=content_type)
+    elif start >= size:
+        response = HttpResponse(status=416)
+        response["Content-Range"] = f"bytes */{size}"
+        return response
+    else:
+        length = end - start + 1
+        response = StreamingHttpResponse(
+            _read_range(field_file.open("rb"), start, length), status=206, content_type=content_type
+        )
+        response["Content-Length"] = str(length)
+        response["Content-Range"] = f"bytes {start}-{end}/{size}"
+
+    response["Accept-Ranges"] = "bytes"
+    response["Content-Disposition"] = content_disposition_header(True, filename)
+    if etag:
+        response["ETag"] = etag
+    return response
+
+
+def _parse_etags(header):
+    return {tag.strip() for tag in header.split(",") if tag.strip()}
+
+
+def _parse_range(header, size):
+    # Only a single byte range is supported; anything else gets the whole file.
+    match = RANGE_RE.match(header or "")
+    if not match or match.groups() == ("", ""):
+        return None, None
+    first, last = match.groups()
+    if first == "":
+        start = max(0, size - int(last))
+        end = size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if end < start and start < size:
+        return None, None
+    return start, end
+
+
+def _read_range(handle, start, length):
+    with handle:
+        handle.seek(start)
+        while length > 0:
+            chunk = handle.read(min(STREAM_CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def _sendfile_location(header, field_file):
+    if header.lower() == "x-accel-redirect":
+        prefix = getattr(settings, "UCMS_SENDFILE_PREFIX", "/protected/")
+        return prefix + field_file.name
+    return os.fspath(field_file.path)
@@ -0,0 +1,75 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher, check_password, make_password
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+
+class ConfigurablePBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """
+    PBKDF2-SHA256 with the work factor taken from UCMS_PBKDF2_ITERATIONS.
+
+    It keeps Django's ``pbkdf2_sha256`` algorithm name, so existing hashes
+    verify unchanged; a hash made with another iteration count is
+    re-encoded with the current one the next time its user logs in.
+    """
+
+    @property
+    def iterations(self):
+        return getattr(settings, 'UCMS_PBKDF2_ITERATIONS', PBKDF2PasswordHasher.iterations)
+
+
+class LoginBusy(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = "Too many logins in progress, retry shortly."
+    default_code = 'login_busy'
+    wait = 1  # sent as Retry-After by DRF's exception handler
+
+
+class HashPool:
+    """
+    Bounded pool for password hashing. PBKDF2 runs in C with the GIL
+    released, so the workers use every core while request threads only
+    wait. At most ``workers + queue_size`` hashes are admitted; beyond
+    that a caller waits up to ``timeout`` seconds for a slot and then gets
+    LoginBusy (503), which sheds a login storm instead of queueing it
+    without limit.
+    """
+
+    def __init__(self, workers, queue_size, timeout):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='ucms-hash')
+        self.slots = threading.BoundedSemaphore(workers + queue_size)
+        self.timeout = timeout
+
+    def run(self, fn, *args):
+        if not self.slots.acquire(timeout=self.timeout):
+            raise LoginBusy()
+        try:
+            return self.executor.submit(fn, *args).result()
+        finally:
+            self.slots.release()
+
+    def check_password(self, password, encoded):
+        return self.run(check_password, password, encoded)
+
+    def make_password(self, password):
+        return self.run(make_password, password)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def hash_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            workers = getattr(settings, 'UCMS_LOGIN_HASH_WORKERS', None) or 4
+            _pool = HashPool(
+                workers,
+                getattr(settings, 'UCMS_LOGIN_QUEUE_SIZE', workers * 8),
+                getattr(settings, 'UCMS_LOGIN_QUEUE_TIMEOUT', 2),
+            )
+        return _pool
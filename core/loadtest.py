@@ -0,0 +1,222 @@
+"""
+Load generator for UCMS workloads, driven by ``manage.py loadtest``.
+
+Virtual users replay a weighted mix of operations (login, catalog browse,
+enroll, feed polling, material download) against either the Django test
+client in-process or a running server, and the run is summarised per
+endpoint as JSON: throughput, p50/p95/p99 latency and status counts. The
+mix, user pool and random sequence are all seeded, so two runs of the
+same command on two commits are comparable.
+"""
+import json
+import math
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import Counter, defaultdict
+
+from .factories import SEED_PASSWORD
+
+
+MIXES = {
+    # Registration day: students log in, browse and hammer enrollment.
+    'registration': {'login': 1, 'catalog': 4, 'enroll': 3, 'feed': 1, 'download': 1},
+    # A normal teaching week: mostly feed polling and downloads.
+    'teaching': {'login': 1, 'catalog': 2, 'enroll': 0, 'feed': 5, 'download': 2},
+    'catalog': {'login': 0, 'catalog': 1, 'enroll': 0, 'feed': 0, 'download': 0},
+}
+
+
+class ClientTransport:
+    """In-process requests through django.test.Client (no server needed)."""
+
+    def __init__(self):
+        from django.test import Client
+        self.local = threading.local()
+        self.client_class = Client
+
+    def request(self, method, path, token=None, body=None):
+        client = getattr(self.local, 'client', None)
+        if client is None:
+            client = self.local.client = self.client_class()
+        headers = {'Authorization': f'Bearer {token}'} if token else {}
+        kwargs = {'data': json.dumps(body), 'content_type': 'application/json'} if body is not None else {}
+        response = getattr(client, method.lower())(path, headers=headers, **kwargs)
+        content = b''.join(response.streaming_content) if response.streaming else response.content
+        return response.status_code, content
+
+
+class HTTPTransport:
+    """Requests to a running server, e.g. ``http://127.0.0.1:8000``."""
+
+    def __init__(self, base_url, timeout=30):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+
+    def request(self, method, path, token=None, body=None):
+        headers = {'Content-Type': 'application/json'}
+        if token:
+            headers['Authorization'] = f'Bearer {token}'
+        data = json.dumps(body).encode() if body is not None else None
+        request = urllib.request.Request(self.base_url + path, data=data, headers=headers, method=method)
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+
+
+def _json(content):
+    try:
+        return json.loads(content)
+    except ValueError:
+        return None
+
+
+class VirtualUser:
+    def __init__(self, harness, username, rng):
+        self.harness = harness
+        self.username = username
+        self.rng = rng
+        self.token = None
+        self.course_ids = []
+        self.material_ids = []
+        self.feed_cursor = None
+
+    def call(self, label, method, path, body=None, token=True):
+        return self.harness.timed(label, method, path, self.token if token else None, body)
+
+    def login(self):
+        # Each login after the first starts a session as another user of the pool.
+        if self.token is not None:
+            self.username = self.rng.choice(self.harness.users)
+        status, content = self.call(
+            'POST /api/auth/token/', 'POST', '/api/auth/token/',
+            {'username': self.username, 'password': self.harness.password}, token=False,
+        )
+        data = _json(content) if status == 200 else None
+        self.token = data['access'] if data else None
+
+    def catalog(self):
+        status, content = self.call('GET /api/courses/', 'GET', '/api/courses/')
+        data = _json(content) if status == 200 else None
+        if data:
+            self.course_ids = [row['id'] for row in data['results']]
+        if self.course_ids:
+            self.call('GET /api/courses/{id}/', 'GET', f'/api/courses/{self.rng.choice(self.course_ids)}/')
+
+    def enroll(self):
+        if not self.course_ids:
+            return self.catalog()
+        self.call('POST /api/enrollments/', 'POST', '/api/enrollments/', {'course_id': self.rng.choice(self.course_ids)})
+
+    def feed(self):
+        path = '/api/feed/' + (f'?since={self.feed_cursor}' if self.feed_cursor else '')
+        status, content = self.call('GET /api/feed/', 'GET', path)
+        data = _json(content) if status == 200 else None
+        if data:
+            self.feed_cursor = data['since'] or self.feed_cursor
+
+    def download(self):
+        if not self.material_ids:
+            status, content = self.call('GET /api/materials/', 'GET', '/api/materials/?fields=id')
+            data = _json(content) if status == 200 else None
+            self.material_ids = [row['id'] for row in data['results']] if data else []
+            if not self.material_ids:
+                return
+        material_id = self.rng.choice(self.material_ids)
+        self.call('GET /api/materials/{id}/download/', 'GET', f'/api/materials/{material_id}/download/')
+
+    def step(self, operation):
+        if self.token is None and operation != 'login':
+            self.login()
+        getattr(self, operation)()
+
+
+def percentile(sorted_values, fraction):
+    index = max(0, math.ceil(len(sorted_values) * fraction) - 1)
+    return sorted_values[index]
+
+
+class LoadHarness:
+    """
+    Run ``operations`` mix steps spread over ``concurrency`` virtual-user
+    threads (inline when concurrency is 1) and collect per-endpoint
+    latencies. ``users`` is the pool of usernames to log in as.
+    """
+
+    def __init__(self, transport, users, mix='registration', concurrency=10, operations=1000,
+                 seed=0, password=SEED_PASSWORD):
+        self.transport = transport
+        self.users = users
+        self.weights = MIXES[mix] if isinstance(mix, str) else mix
+        self.mix = mix
+        self.concurrency = concurrency
+        self.operations = operations
+        self.seed = seed
+        self.password = password
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(Counter)
+
+    def timed(self, label, method, path, token, body):
+        start = time.perf_counter()
+        try:
+            status, content = self.transport.request(method, path, token, body)
+        except Exception:
+            status, content = 'error', b''
+        elapsed = time.perf_counter() - start
+        with self.lock:
+            self.latencies[label].append(elapsed)
+            self.statuses[label][str(status)] += 1
+        return status, content
+
+    def worker(self, index, steps):
+        rng = random.Random(f"{self.seed}:{index}")
+        user = VirtualUser(self, self.users[index % len(self.users)], rng)
+        operations = [name for name, weight in self.weights.items() if weight]
+        weights = [self.weights[name] for name in operations]
+        for operation in rng.choices(operations, weights, k=steps):
+            user.step(operation)
+
+    def run(self):
+        shares = [self.operations // self.concurrency + (i < self.operations % self.concurrency) for i in range(self.concurrency)]
+        start = time.perf_counter()
+        if self.concurrency == 1:
+            self.worker(0, shares[0])
+        else:
+            threads = [threading.Thread(target=self.worker, args=(i, steps)) for i, steps in enumerate(shares)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        return self.report(time.perf_counter() - start)
+
+    def report(self, elapsed):
+        endpoints = {}
+        for label, values in sorted(self.latencies.items()):
+            values = sorted(values)
+            statuses = self.statuses[label]
+            endpoints[label] = {
+                'requests': len(values),
+                'throughput': round(len(values) / elapsed, 2),
+                'p50_ms': round(percentile(values, 0.50) * 1000, 2),
+                'p95_ms': round(percentile(values, 0.95) * 1000, 2),
+                'p99_ms': round(percentile(values, 0.99) * 1000, 2),
+                'errors': sum(count for status, count in statuses.items() if status[0] not in '234'),
+                'statuses': dict(statuses),
+            }
+        total = sum(row['requests'] for row in endpoints.values())
+        return {
+            'mix': self.mix,
+            'weights': self.weights,
+            'concurrency': self.concurrency,
+            'operations': self.operations,
+            'seed': self.seed,
+            'elapsed_s': round(elapsed, 3),
+            'requests': total,
+            'throughput': round(total / elapsed, 2) if elapsed else None,
+            'endpoints': endpoints,
+        }
@@ -0,0 +1,49 @@
+import csv
+import json
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+
+from core.provisioning import UserImporter
+
+
+class Command(BaseCommand):
+    help = (
+        "Bulk-import users from a CSV file with columns username, role, first_name, last_name, "
+        "email, password, national_id, department, academic_year, office."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("csv_path")
+        parser.add_argument("--chunk-size", type=int, default=1000)
+        parser.add_argument("--workers", type=int, default=None, help="Hashing processes (default: one per CPU, 0 hashes in-process).")
+        parser.add_argument("--checkpoint", help="Progress file used to resume (default: <csv_path>.progress).")
+        parser.add_argument("--restart", action="store_true", help="Ignore any existing checkpoint.")
+
+    def handle(self, *args, **options):
+        csv_path = Path(options["csv_path"])
+        checkpoint = Path(options["checkpoint"] or f"{csv_path}.progress")
+
+        start_row = 0
+        if checkpoint.exists() and not options["restart"]:
+            start_row = int(checkpoint.read_text().strip() or 0)
+            self.stdout.write(f"Resuming after row {start_row}")
+
+        def progress(summary):
+            checkpoint.write_text(str(summary["processed"]))
+            self.stdout.write(
+                f"{summary['processed']} rows: {summary['created']} created, {summary['skipped']} skipped, "
+                f"{summary['failed']} failed ({summary['users_per_second']} users/s)"
+            )
+
+        importer = UserImporter(chunk_size=options["chunk_size"], workers=options["workers"], progress=progress)
+        with csv_path.open(newline="", encoding="utf-8-sig") as handle:
+            summary = importer.run(csv.DictReader(handle), start_row=start_row)
+
+        for error in summary["errors"]:
+            self.stderr.write(json.dumps(error))
+        checkpoint.unlink(missing_ok=True)
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {summary['created']} users in {summary['elapsed']}s ({summary['users_per_second']} users/s); "
+            f"{summary['skipped']} skipped, {summary['failed']} failed."
+        ))
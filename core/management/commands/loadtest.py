@@ -0,0 +1,69 @@
+import json
+import subprocess
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.factories import SEED_PASSWORD, seed_data
+from core.loadtest import MIXES, ClientTransport, HTTPTransport, LoadHarness
+
+
+class Command(BaseCommand):
+    help = (
+        "Replay a UCMS workload mix (login, catalog, enroll, feed, download) and report "
+        "throughput and p50/p95/p99 latency per endpoint as JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--target", default="client", help='"client" for the in-process test client, or a server URL.')
+        parser.add_argument("--mix", default="registration", choices=sorted(MIXES))
+        parser.add_argument("--concurrency", type=int, default=10)
+        parser.add_argument("--operations", type=int, default=1000, help="Mix steps across all virtual users.")
+        parser.add_argument("--users", type=int, default=100, help="Size of the user pool (student0..studentN-1).")
+        parser.add_argument("--username-pattern", default="student{i}")
+        parser.add_argument("--password", default=SEED_PASSWORD)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--seed-data", type=float, metavar="SCALE", help="Seed the database with core.factories first.")
+        parser.add_argument("--output", help="Also write the JSON report to this file.")
+
+    def handle(self, *args, **options):
+        if options["concurrency"] < 1 or options["operations"] < 1:
+            raise CommandError("--concurrency and --operations must be positive.")
+        if options["seed_data"]:
+            counts = seed_data(scale=options["seed_data"], seed=options["seed"])["counts"]
+            self.stderr.write(f"Seeded {counts}")
+
+        if options["target"] == "client":
+            if "testserver" not in settings.ALLOWED_HOSTS and "*" not in settings.ALLOWED_HOSTS:
+                settings.ALLOWED_HOSTS = [*settings.ALLOWED_HOSTS, "testserver"]
+            transport = ClientTransport()
+        else:
+            transport = HTTPTransport(options["target"])
+
+        harness = LoadHarness(
+            transport,
+            users=[options["username_pattern"].format(i=i) for i in range(options["users"])],
+            mix=options["mix"],
+            concurrency=options["concurrency"],
+            operations=options["operations"],
+            seed=options["seed"],
+            password=options["password"],
+        )
+        report = harness.run()
+        report["target"] = options["target"]
+        report["commit"] = self.commit()
+
+        output = json.dumps(report, indent=2)
+        if options["output"]:
+            Path(options["output"]).write_text(output + "\n")
+        self.stdout.write(output)
+
+    def commit(self):
+        try:
+            return subprocess.run(
+                ["git", "rev-parse", "--short", "HEAD"], cwd=settings.BASE_DIR,
+                capture_output=True, text=True, check=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
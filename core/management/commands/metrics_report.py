@@ -0,0 +1,73 @@
+import json
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def summarize(records):
+    """Per-endpoint aggregates of the JSON lines written by RequestMetricsMiddleware."""
+    by_endpoint = defaultdict(list)
+    for record in records:
+        by_endpoint[record["endpoint"]].append(record)
+
+    rows = []
+    for endpoint, group in by_endpoint.items():
+        totals = [r["total_ms"] for r in group]
+        sizes = [r["bytes"] for r in group if r["bytes"] is not None]
+        rows.append({
+            "endpoint": endpoint,
+            "requests": len(group),
+            "p50_ms": percentile(totals, 0.50),
+            "p95_ms": percentile(totals, 0.95),
+            "avg_queries": round(sum(r["queries"] for r in group) / len(group), 1),
+            "max_queries": max(r["queries"] for r in group),
+            "avg_db_ms": round(sum(r["db_ms"] for r in group) / len(group), 2),
+            # Logs written before serializer timing existed lack serialize_ms.
+            "avg_serialize_ms": round(sum(r.get("serialize_ms", 0) for r in group) / len(group), 2),
+            "avg_render_ms": round(sum(r["render_ms"] for r in group) / len(group), 2),
+            "avg_bytes": round(sum(sizes) / len(sizes)) if sizes else None,
+            "n_plus_one": sum(1 for r in group if r["duplicates"]),
+        })
+    rows.sort(key=lambda row: row["p95_ms"] * row["requests"], reverse=True)
+    return rows
+
+
+class Command(BaseCommand):
+    help = "Summarise the request metrics log (UCMS_METRICS_LOG) per endpoint, most expensive first."
+
+    def add_arguments(self, parser):
+        parser.add_argument("log_path", nargs="?", help="Metrics log (default: UCMS_METRICS_LOG).")
+        parser.add_argument("--json", action="store_true", help="Print the summary as JSON.")
+
+    def handle(self, *args, **options):
+        log_path = options["log_path"] or getattr(settings, "UCMS_METRICS_LOG", None)
+        if not log_path:
+            raise CommandError("Pass a log path or set UCMS_METRICS_LOG.")
+        try:
+            with open(log_path) as handle:
+                records = [json.loads(line) for line in handle if line.strip()]
+        except FileNotFoundError:
+            raise CommandError(f"No metrics log at {log_path}.")
+
+        rows = summarize(records)
+        if options["json"]:
+            self.stdout.write(json.dumps(rows, indent=2))
+            return
+
+        self.stdout.write(
+            f"{'endpoint':40} {'reqs':>6} {'p50 ms':>8} {'p95 ms':>8} {'queries':>8} {'max q':>6} "
+            f"{'db ms':>7} {'serial':>7} {'render':>7} {'bytes':>8} {'N+1':>5}"
+        )
+        for row in rows:
+            self.stdout.write(
+                f"{row['endpoint']:40} {row['requests']:>6} {row['p50_ms']:>8.1f} {row['p95_ms']:>8.1f} "
+                f"{row['avg_queries']:>8} {row['max_queries']:>6} {row['avg_db_ms']:>7.1f} "
+                f"{row['avg_serialize_ms']:>7.1f} {row['avg_render_ms']:>7.1f} {row['avg_bytes'] if row['avg_bytes'] is not None else '-':>8} "
+                f"{row['n_plus_one']:>5}"
+            )
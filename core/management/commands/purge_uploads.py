@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from core.models import MaterialUpload
+
+
+class Command(BaseCommand):
+    help = "Delete resumable uploads older than UCMS_UPLOAD_EXPIRY_HOURS and orphaned staging files."
+
+    def handle(self, *args, **options):
+        removed = MaterialUpload.objects.purge_expired()
+        self.stdout.write(f"Removed {removed} staging file(s).")
@@ -0,0 +1,219 @@
+import json
+import logging
+import random
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.utils.functional import SimpleLazyObject, empty
+
+
+logger = logging.getLogger('core.metrics')
+
+_log_lock = threading.Lock()
+
+# QueryRecorder and timings of the request being handled in this context, if any.
+_recorder = ContextVar('ucms_query_recorder', default=None)
+_timings = ContextVar('ucms_request_timings', default=None)
+
+
+@contextmanager
+def measure(name):
+    """Add the time spent in the block to the current request's ``name`` timing."""
+    timings = _timings.get()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if timings is not None:
+            timings[name] += time.perf_counter() - started
+
+
+class QueryRecorder:
+    """``execute_wrapper`` that counts, times and groups the statements run."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            self.statements[sql] += 1
+
+    def duplicates(self, threshold):
+        """Statements run at least ``threshold`` times with different params: N+1 suspects."""
+        return [(sql, count) for sql, count in self.statements.most_common() if count >= threshold]
+
+
+def endpoint_name(request, view_func):
+    """``CourseViewSet.list`` for viewset actions, the view's name otherwise."""
+    cls = getattr(view_func, 'cls', None)
+    if cls is None:
+        return getattr(view_func, '__name__', 'unknown')
+    actions = getattr(view_func, 'actions', None) or {}
+    action = actions.get(request.method.lower(), request.method.lower())
+    return f"{cls.__name__}.{action}"
+
+
+def _record(execute, sql, params, many, context):
+    recorder = _recorder.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    return recorder(execute, sql, params, many, context)
+
+
+def install_recorder(connection, **kwargs):
+    """
+    Route ``connection``'s statements to the current request's recorder.
+    The recorder is found through a contextvar, which asgiref carries into
+    sync_to_async threads, so queries made by async views are counted too.
+    """
+    if _record not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record)
+
+
+connection_created.connect(install_recorder)
+
+
+class RequestMetricsMiddleware:
+    """
+    Measure each request: query count and database time (through an
+    execute wrapper on every database connection), serializer time (see
+    measure(); it includes any queries the serializers trigger), response
+    render time, total time and body size. It runs natively under both WSGI
+    and ASGI, so async views and event streams never wait on a worker
+    thread here, and the sampled log line is written off the event loop.
+
+    With DEBUG on, or for admin and staff users, the numbers go out in a
+    Server-Timing header. Statements repeated
+    UCMS_METRICS_DUPLICATE_THRESHOLD times or more are logged as N+1
+    suspects. With UCMS_METRICS_LOG set, a UCMS_METRICS_SAMPLE_RATE share
+    of requests is appended to that file as JSON lines for the
+    ``metrics_report`` command.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.log_path = getattr(settings, 'UCMS_METRICS_LOG', None)
+        self.sample_rate = getattr(settings, 'UCMS_METRICS_SAMPLE_RATE', 1.0)
+        self.duplicate_threshold = getattr(settings, 'UCMS_METRICS_DUPLICATE_THRESHOLD', 3)
+        for connection in connections.all(initialized_only=True):
+            install_recorder(connection)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+            # Hooks in the handler's own mode are called without a thread hop.
+            self.process_template_response = self.aprocess_template_response
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        recorder, tokens, start = self.begin(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            self.end(tokens)
+        record = self.finish(request, response, recorder, start)
+        if record:
+            self.write(record)
+        return response
+
+    async def __acall__(self, request):
+        recorder, tokens, start = self.begin(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            self.end(tokens)
+        record = self.finish(request, response, recorder, start)
+        if record:
+            # File I/O: keep it off the event loop.
+            await sync_to_async(self.write, thread_sensitive=False)(record)
+        return response
+
+    def begin(self, request):
+        request._metrics = {'render': 0.0, 'serialize': 0.0}
+        recorder = QueryRecorder()
+        tokens = _recorder.set(recorder), _timings.set(request._metrics)
+        return recorder, tokens, time.perf_counter()
+
+    def end(self, tokens):
+        _recorder.reset(tokens[0])
+        _timings.reset(tokens[1])
+
+    def finish(self, request, response, recorder, start):
+        """Set Server-Timing and flag repeated statements; returns the log record if sampled."""
+        total = time.perf_counter() - start
+        metrics = request._metrics
+        match = getattr(request, 'resolver_match', None)
+        endpoint = endpoint_name(request, match.func) if match else request.path
+        duplicates = recorder.duplicates(self.duplicate_threshold)
+        if self.show_timing(request):
+            response['Server-Timing'] = ', '.join([
+                f'db;dur={recorder.duration * 1000:.1f};desc="{recorder.count} queries"',
+                f'serialize;dur={metrics["serialize"] * 1000:.1f}',
+                f'render;dur={metrics["render"] * 1000:.1f}',
+                f'total;dur={total * 1000:.1f}',
+            ])
+        if duplicates:
+            logger.warning(
+                "%s repeated %d statement(s), e.g. %dx %s",
+                endpoint, len(duplicates), duplicates[0][1], duplicates[0][0],
+            )
+
+        if self.log_path and random.random() < self.sample_rate:
+            return {
+                'time': time.time(),
+                'endpoint': endpoint,
+                'method': request.method,
+                'path': request.path,
+                'status': response.status_code,
+                'queries': recorder.count,
+                'db_ms': round(recorder.duration * 1000, 2),
+                'serialize_ms': round(metrics['serialize'] * 1000, 2),
+                'render_ms': round(metrics['render'] * 1000, 2),
+                'total_ms': round(total * 1000, 2),
+                'bytes': None if response.streaming else len(response.content),
+                'duplicates': [{'sql': sql, 'count': count} for sql, count in duplicates[:5]],
+            }
+        return None
+
+    def show_timing(self, request):
+        if settings.DEBUG:
+            return True
+        # Only look at a user the view already resolved (DRF and the async
+        # views set it); loading a session here would query from the event loop.
+        user = getattr(request, 'user', None)
+        if user is None or (isinstance(user, SimpleLazyObject) and user._wrapped is empty):
+            return False
+        return user.is_authenticated and (user.is_staff or getattr(user, 'role', None) == 'admin')
+
+    def process_template_response(self, request, response):
+        # DRF responses are rendered after this hook; time that step.
+        started = time.perf_counter()
+
+        def rendered(response):
+            request._metrics['render'] = time.perf_counter() - started
+
+        response.add_post_render_callback(rendered)
+        return response
+
+    async def aprocess_template_response(self, request, response):
+        return RequestMetricsMiddleware.process_template_response(self, request, response)
+
+    def write(self, record):
+        line = json.dumps(record) + '\n'
+        with _log_lock, open(self.log_path, 'a') as handle:
+            handle.write(line)
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.8 on 2026-10-17 14:11
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def backfill_approved_count(apps, schema_editor):
+    Course = apps.get_model('core', 'Course')
+    Enrollment = apps.get_model('core', 'Enrollment')
+    approved = (
+        Enrollment.objects.filter(course=models.OuterRef('pk'), status='approved')
+        .order_by()
+        .values('course')
+        .annotate(total=models.Count('pk'))
+        .values('total')
+    )
+    Course.objects.update(approved_count=Coalesce(models.Subquery(approved), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='approved_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_approved_count, migrations.RunPython.noop),
+    ]
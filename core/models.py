@@ -1,12 +1,80 @@
-from django.db import models
+import os
+import uuid
+from collections import Counter
+from datetime import timedelta
+from pathlib import Path
+
+from django.db import models, router, transaction, IntegrityError
+from django.db.models.signals import post_delete
+from django.dispatch import Signal, receiver
 from django.contrib.auth.models import AbstractUser, Group, Permission
 from django.conf import settings
+from django.utils import timezone
 from django.utils.text import slugify
 from django.core.exceptions import ValidationError
+from django.core.files import locks
 from django.contrib.auth.base_user import BaseUserManager
 
+from .db import retry_on_locked
+from .files import StagedFile, file_sha256
+
+
+STUDENT_EMAIL_DOMAIN = "student.ucms.com"
+
+
+def student_name_parts(user):
+    first = (user.first_name or "").strip().lower()
+    last = (user.last_name or "").strip().lower()
+
+    if not first or not last:
+        parts = user.username.lower().split(".")
+        if len(parts) == 2:
+            first, last = parts
+        else:
+            first = user.username.lower()
+            last = "student"
+    return first, last
+
+
+def free_student_email(local, taken):
+    email = f"{local}@{STUDENT_EMAIL_DOMAIN}"
+    counter = 1
+    while email in taken:
+        counter += 1
+        email = f"{local}{counter}@{STUDENT_EMAIL_DOMAIN}"
+    return email
+
+
+def student_initial_password(national_id, last_name):
+    national_id = national_id.strip()
+    return f"{national_id[-4:]}{last_name[:3]}"
 
-class UserManager(BaseUserManager):
+
+# Sent with ``user_ids`` after QuerySet.update() or bulk_update() changed
+# fields that tokens depend on; those paths send no post_save, so
+# core.caching listens to this to drop the cached auth state.
+credentials_changed = Signal()
+
+CREDENTIAL_FIELDS = {"password", "is_active", "role"}
+
+
+class UserQuerySet(models.QuerySet):
+    def update(self, **kwargs):
+        if CREDENTIAL_FIELDS.isdisjoint(kwargs):
+            return super().update(**kwargs)
+        user_ids = list(self.values_list("pk", flat=True))
+        rows = super().update(**kwargs)
+        credentials_changed.send(sender=self.model, user_ids=user_ids)
+        return rows
+
+    def bulk_update(self, objs, fields, batch_size=None):
+        rows = super().bulk_update(objs, fields, batch_size=batch_size)
+        if not CREDENTIAL_FIELDS.isdisjoint(fields):
+            credentials_changed.send(sender=self.model, user_ids=[obj.pk for obj in objs])
+        return rows
+
+
+class UserManager(BaseUserManager.from_queryset(UserQuerySet)):
     def create_user(self, username, password=None, **extra_fields):
         if not username:
             raise ValueError("The given username must be set")
@@ -20,6 +88,37 @@ class UserManager(BaseUserManager):
         extra_fields.setdefault("is_superuser", True)
         return self.create_user(username, password, **extra_fields)
 
+    def create_student(self, username, national_id, password=None, department=None, academic_year="", **extra_fields):
+        """
+        Create a student user and its Student profile in one pass.
+
+        The email and initial password are worked out before the insert, so
+        the password is hashed once and each row is written once.
+        """
+        if not username:
+            raise ValueError("The given username must be set")
+        extra_fields["role"] = "student"
+        user = self.model(username=username, **extra_fields)
+        first, last = student_name_parts(user)
+        user.email = self.unique_student_email(first, last)
+        user.set_password(password or student_initial_password(national_id, last))
+
+        with transaction.atomic(using=self._db):
+            user.save(using=self._db)
+            student = Student(user=user, national_id=national_id, department=department, academic_year=academic_year)
+            student._credentials_provisioned = True
+            student.save(using=self._db)
+        return student
+
+    def unique_student_email(self, first, last):
+        # One prefix query fetches every address the candidates could clash
+        # with; the free suffix is then picked in memory.
+        local = f"{first}.{last}"
+        taken = set(
+            self.filter(email__startswith=local, email__endswith=f"@{STUDENT_EMAIL_DOMAIN}").values_list("email", flat=True)
+        )
+        return free_student_email(local, taken)
+
 class User(AbstractUser):
     ROLE_CHOICES = (
         ("admin", "Admin"),
@@ -63,13 +162,144 @@ class Course(models.Model):
     professors = models.ManyToManyField(Professor, blank=True, related_name='courses')
     capacity = models.PositiveIntegerField(default=30)
     credit_hours = models.PositiveSmallIntegerField(default=3)
+    # Number of approved enrollments, maintained by Enrollment.save() and the
+    # post_delete receiver below so seat checks never need a COUNT query.
+    approved_count = models.PositiveIntegerField(default=0, editable=False)
 
     def __str__(self):
         return f"{self.code} - {self.title}"
 
     def seats_available(self):
-        enrolled = self.enrollments.filter(status='approved').count()
-        return max(0, self.capacity - enrolled)
+        return max(0, self.capacity - self.approved_count)
+
+class EnrollmentQuerySet(models.QuerySet):
+    """
+    Course.approved_count is kept in step by Enrollment.save() and the
+    post_delete receiver. update() and bulk_update() bypass both, so they
+    refuse the fields it depends on; save each enrollment instead.
+    """
+    SEAT_FIELDS = {"status", "course", "course_id"}
+
+    def update(self, **kwargs):
+        self._check_seat_fields(kwargs)
+        return super().update(**kwargs)
+
+    def bulk_update(self, objs, fields, batch_size=None):
+        self._check_seat_fields(fields)
+        return super().bulk_update(objs, fields, batch_size=batch_size)
+
+    def _check_seat_fields(self, fields):
+        if not self.SEAT_FIELDS.isdisjoint(fields):
+            raise ValueError("Enrollment status and course must be changed through save() to keep approved_count in step.")
+
+
+class EnrollmentManager(models.Manager.from_queryset(EnrollmentQuerySet)):
+    @retry_on_locked
+    def enroll(self, student, course, status='approved'):
+        enrollment = self.model(student=student, course=course, status=status)
+        try:
+            enrollment.save(force_insert=True)
+        except IntegrityError:
+            raise ValidationError('Already enrolled.')
+        return enrollment
+
+    def bulk_enroll(self, rows, batch_size=1000):
+        """
+        Enroll many (student, course) pairs at once.
+
+        ``rows`` is an iterable of mappings with ``student``, ``course`` and an
+        optional ``status`` key. Lookups, duplicate and capacity checks are
+        done with a handful of set-based queries, seats are reserved with one
+        CASE UPDATE per batch of courses, and the inserts go through
+        bulk_create, so the cost does not grow with one query per row.
+        Returns one result dict per input row, in order.
+        """
+        results = []
+        candidates = []
+        for row_number, row in enumerate(rows, start=1):
+            row = row if isinstance(row, dict) else {}
+            result = {"row": row_number, "student": row.get("student"), "course": row.get("course"), "status": "error"}
+            results.append(result)
+            try:
+                student_id = int(row.get("student"))
+                course_id = int(row.get("course"))
+            except (TypeError, ValueError):
+                result["errors"] = ["student and course must be integer ids."]
+                continue
+            status = row.get("status") or "approved"
+            if status not in ("approved", "pending"):
+                result["errors"] = [f"Invalid status '{status}'."]
+                continue
+            result.update(student=student_id, course=course_id)
+            candidates.append((result, student_id, course_id, status))
+
+        student_ids = {student_id for _, student_id, _, _ in candidates}
+        course_ids = {course_id for _, _, course_id, _ in candidates}
+        known_students = set()
+        existing = set()
+        with transaction.atomic(using=self.db):
+            # Locked up front: the seat counts read here are what gets reserved.
+            seats = {}
+            for chunk in _chunked(course_ids, batch_size):
+                courses = Course.objects.using(self.db).select_for_update().filter(pk__in=chunk)
+                seats.update((course.pk, course.seats_available()) for course in courses.only("capacity", "approved_count"))
+            for chunk in _chunked(student_ids, batch_size):
+                known_students.update(Student.objects.using(self.db).filter(pk__in=chunk).values_list("pk", flat=True))
+                existing.update(
+                    self.filter(student_id__in=chunk, course_id__in=list(seats)).values_list("student_id", "course_id")
+                )
+
+            accepted = []
+            for candidate in candidates:
+                result, student_id, course_id, status = candidate
+                if student_id not in known_students:
+                    result["errors"] = ["Student not found."]
+                elif course_id not in seats:
+                    result["errors"] = ["Course not found."]
+                elif (student_id, course_id) in existing:
+                    result["errors"] = ["Already enrolled."]
+                else:
+                    existing.add((student_id, course_id))
+                    accepted.append(candidate)
+
+            demand = Counter(course_id for _, _, course_id, status in accepted if status == "approved")
+            granted = {course_id: min(wanted, seats[course_id]) for course_id, wanted in demand.items()}
+            self._reserve_seats(granted, batch_size)
+
+            created = []
+            for result, student_id, course_id, status in accepted:
+                if status == "approved":
+                    if not granted[course_id]:
+                        result["errors"] = ["Course capacity reached"]
+                        continue
+                    granted[course_id] -= 1
+                created.append((result, self.model(student_id=student_id, course_id=course_id, status=status)))
+
+            self.bulk_create([enrollment for _, enrollment in created], batch_size=batch_size)
+
+        # bulk_create sends no post_save, so drop cached course access here.
+        from .caching import bump_content_version, invalidate_student_access
+        bump_content_version('catalog', 'announcements')
+        invalidate_student_access({enrollment.student_id for _, enrollment in created})
+
+        for result, enrollment in created:
+            result["status"] = "created"
+            result["id"] = enrollment.pk
+        return results
+
+    def _reserve_seats(self, granted, batch_size):
+        # Raise every course's approved_count by its granted seats with one
+        # CASE UPDATE per batch, so the query count does not grow with the
+        # number of courses. The caller holds the course rows locked.
+        reserved = [course_id for course_id, count in granted.items() if count]
+        for chunk in _chunked(reserved, batch_size):
+            seats = models.Case(*(models.When(pk=course_id, then=granted[course_id]) for course_id in chunk))
+            Course.objects.using(self.db).filter(pk__in=chunk).update(approved_count=models.F("approved_count") + seats)
+
+def _chunked(items, size):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
 
 class Enrollment(models.Model):
     STATUS_CHOICES = (
@@ -77,41 +307,264 @@ class Enrollment(models.Model):
         ("approved", "Approved"),
         ("rejected", "Rejected"),
     )
-    student = models.ForeignKey(Student, related_name='enrollments', on_delete=models.CASCADE)
-    course = models.ForeignKey(Course, related_name='enrollments', on_delete=models.CASCADE)
+    student = models.ForeignKey(Student, related_name='enrollments', on_delete=models.CASCADE, db_index=False)
+    course = models.ForeignKey(Course, related_name='enrollments', on_delete=models.CASCADE, db_index=False)
     created_at = models.DateTimeField(auto_now_add=True)
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='approved')
 
+    objects = EnrollmentManager()
+
+    # Course whose approved_count currently includes this row, as stored in
+    # the database; None for unsaved or non-approved enrollments.
+    _seat_course_id = None
+
     class Meta:
+        # The FK columns are not indexed on their own: unique_together leads
+        # with student and the composite indexes below lead with course.
         unique_together = (('student', 'course'),)
+        indexes = [
+            models.Index(fields=['course', 'status'], name='enroll_course_status_idx'),
+            models.Index(fields=['student', 'status'], name='enroll_student_status_idx'),
+            # Course rosters only ever list approved rows, newest first.
+            models.Index(
+                fields=['course', '-created_at', '-id'],
+                condition=models.Q(status='approved'),
+                name='enroll_approved_course_idx',
+            ),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if instance.__dict__.get('status') == 'approved':
+            instance._seat_course_id = instance.__dict__.get('course_id')
+        return instance
 
     def clean(self):
-        if self.status == 'approved' and self.course.seats_available() <= 0:
+        if self._holds_seat() and self._seat_course_id != self.course_id and self.course.seats_available() <= 0:
             raise ValidationError('Course capacity reached')
 
     def save(self, *args, **kwargs):
-        self.clean()
-        return super().save(*args, **kwargs)
+        using = kwargs.get('using') or router.db_for_write(type(self), instance=self)
+        with transaction.atomic(using=using):
+            self._reserve_seat(using)
+            result = super().save(*args, **kwargs)
+        self._seat_course_id = self.course_id if self._holds_seat() else None
+        return result
+
+    def _holds_seat(self):
+        return self.status == 'approved'
+
+    def _reserve_seat(self, using):
+        old = self._seat_course_id
+        new = self.course_id if self._holds_seat() else None
+        if old == new:
+            return
+
+        courses = Course.objects.using(using)
+        if old is not None:
+            courses.filter(pk=old).update(approved_count=models.F('approved_count') - 1)
+        if new is not None:
+            # Conditional increment: the row update is atomic, so concurrent
+            # enrollments can never push a course past its capacity.
+            reserved = courses.filter(pk=new, approved_count__lt=models.F('capacity')).update(
+                approved_count=models.F('approved_count') + 1
+            )
+            if not reserved:
+                raise ValidationError('Course capacity reached')
+            if Enrollment.course.is_cached(self):
+                self.course.approved_count += 1
 
     def __str__(self):
         return f"{self.student} -> {self.course} ({self.status})"
 
+@receiver(post_delete, sender=Enrollment)
+def release_enrollment_seat(sender, instance, using, **kwargs):
+    if instance._seat_course_id is not None:
+        Course.objects.using(using).filter(pk=instance._seat_course_id).update(
+            approved_count=models.F('approved_count') - 1
+        )
+
 class Material(models.Model):
-    course = models.ForeignKey(Course, related_name='materials', on_delete=models.CASCADE)
+    course = models.ForeignKey(Course, related_name='materials', on_delete=models.CASCADE, db_index=False)
     uploaded_by = models.ForeignKey(Professor, on_delete=models.SET_NULL, null=True)
     title = models.CharField(max_length=255)
     file = models.FileField(upload_to='materials/')
+    checksum = models.CharField(max_length=64, blank=True, db_index=True, editable=False)
+    size = models.PositiveBigIntegerField(null=True, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['course', '-created_at', '-id'], name='material_course_created_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        if self.file and not self.file._committed:
+            self._store_file()
+        # Only the row insert is retried; the file is already in storage.
+        return retry_on_locked(super().save)(*args, **kwargs)
+
+    def _store_file(self):
+        # Files are stored under their content hash, so the same lecture
+        # uploaded to several courses is kept on disk once.
+        content = self.file.file
+        self.size = content.size
+        checksum = file_sha256(content)
+        existing = (
+            Material.objects.filter(checksum=checksum).exclude(file='').values_list('file', flat=True).first()
+        )
+        if existing and self.file.storage.exists(existing):
+            self.file.name = existing
+            self.file._committed = True
+        else:
+            extension = os.path.splitext(self.file.name)[1].lower()
+            self.file.save(f"{checksum[:2]}/{checksum}{extension}", content, save=False)
+        self.checksum = checksum
+
+    def download_name(self):
+        return f"{self.title}{os.path.splitext(self.file.name)[1]}"
+
     def __str__(self):
         return f"{self.title} ({self.course.code})"
 
+class MaterialUploadManager(models.Manager):
+    def expiry_cutoff(self):
+        return timezone.now() - timedelta(hours=getattr(settings, 'UCMS_UPLOAD_EXPIRY_HOURS', 24))
+
+    def active(self):
+        """Uploads started within UCMS_UPLOAD_EXPIRY_HOURS; older ones can no longer be resumed."""
+        return self.filter(created_at__gte=self.expiry_cutoff())
+
+    def purge_expired(self):
+        """
+        Delete expired uploads with their staging files, plus staging files
+        left without an upload row. Returns the number of files removed.
+        """
+        cutoff = self.expiry_cutoff()
+        removed = 0
+        for upload in self.filter(created_at__lt=cutoff):
+            removed += upload.discard()
+        root = staging_root()
+        if root.is_dir():
+            live = {str(pk) for pk in self.values_list('pk', flat=True)}
+            for path in root.iterdir():
+                if path.name not in live and path.stat().st_mtime < cutoff.timestamp():
+                    path.unlink(missing_ok=True)
+                    removed += 1
+        return removed
+
+
+def staging_root():
+    # Outside MEDIA_ROOT, so partial uploads are never served as media.
+    return Path(getattr(settings, 'UCMS_UPLOAD_STAGING_DIR', None) or Path(settings.BASE_DIR) / 'upload_staging')
+
+
+class MaterialUpload(models.Model):
+    """
+    A resumable material upload in progress. Chunks are appended to a
+    staging file until ``received`` reaches ``size``; finalize() then turns
+    it into a Material. Uploads not finished within
+    UCMS_UPLOAD_EXPIRY_HOURS are removed by ``manage.py purge_uploads``.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    course = models.ForeignKey(Course, on_delete=models.CASCADE)
+    uploaded_by = models.ForeignKey(Professor, on_delete=models.CASCADE)
+    title = models.CharField(max_length=255)
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    received = models.PositiveBigIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = MaterialUploadManager()
+
+    def __str__(self):
+        return f"{self.filename} ({self.received}/{self.size})"
+
+    @property
+    def staging_path(self):
+        return staging_root() / str(self.pk)
+
+    def append(self, offset, stream, chunk_size=64 * 1024):
+        """
+        Write ``stream`` to the staging file starting at ``offset`` (which
+        must equal ``received``), reading ``chunk_size`` bytes at a time.
+        Bytes left past ``received`` by an interrupted request are discarded.
+
+        A request may carry at most UCMS_UPLOAD_MAX_CHUNK bytes. Writers are
+        serialized by an exclusive lock on the staging file, not by a
+        database transaction, so a slow client never holds the database
+        (on SQLite, its write lock) while its bytes arrive; a second request
+        for the same upload gets a 409 at once. The new offset is committed
+        with a conditional UPDATE at the end.
+        """
+        max_bytes = getattr(settings, 'UCMS_UPLOAD_MAX_CHUNK', 8 * 1024 * 1024)
+        path = self.staging_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'ab') as handle:
+            if not locks.lock(handle, locks.LOCK_EX | locks.LOCK_NB):
+                raise ValidationError('Another request is writing to this upload.')
+            try:
+                self.received = MaterialUpload.objects.values_list('received', flat=True).get(pk=self.pk)
+                if offset != self.received:
+                    raise ValidationError(f'Expected offset {self.received}.')
+                if handle.tell() < offset:
+                    raise ValidationError('Staged data is missing; start a new upload.')
+                handle.truncate(offset)
+
+                end = offset
+                while True:
+                    chunk = stream.read(chunk_size)
+                    if not chunk:
+                        break
+                    end += len(chunk)
+                    if end > self.size:
+                        raise ValidationError('Upload is larger than the declared size.')
+                    if end - offset > max_bytes:
+                        raise ValidationError(f'Chunks are limited to {max_bytes} bytes.')
+                    handle.write(chunk)
+                handle.flush()
+
+                if not MaterialUpload.objects.filter(pk=self.pk, received=offset).update(received=end):
+                    raise ValidationError('Upload was changed or removed meanwhile.')
+                self.received = end
+            finally:
+                locks.unlock(handle)
+
+    def discard(self):
+        """Delete the upload and its staging file; returns 1 if a file was removed."""
+        path = self.staging_path
+        existed = path.exists()
+        path.unlink(missing_ok=True)
+        self.delete()
+        return int(existed)
+
+    def finalize(self):
+        if self.received != self.size:
+            raise ValidationError(f'Upload incomplete: {self.received} of {self.size} bytes received.')
+
+        path = self.staging_path
+        with StagedFile(open(path, 'rb'), name=self.filename) as staged:
+            with transaction.atomic():
+                material = Material.objects.create(
+                    course=self.course, uploaded_by=self.uploaded_by, title=self.title, file=staged,
+                )
+                self.delete()
+        # Gone already if storage moved it into place; left over if de-duplicated.
+        path.unlink(missing_ok=True)
+        return material
+
 class Announcement(models.Model):
-    course = models.ForeignKey(Course, related_name='announcements', on_delete=models.CASCADE)
+    course = models.ForeignKey(Course, related_name='announcements', on_delete=models.CASCADE, db_index=False)
     posted_by = models.ForeignKey(Professor, on_delete=models.SET_NULL, null=True)
     title = models.CharField(max_length=255)
     body = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['course', '-created_at', '-id'], name='announce_course_created_idx'),
+        ]
+
     def __str__(self):
         return f"Announcement: {self.title} - {self.course.code}"
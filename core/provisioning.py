@@ -0,0 +1,206 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+
+from .models import (
+    User,
+    Department,
+    Professor,
+    Student,
+    STUDENT_EMAIL_DOMAIN,
+    free_student_email,
+    student_initial_password,
+    student_name_parts,
+)
+
+ROLES = {role for role, _ in User.ROLE_CHOICES}
+
+
+class UserImporter:
+    """
+    Stream user rows (mappings such as csv.DictReader yields) into User,
+    Student and Professor.
+
+    Recognised columns: username, role, first_name, last_name, email,
+    password, national_id, department (code), academic_year, office.
+
+    Rows are handled in chunks. Usernames that already exist are skipped, so
+    re-running an interrupted import picks up where it stopped; passwords are
+    hashed in a process pool; each chunk is written with bulk_create in one
+    transaction, which also means no post_save receivers run. Emails are
+    assigned the same way UserManager.create_student() does, against a set of
+    taken addresses loaded once up front. As with the signals, an ``email``
+    given in the row is kept, and generated addresses avoid it.
+    """
+
+    def __init__(self, chunk_size=1000, workers=None, progress=None):
+        self.chunk_size = chunk_size
+        # workers=None uses one process per CPU, workers=0 hashes in-process.
+        self.workers = workers
+        self.progress = progress
+        self.processed = 0
+        self.created = 0
+        self.skipped = 0
+        self.errors = []
+        self.started = None
+
+    def run(self, rows, start_row=0):
+        self.started = time.perf_counter()
+        self.processed = start_row
+        self.departments = dict(Department.objects.values_list("code", "pk"))
+        self.taken_emails = set(
+            User.objects.filter(email__endswith=f"@{STUDENT_EMAIL_DOMAIN}").values_list("email", flat=True)
+        )
+
+        executor = None
+        if self.workers != 0:
+            executor = ProcessPoolExecutor(self.workers, initializer=django.setup)
+        try:
+            chunk = []
+            for row_number, row in enumerate(rows, start=1):
+                if row_number <= start_row:
+                    continue
+                chunk.append((row_number, row))
+                if len(chunk) >= self.chunk_size:
+                    self._import_chunk(chunk, executor)
+                    chunk = []
+            if chunk:
+                self._import_chunk(chunk, executor)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+        return self.summary()
+
+    def summary(self):
+        elapsed = time.perf_counter() - self.started if self.started else 0.0
+        return {
+            "processed": self.processed,
+            "created": self.created,
+            "skipped": self.skipped,
+            "failed": len(self.errors),
+            "elapsed": round(elapsed, 3),
+            "users_per_second": round(self.created / elapsed, 1) if elapsed else 0.0,
+            "errors": self.errors,
+        }
+
+    def _import_chunk(self, chunk, executor):
+        usernames = [_clean(row, "username") for _, row in chunk]
+        national_ids = [_clean(row, "national_id") for _, row in chunk]
+        existing = set(User.objects.filter(username__in=usernames).values_list("username", flat=True))
+        taken_national_ids = set(
+            Student.objects.filter(national_id__in=[nid for nid in national_ids if nid]).values_list("national_id", flat=True)
+        )
+
+        pending = []
+        for row_number, row in chunk:
+            username = _clean(row, "username")
+            role = _clean(row, "role").lower() or "student"
+            national_id = _clean(row, "national_id")
+            department = _clean(row, "department")
+            email = _clean(row, "email")
+
+            if username and username in existing:
+                self.skipped += 1
+                continue
+            if not username:
+                error = "username is required."
+            elif role not in ROLES:
+                error = f"Invalid role '{role}'."
+            elif role == "student" and not national_id:
+                error = "national_id is required for students."
+            elif role == "student" and national_id in taken_national_ids:
+                error = "national_id already exists."
+            elif department and department not in self.departments:
+                error = f"Unknown department '{department}'."
+            else:
+                error = None
+
+            if error:
+                self.errors.append({"row": row_number, "username": username, "errors": [error]})
+                continue
+
+            existing.add(username)
+            if role == "student":
+                taken_national_ids.add(national_id)
+            if email:
+                self.taken_emails.add(email)
+            user = User(
+                username=username,
+                role=role,
+                first_name=_clean(row, "first_name"),
+                last_name=_clean(row, "last_name"),
+                email=email,
+            )
+            pending.append((row, user, self._raw_password(row, user)))
+
+        to_hash = [password for _, _, password in pending if password]
+        if executor is not None:
+            hashed = executor.map(make_password, to_hash, chunksize=max(1, len(to_hash) // 32))
+        else:
+            hashed = map(make_password, to_hash)
+        hashed = iter(hashed)
+
+        for row, user, password in pending:
+            # make_password(None) is an unusable password and costs no hashing.
+            user.password = next(hashed) if password else make_password(None)
+            if not user.email:
+                user.email = self._default_email(user)
+
+        with transaction.atomic():
+            users = [user for _, user, _ in pending]
+            User.objects.bulk_create(users, batch_size=self.chunk_size)
+            if any(user.pk is None for user in users):
+                ids = dict(User.objects.filter(username__in=[u.username for u in users]).values_list("username", "pk"))
+                for user in users:
+                    user.pk = ids[user.username]
+
+            students = []
+            professors = []
+            for row, user, _ in pending:
+                department_id = self.departments.get(_clean(row, "department"))
+                if user.role == "student":
+                    students.append(Student(
+                        user=user,
+                        national_id=_clean(row, "national_id"),
+                        department_id=department_id,
+                        academic_year=_clean(row, "academic_year"),
+                    ))
+                elif user.role == "professor":
+                    professors.append(Professor(user=user, department_id=department_id, office=_clean(row, "office")))
+            Student.objects.bulk_create(students, batch_size=self.chunk_size)
+            Professor.objects.bulk_create(professors, batch_size=self.chunk_size)
+
+            # Professor addresses embed the profile id, known only now.
+            unaddressed = [professor.user for professor in professors if not professor.user.email]
+            for user in unaddressed:
+                user.email = f"p-{user.professor.pk}@ucms.edu"
+            User.objects.bulk_update(unaddressed, ["email"], batch_size=self.chunk_size)
+
+        self.created += len(pending)
+        self.processed = chunk[-1][0]
+        if self.progress is not None:
+            self.progress(self.summary())
+
+    def _raw_password(self, row, user):
+        password = _clean(row, "password")
+        if password or user.role != "student":
+            return password or None
+        _, last = student_name_parts(user)
+        return student_initial_password(_clean(row, "national_id"), last)
+
+    def _default_email(self, user):
+        if user.role == "student":
+            first, last = student_name_parts(user)
+            email = free_student_email(f"{first}.{last}", self.taken_emails)
+            self.taken_emails.add(email)
+            return email
+        if user.role == "professor":
+            return ""
+        return f"{user.username}@ucms.edu"
+
+
+def _clean(row, column):
+    return (row.get(column) or "").strip()
@@ -0,0 +1,104 @@
+import asyncio
+import json
+from collections import defaultdict
+from functools import lru_cache
+from threading import Lock
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+QUEUE_SIZE = getattr(settings, 'UCMS_REALTIME_QUEUE_SIZE', 100)
+
+
+class Subscription:
+    """
+    One connection's view of the broker: a bounded queue on the event loop
+    that opened it. Events published while the queue is full are dropped
+    for this subscriber only; clients catch up with Last-Event-ID.
+    """
+
+    def __init__(self, broker, course_ids):
+        self.broker = broker
+        self.course_ids = set(course_ids)
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(QUEUE_SIZE)
+
+    def deliver(self, event):
+        self.loop.call_soon_threadsafe(self._put, event)
+
+    def _put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            pass
+
+    async def get(self, timeout=None):
+        """Next event, or None after ``timeout`` seconds without one."""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class InProcessBroker:
+    """
+    Fan-out of course events to the subscriptions of this process. Holding a
+    connection costs one queue and one coroutine, not a thread.
+
+    ``publish`` may be called from any thread (sync views run in the ASGI
+    thread pool). Deployments with several processes or hosts replace this
+    class through UCMS_REALTIME_BROKER with one that relays ``publish``
+    over a shared channel (e.g. Redis pub/sub) and delivers locally through
+    ``deliver``.
+    """
+
+    def __init__(self):
+        self.lock = Lock()
+        self.subscribers = defaultdict(set)
+
+    def subscribe(self, course_ids):
+        subscription = Subscription(self, course_ids)
+        with self.lock:
+            for course_id in subscription.course_ids:
+                self.subscribers[course_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            for course_id in subscription.course_ids:
+                subscribers = self.subscribers.get(course_id)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self.subscribers[course_id]
+
+    def publish(self, course_id, event):
+        self.deliver(course_id, event)
+
+    def deliver(self, course_id, event):
+        with self.lock:
+            subscribers = list(self.subscribers.get(course_id, ()))
+        for subscription in subscribers:
+            subscription.deliver(event)
+
+    def connection_count(self):
+        with self.lock:
+            return len(set().union(*self.subscribers.values()))
+
+
+@lru_cache(maxsize=None)
+def get_broker():
+    return import_string(getattr(settings, 'UCMS_REALTIME_BROKER', 'core.realtime.InProcessBroker'))()
+
+
+def publish_announcement(data):
+    """Push a serialized announcement to the subscribers of its course."""
+    get_broker().publish(data['course'], {'event': 'announcement', 'id': data['id'], 'data': data})
+
+
+def format_event(event):
+    return f"id: {event['id']}\nevent: {event['event']}\ndata: {json.dumps(event['data'], default=str)}\n\n"
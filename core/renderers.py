@@ -0,0 +1,39 @@
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+
+class PassthroughRenderer(BaseRenderer):
+    """
+    Accept any media type for actions that build their own HttpResponse
+    (file downloads), so content negotiation never answers 406. Anything
+    that still reaches the renderer (errors) is written as JSON.
+    """
+    media_type = '*/*'
+    format = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, bytes):
+            return data
+        response = (renderer_context or {}).get('response')
+        if response is not None:
+            response['Content-Type'] = 'application/json'
+        return JSONRenderer().render(data)
+
+
+class StreamFormatRenderer(BaseRenderer):
+    """
+    Negotiates ``?format=`` for views that stream the body themselves.
+    Anything that still reaches the renderer (errors) is written as JSON.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return JSONRenderer().render(data)
+
+
+class CSVRenderer(StreamFormatRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+
+class JSONLinesRenderer(StreamFormatRenderer):
+    media_type = 'application/jsonl'
+    format = 'jsonl'
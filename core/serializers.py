@@ -1,22 +1,71 @@
+from django.utils import timezone
 from rest_framework import serializers
+from rest_framework.utils.serializer_helpers import ReturnList
 from django.contrib.auth import get_user_model
-from .models import Department, Professor, Student, Course, Enrollment, Material, Announcement
+from django.core.exceptions import ValidationError as DjangoValidationError
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from .authentication import auth_version
+from .caching import cached_auth_state
+from .middleware import measure
+from .models import Department, Professor, Student, Course, Enrollment, Material, MaterialUpload, Announcement
 
 User = get_user_model()
 
+
+def requested_fields(request):
+    """Return the set of names passed in ``?fields=``, or None if absent."""
+    if request is None or request.method not in ('GET', 'HEAD'):
+        return None
+    raw = request.query_params.get('fields')
+    if not raw:
+        return None
+    return {name.strip() for name in raw.split(',') if name.strip()}
+
+
+class SparseFieldsMixin:
+    """
+    Trim the output of the top-level serializer to the fields named in
+    ``?fields=id,title``. Nested serializers are left alone; dropping the
+    nested field itself (e.g. ``student``) skips its payload entirely.
+    Top-level output is timed as the request's ``serialize`` metric.
+    """
+    def to_representation(self, instance):
+        if not self._is_top_level():
+            return super().to_representation(instance)
+        with measure('serialize'):
+            return super().to_representation(instance)
+
+    def _is_top_level(self):
+        parent = getattr(self, 'parent', None)
+        if isinstance(parent, serializers.ListSerializer):
+            parent = getattr(parent, 'parent', None)
+        return parent is None
+
+    def get_fields(self):
+        fields = super().get_fields()
+        if not self._is_top_level():
+            return fields
+
+        wanted = requested_fields(self.context.get('request'))
+        if wanted is None:
+            return fields
+        return {name: field for name, field in fields.items() if name in wanted}
+
 class ReadOnlyUserSmallSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ("id", "username", "first_name", "last_name", "email")
         read_only_fields = fields
 
-class DepartmentSerializer(serializers.ModelSerializer):
+class DepartmentSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Department
         fields = ["id", "name", "code"]
         read_only_fields = ["id"]
 
-class ProfessorCreateUpdateSerializer(serializers.ModelSerializer):
+class ProfessorCreateUpdateSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     user_id = serializers.PrimaryKeyRelatedField(queryset=User.objects.filter(role='professor'), write_only=True)
     user = ReadOnlyUserSmallSerializer(read_only=True)
 
@@ -36,7 +85,7 @@ class ProfessorCreateUpdateSerializer(serializers.ModelSerializer):
 class ProfessorSerializer(ProfessorCreateUpdateSerializer):
     pass
 
-class StudentCreateUpdateSerializer(serializers.ModelSerializer):
+class StudentCreateUpdateSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     user_id = serializers.PrimaryKeyRelatedField(queryset=User.objects.filter(role='student'), write_only=True)
     user = ReadOnlyUserSmallSerializer(read_only=True)
 
@@ -56,11 +105,11 @@ class StudentCreateUpdateSerializer(serializers.ModelSerializer):
 class StudentSerializer(StudentCreateUpdateSerializer):
     pass
 
-class CourseListSerializer(serializers.ModelSerializer):
+class CourseListSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     department = DepartmentSerializer(read_only=True)
     professor_ids = serializers.PrimaryKeyRelatedField(write_only=True, many=True, queryset=Professor.objects.all(), source='professors')
     professors = serializers.SerializerMethodField(read_only=True)
-    seats_available = serializers.IntegerField(source='seats_available', read_only=True)
+    seats_available = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = Course
@@ -86,10 +135,10 @@ class CourseListSerializer(serializers.ModelSerializer):
 class CourseDetailSerializer(CourseListSerializer):
     pass
 
-class EnrollmentSerializer(serializers.ModelSerializer):
+class EnrollmentSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     student = StudentSerializer(read_only=True)
     course = CourseListSerializer(read_only=True)
-    course_id = serializers.PrimaryKeyRelatedField(write_only=True, queryset=Course.objects.all(), source='course')
+    course_id = serializers.PrimaryKeyRelatedField(write_only=True, queryset=Course.objects.select_related('department'), source='course')
 
     class Meta:
         model = Enrollment
@@ -101,28 +150,25 @@ class EnrollmentSerializer(serializers.ModelSerializer):
         if request.user.role != 'student':
             raise serializers.ValidationError("Only students can enroll.")
 
-        student = request.user.student
-        course = attrs.get('course')
-
-        if Enrollment.objects.filter(student=student, course=course).exists():
-            raise serializers.ValidationError("Already enrolled.")
-
-        if course.seats_available() <= 0:
-            raise serializers.ValidationError("Course capacity reached.")
-
+        # Duplicate and capacity checks happen atomically in
+        # Enrollment.objects.enroll(), not here, so they cannot race.
         return attrs
 
     def create(self, validated_data):
-        student = self.context['request'].user.student
-        return Enrollment.objects.create(student=student, **validated_data)
+        student = validated_data.get('student') or self.context['request'].user.student
+        try:
+            return Enrollment.objects.enroll(student, validated_data['course'])
+        except DjangoValidationError as exc:
+            raise serializers.ValidationError(exc.messages)
 
-class MaterialSerializer(serializers.ModelSerializer):
-    uploaded_by = ProfessorSerializer(read_only=True)
+    def update(self, instance, validated_data):
+        try:
+            return super().update(instance, validated_data)
+        except DjangoValidationError as exc:
+            raise serializers.ValidationError(exc.messages)
 
-    class Meta:
-        model = Material
-        fields = ["id", "course", "uploaded_by", "title", "file", "created_at"]
-        read_only_fields = ["id", "uploaded_by", "created_at"]
+class CourseUploadMixin:
+    """Uploads (direct or resumable) are for professors, into their own courses."""
 
     def validate(self, attrs):
         request = self.context['request']
@@ -136,11 +182,26 @@ class MaterialSerializer(serializers.ModelSerializer):
 
         return attrs
 
+
+class MaterialSerializer(CourseUploadMixin, SparseFieldsMixin, serializers.ModelSerializer):
+    uploaded_by = ProfessorSerializer(read_only=True)
+
+    class Meta:
+        model = Material
+        fields = ["id", "course", "uploaded_by", "title", "file", "checksum", "size", "created_at"]
+        read_only_fields = ["id", "uploaded_by", "checksum", "size", "created_at"]
+
     def create(self, validated_data):
-        prof = self.context['request'].user.professor
-        return Material.objects.create(uploaded_by=prof, **validated_data)
+        validated_data.setdefault('uploaded_by', self.context['request'].user.professor)
+        return Material.objects.create(**validated_data)
 
-class AnnouncementSerializer(serializers.ModelSerializer):
+class MaterialUploadSerializer(CourseUploadMixin, serializers.ModelSerializer):
+    class Meta:
+        model = MaterialUpload
+        fields = ["id", "course", "title", "filename", "size", "received", "created_at"]
+        read_only_fields = ["id", "received", "created_at"]
+
+class AnnouncementSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     posted_by = ProfessorSerializer(read_only=True)
 
     class Meta:
@@ -165,3 +226,167 @@ class AnnouncementSerializer(serializers.ModelSerializer):
         if self.context['request'].user.role == 'professor':
             validated_data['posted_by'] = self.context['request'].user.professor
         return Announcement.objects.create(**validated_data)
+
+
+class RoleTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """Embed the user's role and profile ids in the issued tokens."""
+
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        student_id, professor_id = User.objects.filter(pk=user.pk).values_list('student__id', 'professor__id').get()
+        token['role'] = user.role
+        token['student_id'] = student_id
+        token['professor_id'] = professor_id
+        token['ver'] = auth_version(user.password, user.role)
+        return token
+
+
+class CachedTokenRefreshSerializer(TokenRefreshSerializer):
+    """
+    Refresh (and rotate, if enabled) without loading the user row: the
+    active flag and credential version come from cached_auth_state, which
+    is dropped whenever the user is saved. A refresh token minted before
+    a password or role change no longer matches ``ver`` and is refused.
+    """
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+        user_id = refresh.payload.get(jwt_settings.USER_ID_CLAIM)
+        if user_id is None:
+            return super().validate(attrs)
+
+        is_active, version = cached_auth_state(user_id, auth_version)
+        if version is None or not is_active or refresh.payload.get('ver', version) != version:
+            raise AuthenticationFailed(self.error_messages['no_active_account'], 'no_active_account')
+
+        data = {'access': str(refresh.access_token)}
+        if jwt_settings.ROTATE_REFRESH_TOKENS:
+            if jwt_settings.BLACKLIST_AFTER_ROTATION and hasattr(refresh, 'blacklist'):
+                refresh.blacklist()
+            refresh.set_jti()
+            refresh.set_exp()
+            refresh.set_iat()
+            refresh.outstand()
+            data['refresh'] = str(refresh)
+        return data
+
+
+# Read-only fast path for the hot list endpoints. Each table maps an output
+# field to a plain function of (obj, request), in the same order and shape as
+# the ModelSerializer above it, so a page is a couple of dict comprehensions
+# instead of a tree of Field objects built and walked per row. The querysets
+# must already have the related rows loaded.
+
+def _datetime(value):
+    value = timezone.localtime(value).isoformat()
+    if value.endswith('+00:00'):
+        value = value[:-6] + 'Z'
+    return value
+
+
+def _file_url(field_file, request):
+    if not field_file:
+        return None
+    url = field_file.url
+    return request.build_absolute_uri(url) if request is not None else url
+
+
+USER_SMALL_ROW = {
+    "id": lambda u, r: u.pk,
+    "username": lambda u, r: u.username,
+    "first_name": lambda u, r: u.first_name,
+    "last_name": lambda u, r: u.last_name,
+    "email": lambda u, r: u.email,
+}
+
+DEPARTMENT_ROW = {
+    "id": lambda d, r: d.pk,
+    "name": lambda d, r: d.name,
+    "code": lambda d, r: d.code,
+}
+
+PROFESSOR_ROW = {
+    "id": lambda p, r: p.pk,
+    "user": lambda p, r: to_row(USER_SMALL_ROW, p.user, r),
+    "department": lambda p, r: p.department_id,
+    "office": lambda p, r: p.office,
+}
+
+STUDENT_ROW = {
+    "id": lambda s, r: s.pk,
+    "user": lambda s, r: to_row(USER_SMALL_ROW, s.user, r),
+    "national_id": lambda s, r: s.national_id,
+    "department": lambda s, r: s.department_id,
+    "academic_year": lambda s, r: s.academic_year,
+}
+
+COURSE_ROW = {
+    "id": lambda c, r: c.pk,
+    "code": lambda c, r: c.code,
+    "title": lambda c, r: c.title,
+    "department": lambda c, r: to_row(DEPARTMENT_ROW, c.department, r) if c.department_id else None,
+    "professors": lambda c, r: [
+        {"id": p.id, "name": p.user.get_full_name() or p.user.username} for p in c.professors.all()
+    ],
+    "capacity": lambda c, r: c.capacity,
+    "credit_hours": lambda c, r: c.credit_hours,
+    "seats_available": lambda c, r: c.seats_available(),
+}
+
+ENROLLMENT_ROW = {
+    "id": lambda e, r: e.pk,
+    "student": lambda e, r: to_row(STUDENT_ROW, e.student, r),
+    "course": lambda e, r: to_row(COURSE_ROW, e.course, r),
+    "status": lambda e, r: e.status,
+    "created_at": lambda e, r: _datetime(e.created_at),
+}
+
+MATERIAL_ROW = {
+    "id": lambda m, r: m.pk,
+    "course": lambda m, r: m.course_id,
+    "uploaded_by": lambda m, r: to_row(PROFESSOR_ROW, m.uploaded_by, r) if m.uploaded_by_id else None,
+    "title": lambda m, r: m.title,
+    "file": lambda m, r: _file_url(m.file, r),
+    "checksum": lambda m, r: m.checksum,
+    "size": lambda m, r: m.size,
+    "created_at": lambda m, r: _datetime(m.created_at),
+}
+
+ANNOUNCEMENT_ROW = {
+    "id": lambda a, r: a.pk,
+    "course": lambda a, r: a.course_id,
+    "posted_by": lambda a, r: to_row(PROFESSOR_ROW, a.posted_by, r) if a.posted_by_id else None,
+    "title": lambda a, r: a.title,
+    "body": lambda a, r: a.body,
+    "created_at": lambda a, r: _datetime(a.created_at),
+}
+
+
+def to_row(table, obj, request):
+    return {name: get(obj, request) for name, get in table.items()}
+
+
+class RowListSerializer:
+    """
+    Stand-in for ``Serializer(page, many=True)`` built from a row table.
+    Honours ``?fields=`` like SparseFieldsMixin, so fields left out are
+    never computed.
+    """
+
+    def __init__(self, instance, table, context=None):
+        self.instance = instance
+        self.context = context or {}
+        request = self.context.get('request')
+        wanted = requested_fields(request)
+        if wanted is not None:
+            table = {name: get for name, get in table.items() if name in wanted}
+        self.table = table
+        self.request = request
+
+    @property
+    def data(self):
+        table, request = self.table, self.request
+        with measure('serialize'):
+            rows = [{name: get(obj, request) for name, get in table.items()} for obj in self.instance]
+        return ReturnList(rows, serializer=self)
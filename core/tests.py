@@ -1,2 +1,2089 @@
-from django.test import TestCase
+import asyncio
+import base64
+import csv
+import hashlib
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from pathlib import Path
+from unittest import mock, skipUnless
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.exceptions import ValidationError
+from django.core.files import locks
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import AsyncClient, AsyncRequestFactory, Client, TestCase, TransactionTestCase, override_settings
+from django.conf import settings
+from django.db import connection, connections, transaction, OperationalError
+from django.db.utils import ConnectionHandler
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework.views import APIView
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .authentication import StatelessJWTAuthentication
+from . import urls as core_urls
+from .checks import replica_stickiness_cache
+from .caching import accessible_course_ids, bump_content_version, get_or_build
+from .db import retry_on_locked
+from .models import User, Department, Professor, Student, Course, Enrollment, Material, MaterialUpload, Announcement
+from .factories import SEED_PASSWORD, seed_data
+from .hashers import HashPool
+from .middleware import QueryRecorder
+from .provisioning import UserImporter
+from .realtime import get_broker, publish_announcement
+from .serializers import (
+    RoleTokenObtainPairSerializer,
+    RowListSerializer,
+    DepartmentSerializer,
+    CourseListSerializer,
+    EnrollmentSerializer,
+    MaterialSerializer,
+    AnnouncementSerializer,
+    DEPARTMENT_ROW,
+    COURSE_ROW,
+    ENROLLMENT_ROW,
+    MATERIAL_ROW,
+    ANNOUNCEMENT_ROW,
+)
+from .views import AnnouncementViewSet, CourseViewSet, MaterialViewSet, announcement_stream
+
+
+def make_user(username, role, **extra):
+    return User.objects.create_user(username=username, password="pass1234", role=role, **extra)
+
+
+def make_student(username, department=None):
+    user = make_user(username, "student", first_name=username, last_name="student")
+    return Student.objects.create(
+        user=user, national_id=f"NID-{username}", department=department, academic_year="2025"
+    )
+
+
+def make_professor(username, department=None):
+    user = make_user(username, "professor", first_name=username, last_name="prof")
+    return Professor.objects.create(user=user, department=department)
+
+
+# Slow benchmarks run only on request: UCMS_BENCHMARKS=1 python manage.py test
+benchmark = skipUnless(os.environ.get("UCMS_BENCHMARKS"), "set UCMS_BENCHMARKS=1 to run benchmarks")
+
+
+@override_settings(PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"])
+class CoreTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.department = Department.objects.create(name="Computer Science", code="CS")
+        self.admin = make_user("admin", "admin")
+        self.professor = make_professor("prof", self.department)
+
+    def make_course(self, code, capacity=30):
+        course = Course.objects.create(
+            code=code, title=f"Course {code}", department=self.department, capacity=capacity
+        )
+        course.professors.add(self.professor)
+        return course
+
+    def count_queries(self, url, user):
+        self.client.force_authenticate(user)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, response.content)
+        return len(ctx.captured_queries)
+
+
+class SeatCountTests(CoreTestCase):
+    def test_seats_available_reads_counter(self):
+        course = self.make_course("CS101", capacity=2)
+        Enrollment.objects.create(student=make_student("s1"), course=course)
+
+        course.refresh_from_db()
+        with self.assertNumQueries(0):
+            self.assertEqual(course.seats_available(), 1)
+
+    def test_queryset_writes_cannot_skip_the_counter(self):
+        course = self.make_course("CS101")
+        enrollment = Enrollment.objects.enroll(make_student("s1"), course)
+        with self.assertRaises(ValueError):
+            Enrollment.objects.filter(pk=enrollment.pk).update(status="rejected")
+        enrollment.status = "rejected"
+        with self.assertRaises(ValueError):
+            Enrollment.objects.bulk_update([enrollment], ["status"])
+        course.refresh_from_db()
+        self.assertEqual(course.approved_count, 1)
+
+    def test_course_list_query_count_is_constant(self):
+        self.make_course("CS101")
+        baseline = self.count_queries("/api/courses/", self.admin)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(10):
+                course = self.make_course(f"CS2{i:02d}")
+                Enrollment.objects.create(student=make_student(f"s{i}"), course=course)
+
+        self.assertEqual(self.count_queries("/api/courses/", self.admin), baseline)
+
+    def test_enrollment_list_query_count_is_constant(self):
+        course = self.make_course("CS101")
+        Enrollment.objects.create(student=make_student("s0"), course=course)
+        baseline = self.count_queries("/api/enrollments/", self.admin)
+
+        for i in range(1, 10):
+            Enrollment.objects.create(student=make_student(f"s{i}"), course=self.make_course(f"CS2{i:02d}"))
+
+        self.assertEqual(self.count_queries("/api/enrollments/", self.admin), baseline)
+
+    def test_enrollment_reports_remaining_seats(self):
+        course = self.make_course("CS101", capacity=1)
+        student = make_student("s1")
+        self.client.force_authenticate(student.user)
+
+        response = self.client.post("/api/enrollments/", {"course_id": course.pk})
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(response.data["course"]["seats_available"], 0)
+        course.refresh_from_db()
+        self.assertEqual(course.seats_available(), 0)
+
+        self.client.force_authenticate(make_student("s2").user)
+        response = self.client.post("/api/enrollments/", {"course_id": course.pk})
+        self.assertEqual(response.status_code, 400)
+
+
+class EnrollmentEngineTests(CoreTestCase):
+    def setUp(self):
+        super().setUp()
+        self.course = self.make_course("CS101", capacity=2)
+
+    def test_enroll_uses_two_queries(self):
+        student = make_student("s1")
+        with CaptureQueriesContext(connection) as ctx:
+            Enrollment.objects.enroll(student, self.course)
+        statements = [q["sql"] for q in ctx.captured_queries if not q["sql"].startswith(("SAVEPOINT", "RELEASE"))]
+        self.assertEqual(len(statements), 2, statements)
+        self.assertEqual(self.course.approved_count, 1)
+
+    def test_duplicate_enrollment_releases_seat(self):
+        student = make_student("s1")
+        Enrollment.objects.enroll(student, self.course)
+        with self.assertRaisesMessage(ValidationError, "Already enrolled."):
+            Enrollment.objects.enroll(student, self.course)
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.approved_count, 1)
+
+    def test_status_changes_and_deletes_update_counter(self):
+        enrollment = Enrollment.objects.enroll(make_student("s1"), self.course)
+        Enrollment.objects.enroll(make_student("s2"), self.course, status="pending")
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.approved_count, 1)
+
+        enrollment.status = "rejected"
+        enrollment.save()
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.approved_count, 0)
+
+        enrollment.status = "approved"
+        enrollment.save()
+        enrollment.student.delete()
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.approved_count, 0)
+
+
+class BulkEnrollmentTests(CoreTestCase):
+    def setUp(self):
+        super().setUp()
+        self.course = self.make_course("CS101", capacity=2)
+        self.students = [make_student(f"s{i}") for i in range(4)]
+        self.client.force_authenticate(self.admin)
+
+    def test_bulk_reports_each_row(self):
+        Enrollment.objects.enroll(self.students[0], self.course)
+        rows = [
+            {"student": self.students[0].pk, "course": self.course.pk},
+            {"student": self.students[1].pk, "course": self.course.pk},
+            {"student": self.students[1].pk, "course": self.course.pk},
+            {"student": self.students[2].pk, "course": self.course.pk},
+            {"student": self.students[3].pk, "course": self.course.pk, "status": "pending"},
+            {"student": 99999, "course": self.course.pk},
+            {"student": "x", "course": self.course.pk},
+        ]
+        response = self.client.post("/api/enrollments/bulk/", rows, format="json")
+
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.data["created"], 2)
+        self.assertEqual(
+            [(r["status"], r.get("errors")) for r in response.data["results"]],
+            [
+                ("error", ["Already enrolled."]),
+                ("created", None),
+                ("error", ["Already enrolled."]),
+                ("error", ["Course capacity reached"]),
+                ("created", None),
+                ("error", ["Student not found."]),
+                ("error", ["student and course must be integer ids."]),
+            ],
+        )
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.approved_count, 2)
+        self.assertEqual(self.course.enrollments.count(), 3)
+
+    def test_bulk_accepts_csv_upload(self):
+        lines = ["student,course"] + [f"{student.pk},{self.course.pk}" for student in self.students[:2]]
+        upload = SimpleUploadedFile("cohort.csv", "\n".join(lines).encode(), content_type="text/csv")
+        response = self.client.post("/api/enrollments/bulk/", {"file": upload}, format="multipart")
+
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.data["created"], 2)
+
+    def test_bulk_query_count_does_not_grow_with_rows(self):
+        def import_rows(students, course):
+            rows = [{"student": student.pk, "course": course.pk} for student in students]
+            with CaptureQueriesContext(connection) as ctx:
+                self.client.post("/api/enrollments/bulk/", rows, format="json")
+            return len(ctx.captured_queries)
+
+        few = import_rows(self.students[:1], self.make_course("CS102"))
+        many = import_rows(self.students, self.make_course("CS103"))
+        self.assertEqual(few, many)
+
+    def test_bulk_query_count_does_not_grow_with_courses(self):
+        def import_rows(courses):
+            rows = [{"student": student.pk, "course": course.pk} for student in self.students for course in courses]
+            with CaptureQueriesContext(connection) as ctx:
+                Enrollment.objects.bulk_enroll(rows)
+            return len(ctx.captured_queries)
+
+        one = import_rows([self.make_course("CS102")])
+        three = import_rows([self.make_course(f"CS2{i}", capacity=3) for i in range(3)])
+        self.assertEqual(one, three)
+        self.assertEqual(
+            sorted(Course.objects.filter(code__startswith="CS2").values_list("approved_count", flat=True)), [3, 3, 3]
+        )
+
+    def test_bulk_is_admin_only(self):
+        self.client.force_authenticate(self.students[0].user)
+        response = self.client.post("/api/enrollments/bulk/", [], format="json")
+        self.assertEqual(response.status_code, 403)
+
+
+class PaginationTests(CoreTestCase):
+    def setUp(self):
+        super().setUp()
+        self.course = self.make_course("CS101")
+        for i in range(5):
+            Enrollment.objects.enroll(make_student(f"s{i}"), self.course)
+        self.client.force_authenticate(self.admin)
+
+    def test_cursor_pages_cover_every_row_once(self):
+        seen = []
+        url = "/api/enrollments/?page_size=2"
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(response.data["results"]), 2)
+            seen.extend(row["id"] for row in response.data["results"])
+            url = response.data["next"]
+
+        expected = list(Enrollment.objects.order_by("-created_at", "-id").values_list("id", flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_fields_parameter_trims_output(self):
+        response = self.client.get("/api/enrollments/?fields=id,status")
+        self.assertEqual(set(response.data["results"][0]), {"id", "status"})
+
+        response = self.client.get(f"/api/courses/{self.course.pk}/?fields=code")
+        self.assertEqual(response.data, {"code": "CS101"})
+
+    def test_fields_parameter_skips_nested_queries(self):
+        full = self.count_queries("/api/enrollments/", self.admin)
+        sparse = self.count_queries("/api/enrollments/?fields=id,status", self.admin)
+        self.assertLess(sparse, full)
+
+    def test_course_roster_is_paginated(self):
+        response = self.client.get(f"/api/courses/{self.course.pk}/students/?page_size=3")
+        self.assertEqual(len(response.data["results"]), 3)
+        self.assertIsNotNone(response.data["next"])
+
+
+class AccessibleCourseCacheTests(CoreTestCase):
+    def setUp(self):
+        super().setUp()
+        self.course = self.make_course("CS101")
+        self.other = self.make_course("CS102")
+        self.student = make_student("s1")
+        Announcement.objects.create(course=self.course, posted_by=self.professor, title="Welcome", body="Hi")
+        Announcement.objects.create(course=self.other, posted_by=self.professor, title="Other", body="Hi")
+
+    def titles(self, user):
+        self.client.force_authenticate(user)
+        return {row["title"] for row in self.client.get("/api/announcements/").data["results"]}
+
+    def test_student_sees_only_enrolled_courses(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Enrollment.objects.enroll(self.student, self.course)
+        self.assertEqual(self.titles(self.student.user), {"Welcome"})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Enrollment.objects.enroll(self.student, self.other)
+        self.assertEqual(self.titles(self.student.user), {"Welcome", "Other"})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Enrollment.objects.filter(course=self.other).delete()
+        self.assertEqual(self.titles(self.student.user), {"Welcome"})
+
+    def test_course_ids_are_cached(self):
+        Enrollment.objects.enroll(self.student, self.course)
+        self.assertEqual(accessible_course_ids(self.student.user), [self.course.pk])
+        with self.assertNumQueries(0):
+            accessible_course_ids(self.student.user)
+
+    def test_professor_assignment_invalidates(self):
+        newcomer = make_professor("newcomer")
+        self.assertEqual(self.titles(newcomer.user), set())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.other.professors.add(newcomer)
+        self.assertEqual(self.titles(newcomer.user), {"Other"})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            newcomer.courses.clear()
+        self.assertEqual(self.titles(newcomer.user), set())
+
+    def test_bulk_enrollment_invalidates(self):
+        self.assertEqual(self.titles(self.student.user), set())
+        with self.captureOnCommitCallbacks(execute=True):
+            Enrollment.objects.bulk_enroll([{"student": self.student.pk, "course": self.course.pk}])
+        self.assertEqual(self.titles(self.student.user), {"Welcome"})
+
+
+class ConditionalRequestTests(CoreTestCase):
+    def setUp(self):
+        super().setUp()
+        self.course = self.make_course("CS101")
+        self.student = make_student("s1")
+        Enrollment.objects.enroll(self.student, self.course)
+        Announcement.objects.create(course=self.course, posted_by=self.professor, title="Welcome", body="Hi")
+        self.client.force_authenticate(self.student.user)
+
+    def revalidate(self, url, **headers):
+        first = self.client.get(url)
+        self.assertEqual(first.status_code, 200)
+        return first, self.client.get(url, HTTP_IF_NONE_MATCH=first["ETag"], **headers)
+
+    def test_unchanged_catalog_is_304_without_queries(self):
+        first = self.client.get("/api/courses/")
+        with self.assertNumQueries(0):
+            response = self.client.get("/api/courses/", HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+
+        response = self.client.get("/api/courses/", HTTP_IF_MODIFIED_SINCE=first["Last-Modified"])
+        self.assertEqual(response.status_code, 304)
+
+    def test_joining_a_course_defeats_if_modified_since(self):
+        first = self.client.get("/api/announcements/")
+        other = self.make_course("CS102")
+        older = Announcement.objects.create(course=other, posted_by=self.professor, title="Old", body="")
+        Announcement.objects.filter(pk=older.pk).update(created_at=timezone.now() - timedelta(days=7))
+        later = time.time_ns() + 5 * 10**9
+        with mock.patch("core.caching.time.time_ns", return_value=later), self.captureOnCommitCallbacks(execute=True):
+            Enrollment.objects.enroll(self.student, other)
+
+        response = self.client.get("/api/announcements/", HTTP_IF_MODIFIED_SINCE=first["Last-Modified"])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data["results"]), 2)
+
+    def test_catalog_changes_invalidate_etag(self):
+        first, _ = self.revalidate("/api/courses/")
+        with self.captureOnCommitCallbacks(execute=True):
+            Enrollment.objects.enroll(make_student("s2"), self.course)
+        response = self.client.get("/api/courses/", HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["results"][0]["seats_available"], 28)
+
+        first = response
+        with self.captureOnCommitCallbacks(execute=True):
+            Course.objects.filter(pk=self.course.pk).first().save()
+        response = self.client.get("/api/courses/", HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(response.status_code, 200)
+
+    def test_etag_moves_only_when_the_write_commits(self):
+        first = self.client.get("/api/courses/")
+        with self.captureOnCommitCallbacks(execute=True):
+            Enrollment.objects.enroll(make_student("s2"), self.course)
+            # Still inside the writer's transaction: other readers cannot see
+            # the new row, so they must not get a new ETag for the old body.
+            response = self.client.get("/api/courses/", HTTP_IF_NONE_MATCH=first["ETag"])
+            self.assertEqual(response.status_code, 304)
+        response = self.client.get("/api/courses/", HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(response.status_code, 200)
+
+    def test_etag_depends_on_query(self):
+        first = self.client.get("/api/courses/")
+        response = self.client.get("/api/courses/?fields=code", HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], first["ETag"])
+
+    def test_announcements_revalidate(self):
+        first, response = self.revalidate("/api/announcements/")
+        self.assertEqual(response.status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            announcement = Announcement.objects.get()
+            announcement.title = "Edited"
+            announcement.save()
+        response = self.client.get("/api/announcements/", HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["results"][0]["title"], "Edited")
+
+    def test_announcement_validators_are_per_user(self):
+        first = self.client.get("/api/announcements/")
+        self.client.force_authenticate(make_student("s2").user)
+        response = self.client.get("/api/announcements/", HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["results"], [])
+
+
+class CatalogCacheTests(CoreTestCase):
+    def setUp(self):
+        super().setUp()
+        self.course = self.make_course("CS101")
+        self.client.force_authenticate(self.admin)
+
+    def test_repeat_list_is_served_from_cache(self):
+        first = self.client.get("/api/courses/")
+        with self.assertNumQueries(0):
+            response = self.client.get("/api/courses/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), first.json())
+
+    def test_changes_invalidate_cached_pages(self):
+        def first_course():
+            return self.client.get("/api/courses/").data["results"][0]
+
+        self.assertEqual(first_course()["seats_available"], 30)
+        with self.captureOnCommitCallbacks(execute=True):
+            Enrollment.objects.enroll(make_student("s1"), self.course)
+        self.assertEqual(first_course()["seats_available"], 29)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.department.name = "Informatics"
+            self.department.save()
+        self.assertEqual(first_course()["department"]["name"], "Informatics")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.professor.user.first_name = "Ada"
+            self.professor.user.save()
+        self.assertEqual(first_course()["professors"][0]["name"], "Ada prof")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.course.professors.clear()
+        self.assertEqual(first_course()["professors"], [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.course.delete()
+        self.assertEqual(self.client.get("/api/courses/").data["results"], [])
+
+    def test_page_built_before_commit_is_not_kept(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Enrollment.objects.enroll(make_student("s1"), self.course)
+            # A page rebuilt before the commit is stored under the old version.
+            self.client.get("/api/courses/")
+        Course.objects.filter(pk=self.course.pk).update(approved_count=5)
+        self.assertEqual(self.client.get("/api/courses/").data["results"][0]["seats_available"], 25)
+
+    def test_waiters_reuse_the_rebuilt_value(self):
+        cache.add("page:lock", 1)
+        threading.Timer(0.1, cache.set, ("page", "built elsewhere")).start()
+
+        def build():
+            raise AssertionError("only the lock holder rebuilds")
+
+        self.assertEqual(get_or_build("page", build, 60), "built elsewhere")
+
+    def test_waiters_fall_back_after_timeout(self):
+        cache.add("page:lock", 1)
+        with mock.patch("core.caching.REBUILD_WAIT", 0.1):
+            self.assertEqual(get_or_build("page", lambda: "rebuilt", 60), "rebuilt")
+
+
+class RosterExportTests(CoreTestCase):
+    def setUp(self):
+        super().setUp()
+        self.course = self.make_course("CS101", capacity=100)
+        for i in range(5):
+            Enrollment.objects.enroll(make_student(f"s{i}"), self.course)
+        Enrollment.objects.enroll(make_student("pending"), self.course, status="pending")
+        self.client.force_authenticate(self.professor.user)
+
+    def export(self, fmt):
+        response = self.client.get(f"/api/courses/{self.course.pk}/students/?format={fmt}")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertIn(f'filename="CS101-roster.{fmt}"', response["Content-Disposition"])
+        return b"".join(response.streaming_content).decode()
+
+    def test_csv_export(self):
+        rows = list(csv.DictReader(io.StringIO(self.export("csv"))))
+        self.assertEqual([row["username"] for row in rows], [f"s{i}" for i in reversed(range(5))])
+        self.assertEqual(rows[0]["email"], Student.objects.get(user__username="s4").user.email)
+
+    def test_jsonl_export_has_course_header_once(self):
+        lines = [json.loads(line) for line in self.export("jsonl").splitlines()]
+        self.assertEqual(lines[0]["course"]["code"], "CS101")
+        self.assertEqual(lines[0]["course"]["approved"], 5)
+        self.assertEqual(len(lines), 6)
+        self.assertTrue(all("course" not in line for line in lines[1:]))
+
+    def test_export_query_count_does_not_grow_with_roster(self):
+        def queries():
+            with CaptureQueriesContext(connection) as ctx:
+                self.export("jsonl")
+            return len(ctx.captured_queries)
+
+        few = queries()
+        for i in range(20):
+            Enrollment.objects.enroll(make_student(f"extra{i}"), self.course)
+        self.assertEqual(queries(), few)
+
+    def test_export_streams_under_asgi(self):
+        token = RoleTokenObtainPairSerializer.get_token(self.professor.user).access_token
+
+        async def export():
+            response = await AsyncClient().get(
+                f"/api/courses/{self.course.pk}/students/?format=csv", headers={"Authorization": f"Bearer {token}"}
+            )
+            self.assertTrue(response.is_async)
+            return b"".join([chunk async for chunk in response.streaming_content]).decode()
+
+        with warnings.catch_warnings():
+            # Django warns when it has to buffer a sync iterator under ASGI.
+            warnings.simplefilter("error")
+            rows = list(csv.DictReader(io.StringIO(async_to_sync(export)())))
+        self.assertEqual(len(rows), 5)
+
+    def test_export_file_name_is_quoted(self):
+        self.course.code = 'CS"1 é'
+        self.course.save()
+        response = self.client.get(f"/api/courses/{self.course.pk}/students/?format=csv")
+        self.assertEqual(response["Content-Disposition"], "attachment; filename*=utf-8''CS%221%20%C3%A9-roster.csv")
+
+    def test_export_checks_course_professor(self):
+        self.client.force_authenticate(make_professor("outsider").user)
+        response = self.client.get(f"/api/courses/{self.course.pk}/students/?format=csv")
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(json.loads(response.content), {"detail": "Not allowed"})
+
+    def test_students_cannot_read_roster(self):
+        student = Student.objects.get(user__username="s0")
+        self.client.force_authenticate(student.user)
+        for fmt in ("csv", "jsonl", "json"):
+            response = self.client.get(f"/api/courses/{self.course.pk}/students/?format={fmt}")
+            self.assertEqual(response.status_code, 403, fmt)
+            self.assertFalse(response.streaming)
+
+
+class RequestMetricsTests(CoreTestCase):
+    def setUp(self):
+        super().setUp()
+        self.course = self.make_course("CS101")
+        Announcement.objects.create(course=self.course, posted_by=self.professor, title="Hi", body="")
+        log = tempfile.NamedTemporaryFile(suffix=".jsonl", delete=False)
+        log.close()
+        self.log_path = Path(log.name)
+        self.addCleanup(self.log_path.unlink)
+        self.enterContext(override_settings(UCMS_METRICS_LOG=str(self.log_path), UCMS_METRICS_SAMPLE_RATE=1.0))
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def records(self):
+        return [json.loads(line) for line in self.log_path.read_text().splitlines()]
+
+    def test_server_timing_and_log_record(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get("/api/announcements/?fields=id")
+        self.assertIn("db;dur=", response["Server-Timing"])
+        self.assertIn(f'desc="{len(ctx.captured_queries)} queries"', response["Server-Timing"])
+
+        [record] = self.records()
+        self.assertEqual(record["endpoint"], "AnnouncementViewSet.list")
+        self.assertEqual(record["queries"], len(ctx.captured_queries))
+        self.assertEqual(record["bytes"], len(response.content))
+        self.assertEqual(record["duplicates"], [])
+        self.assertGreaterEqual(record["total_ms"], record["render_ms"])
+        self.assertGreater(record["serialize_ms"], 0)
+        self.assertIn("serialize;dur=", response["Server-Timing"])
+
+    def test_server_timing_only_for_admins(self):
+        self.client.force_authenticate(make_student("s1").user)
+        response = self.client.get("/api/announcements/")
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("Server-Timing", response)
+        self.client.force_authenticate(None)
+        self.assertNotIn("Server-Timing", self.client.get("/api/announcements/"))
+
+    def test_async_views_are_measured(self):
+        token = RoleTokenObtainPairSerializer.get_token(self.admin).access_token
+        response = async_to_sync(AsyncClient().get)("/api/async/courses/", headers={"Authorization": f"Bearer {token}"})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("db;dur=", response["Server-Timing"])
+        [record] = self.records()
+        self.assertEqual(record["endpoint"], "course_list")
+        self.assertGreater(record["serialize_ms"], 0)
+        self.assertGreater(record["queries"], 0)
+
+    def test_repeated_statements_are_flagged(self):
+        for i in range(3):
+            make_student(f"s{i}")
+        recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            for user in User.objects.all():
+                Student.objects.filter(user=user).exists()
+        [(sql, count)] = recorder.duplicates(3)
+        self.assertIn('"core_student"', sql)
+        self.assertEqual(count, User.objects.count())
+
+    def test_report_command_aggregates_per_endpoint(self):
+        for _ in range(3):
+            self.client.get("/api/courses/")
+        self.client.get("/api/announcements/")
+        out = io.StringIO()
+        call_command("metrics_report", str(self.log_path), "--json", stdout=out)
+        rows = {row["endpoint"]: row for row in json.loads(out.getvalue())}
+        self.assertEqual(rows["CourseViewSet.list"]["requests"], 3)
+        self.assertEqual(rows["AnnouncementViewSet.list"]["requests"], 1)
+
+
+class QueryPlanTests(CoreTestCase):
+    """EXPLAIN the SQL the views actually run and check it hits the composite indexes."""
+
+    def setUp(self):
+        super().setUp()
+        self.course = self.make_course("CS101")
+        self.student = make_student("s1")
+        Enrollment.objects.enroll(self.student, self.course)
+        Announcement.objects.create(course=self.course, posted_by=self.professor, title="Welcome", body="Hi")
+        Material.objects.create(course=self.course, uploaded_by=self.professor, title="Slides", file="materials/slides.pdf")
+
+    def explain(self, sql):
+        with connection.cursor() as cursor:
+            if connection.vendor == "postgresql":
+                # Tiny test tables would otherwise always be seq-scanned.
+                cursor.execute("SET LOCAL enable_seqscan = off")
+                cursor.execute("EXPLAIN " + sql)
+            else:
+                cursor.execute("EXPLAIN QUERY PLAN " + sql)
+            return "\n".join(" ".join(map(str, row)) for row in cursor.fetchall())
+
+    def assertUsesIndex(self, url, user, table, index):
+        cache.clear()
+        self.client.force_authenticate(user)
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        plans = [self.explain(q["sql"]) for q in ctx.captured_queries if f'FROM "{table}"' in q["sql"]]
+        self.assertTrue(plans, f"no query against {table}")
+        self.assertTrue(any(index in plan for plan in plans), "\n\n".join(plans))
+
+    def test_roster_uses_partial_approved_index(self):
+        self.assertUsesIndex(
+            f"/api/courses/{self.course.pk}/students/", self.admin, "core_enrollment", "enroll_approved_course_idx"
+        )
+
+    def test_student_access_lookup_uses_student_status_index(self):
+        self.assertUsesIndex("/api/announcements/", self.student.user, "core_enrollment", "enroll_student_status_idx")
+
+    def test_announcement_list_uses_course_created_index(self):
+        self.assertUsesIndex("/api/announcements/", self.student.user, "core_announcement", "announce_course_created_idx")
+
+    def test_material_list_uses_course_created_index(self):
+        self.assertUsesIndex("/api/materials/", self.professor.user, "core_material", "material_course_created_idx")
+
+
+class ProvisioningTests(CoreTestCase):
+    def test_create_student_hashes_once_and_writes_once(self):
+        User.objects.create_user("taken", email="jane.doe@student.ucms.com")
+        User.objects.create_user("taken2", email="jane.doe2@student.ucms.com")
+
+        with mock.patch("django.contrib.auth.base_user.make_password", wraps=make_password) as hasher:
+            with CaptureQueriesContext(connection) as ctx:
+                student = User.objects.create_student(
+                    "jdoe", national_id="29001011234", first_name="Jane", last_name="Doe", academic_year="2025"
+                )
+
+        self.assertEqual(hasher.call_count, 1)
+        statements = [q["sql"].split()[0] for q in ctx.captured_queries if not q["sql"].startswith(("SAVEPOINT", "RELEASE"))]
+        self.assertEqual(statements, ["SELECT", "INSERT", "INSERT"])
+
+        user = User.objects.get(pk=student.user_id)
+        self.assertEqual(user.email, "jane.doe3@student.ucms.com")
+        self.assertTrue(user.check_password("1234doe"))
+
+    def test_student_created_for_existing_user_gets_credentials(self):
+        user = User.objects.create_user("john.smith")
+        Student.objects.create(user=user, national_id="5678", academic_year="2025")
+
+        user.refresh_from_db()
+        self.assertEqual(user.email, "john.smith@student.ucms.com")
+        self.assertTrue(user.check_password("5678smi"))
+
+    def test_profiles_keep_chosen_password_and_email(self):
+        user = User.objects.create_user("jane.doe", password="chosen", email="jane@example.com")
+        Student.objects.create(user=user, national_id="1234", academic_year="2025")
+        user.refresh_from_db()
+        self.assertEqual(user.email, "jane@example.com")
+        self.assertTrue(user.check_password("chosen"))
+
+        user = User.objects.create_user("kay", password="chosen", email="kay@example.com", role="professor")
+        Professor.objects.create(user=user)
+        self.assertEqual(User.objects.get(pk=user.pk).email, "kay@example.com")
+
+    def test_default_email_and_professor_email(self):
+        user = User.objects.create_user("plain")
+        self.assertEqual(User.objects.get(pk=user.pk).email, "plain@ucms.edu")
+
+        professor = make_professor("newprof")
+        self.assertEqual(professor.user.email, f"p-{professor.pk}@ucms.edu")
+        self.assertEqual(User.objects.get(pk=professor.user_id).email, professor.user.email)
+
+
+@benchmark
+@override_settings(PASSWORD_HASHERS=settings.PASSWORD_HASHERS)
+class ProvisioningBenchmark(CoreTestCase):
+    """Provisioning with the production hasher costs one PBKDF2 hash per student."""
+    users = 5
+
+    def test_students_provisioned_at_hashing_speed(self):
+        started = time.perf_counter()
+        for i in range(self.users):
+            make_password(f"{i:08d}")
+        hashing = time.perf_counter() - started
+
+        started = time.perf_counter()
+        for i in range(self.users):
+            User.objects.create_student(f"bench{i}", national_id=f"{i:08d}", first_name="Bench", last_name="Student")
+        provisioning = time.perf_counter() - started
+
+        students = User.objects.filter(email__startswith="bench.student")
+        self.assertEqual(students.count(), self.users)
+        self.assertTrue(all(user.password.startswith("pbkdf2_sha256$") for user in students))
+        # A second hash per student would double the time.
+        self.assertLess(provisioning, hashing * 1.5)
+
+
+USERS_CSV = """username,role,first_name,last_name,national_id,department,academic_year,office,password
+amy,student,Amy,Adams,1111,CS,2025,,
+ben,student,Ben,Adams,2222,,2025,,
+amy2,student,Amy,Adams,3333,CS,2025,,
+carl,professor,Carl,Cole,,CS,,B-12,secret
+dana,admin,Dana,Dee,,,,,
+eve,student,Eve,Evans,,,2025,,
+,student,No,Name,4444,,,,
+fay,student,Fay,Fox,1111,,2025,,
+"""
+
+
+class UserImportTests(CoreTestCase):
+    def run_import(self, text, **kwargs):
+        importer = UserImporter(chunk_size=3, workers=0, **kwargs)
+        return importer.run(csv.DictReader(io.StringIO(text)))
+
+    def test_import_creates_users_and_profiles(self):
+        with CaptureQueriesContext(connection) as ctx:
+            summary = self.run_import(USERS_CSV)
+
+        self.assertEqual((summary["created"], summary["failed"]), (5, 3))
+        self.assertEqual([error["row"] for error in summary["errors"]], [6, 7, 8])
+        self.assertLess(len(ctx.captured_queries), 40)
+
+        amy = User.objects.get(username="amy")
+        self.assertEqual(amy.email, "amy.adams@student.ucms.com")
+        self.assertTrue(amy.check_password("1111ada"))
+        self.assertEqual(amy.student.department, self.department)
+        self.assertEqual(User.objects.get(username="amy2").email, "amy.adams2@student.ucms.com")
+
+        carl = User.objects.get(username="carl")
+        self.assertEqual(carl.email, f"p-{carl.professor.pk}@ucms.edu")
+        self.assertTrue(carl.check_password("secret"))
+        self.assertFalse(User.objects.get(username="dana").has_usable_password())
+
+    def test_rerun_skips_existing_usernames(self):
+        self.run_import(USERS_CSV)
+        summary = self.run_import(USERS_CSV)
+        self.assertEqual((summary["created"], summary["skipped"]), (0, 5))
+
+    def test_process_pool_hashing(self):
+        summary = UserImporter(workers=2).run(csv.DictReader(io.StringIO(USERS_CSV)))
+        self.assertEqual(summary["created"], 5)
+        self.assertTrue(User.objects.get(username="ben").check_password("2222ada"))
+
+    def test_command_resumes_from_checkpoint(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "users.csv"
+            path.write_text(USERS_CSV)
+            Path(f"{path}.progress").write_text("3")
+
+            out = io.StringIO()
+            call_command("import_users", str(path), workers=0, chunk_size=2, stdout=out, stderr=io.StringIO())
+
+            self.assertIn("Resuming after row 3", out.getvalue())
+            self.assertFalse(Path(f"{path}.progress").exists())
+        self.assertFalse(User.objects.filter(username__in=["amy", "ben"]).exists())
+        self.assertTrue(User.objects.filter(username="carl").exists())
+
+    def test_import_api_is_admin_only(self):
+        def upload():
+            return {"file": SimpleUploadedFile("users.csv", USERS_CSV.encode(), content_type="text/csv")}
+
+        self.client.force_authenticate(self.professor.user)
+        self.assertEqual(self.client.post("/api/users/import/", upload(), format="multipart").status_code, 403)
+
+        self.client.force_authenticate(self.admin)
+        response = self.client.post("/api/users/import/", upload(), format="multipart")
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.data["created"], 5)
+
+    @override_settings(UCMS_IMPORT_API_MAX_ROWS=7)
+    def test_import_api_caps_rows(self):
+        self.client.force_authenticate(self.admin)
+        upload = SimpleUploadedFile("users.csv", USERS_CSV.encode(), content_type="text/csv")
+        response = self.client.post("/api/users/import/", {"file": upload}, format="multipart")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("import_users", response.data["detail"])
+        self.assertFalse(User.objects.filter(username="amy").exists())
+
+    def test_supplied_emails_are_kept_and_avoided(self):
+        summary = self.run_import(
+            "username,role,first_name,last_name,national_id,email\n"
+            "gus,student,Gus,Grey,5555,gus@example.com\n"
+            "hal,professor,Hal,Hill,,hal@example.com\n"
+            "ida,admin,Ida,Ito,,amy.adams@student.ucms.com\n"
+            "amy,student,Amy,Adams,6666,\n"
+        )
+        self.assertEqual(summary["failed"], 0)
+        emails = dict(User.objects.values_list("username", "email"))
+        self.assertEqual(emails["gus"], "gus@example.com")
+        self.assertEqual(emails["hal"], "hal@example.com")
+        self.assertEqual(emails["amy"], "amy.adams2@student.ucms.com")
+
+
+class TokenAuthenticationTests(CoreTestCase):
+    def login(self, username, password="pass1234"):
+        response = self.client.post("/api/auth/token/", {"username": username, "password": password}, format="json")
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.data["access"]
+
+    def test_tokens_carry_role_and_profile_ids(self):
+        token = AccessToken(self.login("prof"))
+        self.assertEqual(token["role"], "professor")
+        self.assertEqual(token["professor_id"], self.professor.pk)
+        self.assertIsNone(token["student_id"])
+
+    def test_profile_loaded_with_user_in_one_query(self):
+        course = self.make_course("CS101")
+        Material.objects.create(course=course, uploaded_by=self.professor, title="Slides", file="materials/slides.pdf")
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.login('prof')}")
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(
+                "/api/announcements/", {"course": course.pk, "title": "Hi", "body": "Welcome"}, format="json"
+            )
+        self.assertEqual(response.status_code, 201, response.content)
+        profile_lookups = [q["sql"] for q in ctx.captured_queries if q["sql"].startswith('SELECT') and 'FROM "core_professor" WHERE' in q["sql"]]
+        self.assertEqual(profile_lookups, [])
+
+        user_queries = [q["sql"] for q in ctx.captured_queries if 'FROM "core_user"' in q["sql"]]
+        self.assertIn('LEFT OUTER JOIN "core_professor"', user_queries[0])
+
+
+class StatelessAuthenticationTests(TokenAuthenticationTests):
+    def setUp(self):
+        super().setUp()
+        # authentication_classes is read from settings when APIView is
+        # imported, so swap it on the class rather than via override_settings.
+        patcher = mock.patch.object(APIView, "authentication_classes", [StatelessJWTAuthentication])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    def user_queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        # Authentication lookups only; the course list also prefetches professor users.
+        markers = ('LEFT OUTER JOIN "core_student"', '"core_user"."is_active" AS')
+        return response, [q["sql"] for q in ctx.captured_queries if any(m in q["sql"] for m in markers)]
+
+    def test_reads_skip_the_user_query(self):
+        self.make_course("CS101")
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.login('admin')}")
+
+        response, queries = self.user_queries("/api/courses/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(queries), 1, queries)
+
+        response, queries = self.user_queries("/api/courses/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(queries, [])
+
+    def test_claims_user_scopes_student_reads(self):
+        course = self.make_course("CS101")
+        student = make_student("s1")
+        student.user.set_password("pass1234")
+        student.user.save()
+        Enrollment.objects.enroll(student, course)
+        Announcement.objects.create(course=course, posted_by=self.professor, title="Welcome", body="Hi")
+
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.login('s1')}")
+        response = self.client.get("/api/announcements/")
+        self.assertEqual([row["title"] for row in response.data["results"]], ["Welcome"])
+
+    def test_password_change_and_deactivation_revoke_tokens(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.login('admin')}")
+        self.assertEqual(self.client.get("/api/courses/").status_code, 200)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.admin.set_password("changed")
+            self.admin.save()
+        self.assertEqual(self.client.get("/api/courses/").status_code, 401)
+
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.login('admin', 'changed')}")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.admin.is_active = False
+            self.admin.save()
+        self.assertEqual(self.client.get("/api/courses/").status_code, 401)
+
+    def test_bulk_credential_updates_revoke_tokens(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.login('admin')}")
+        self.assertEqual(self.client.get("/api/courses/").status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            User.objects.filter(pk=self.admin.pk).update(password=make_password("changed"))
+        self.assertEqual(self.client.get("/api/courses/").status_code, 401)
+
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.login('admin', 'changed')}")
+        self.assertEqual(self.client.get("/api/courses/").status_code, 200)
+        self.admin.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            User.objects.bulk_update([self.admin], ["is_active"])
+        self.assertEqual(self.client.get("/api/courses/").status_code, 401)
+
+
+PBKDF2 = ["core.hashers.ConfigurablePBKDF2PasswordHasher", "django.contrib.auth.hashers.MD5PasswordHasher"]
+
+
+@override_settings(PASSWORD_HASHERS=PBKDF2, UCMS_PBKDF2_ITERATIONS=1000)
+class LoginHashingTests(TokenAuthenticationTests):
+    def test_login_rehashes_after_work_factor_change(self):
+        # The admin's hash was made with MD5 in setUp.
+        self.login("admin")
+        self.admin.refresh_from_db()
+        self.assertTrue(self.admin.password.startswith("pbkdf2_sha256$1000$"))
+
+        with override_settings(UCMS_PBKDF2_ITERATIONS=2000):
+            self.login("admin")
+        self.admin.refresh_from_db()
+        self.assertTrue(self.admin.password.startswith("pbkdf2_sha256$2000$"))
+        self.assertTrue(self.admin.check_password("pass1234"))
+
+    def test_saturated_pool_answers_503(self):
+        pool = HashPool(workers=1, queue_size=0, timeout=0.01)
+        self.addCleanup(pool.executor.shutdown)
+        pool.slots.acquire()
+        with mock.patch("core.backends.hash_pool", return_value=pool):
+            response = self.client.post("/api/auth/token/", {"username": "admin", "password": "pass1234"}, format="json")
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response["Retry-After"], "1")
+
+        pool.slots.release()
+        with mock.patch("core.backends.hash_pool", return_value=pool):
+            self.login("admin")
+
+    def test_saturated_pool_fails_admin_login_softly(self):
+        self.admin.is_staff = True
+        self.admin.save()
+        pool = HashPool(workers=1, queue_size=0, timeout=0.01)
+        self.addCleanup(pool.executor.shutdown)
+        pool.slots.acquire()
+        with mock.patch("core.backends.hash_pool", return_value=pool):
+            response = Client().post("/admin/login/", {"username": "admin", "password": "pass1234"})
+        self.assertEqual(response.status_code, 200)
+
+    def test_unknown_user_rejected(self):
+        response = self.client.post("/api/auth/token/", {"username": "nobody", "password": "x"}, format="json")
+        self.assertEqual(response.status_code, 401)
+
+    def refresh(self, token):
+        return self.client.post("/api/auth/token/refresh/", {"refresh": token}, format="json")
+
+    def test_refresh_reads_cached_user_state(self):
+        response = self.client.post("/api/auth/token/", {"username": "prof", "password": "pass1234"}, format="json")
+        refresh = response.data["refresh"]
+        self.assertEqual(self.refresh(refresh).status_code, 200)
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.refresh(refresh)
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(AccessToken(response.data["access"])["role"], "professor")
+        self.assertEqual([q for q in ctx.captured_queries if '"core_user"' in q["sql"]], [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.professor.user.set_password("changed")
+            self.professor.user.save()
+        self.assertEqual(self.refresh(refresh).status_code, 401)
+
+
+@benchmark
+class LoginBenchmark(CoreTestCase):
+    logins = 200
+    iterations = 20000
+
+    def test_logins_per_second(self):
+        workers = os.cpu_count() or 1
+        pool = HashPool(workers=workers, queue_size=self.logins, timeout=60)
+        self.addCleanup(pool.executor.shutdown)
+
+        with override_settings(PASSWORD_HASHERS=PBKDF2, UCMS_PBKDF2_ITERATIONS=self.iterations):
+            encoded = make_password("pass1234")
+            User.objects.filter(pk=self.admin.pk).update(password=encoded)
+            started = time.perf_counter()
+            for _ in range(self.logins // 10):
+                self.assertTrue(pool.check_password("pass1234", encoded))
+            serial = (self.logins // 10) / (time.perf_counter() - started)
+
+            threads = [threading.Thread(target=pool.check_password, args=("pass1234", encoded)) for _ in range(self.logins)]
+            started = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            pooled = self.logins / (time.perf_counter() - started)
+
+            with mock.patch("core.backends.hash_pool", return_value=pool):
+                started = time.perf_counter()
+                for _ in range(self.logins // 10):
+                    response = self.client.post("/api/auth/token/", {"username": "admin", "password": "pass1234"}, format="json")
+                    self.assertEqual(response.status_code, 200)
+                endpoint = (self.logins // 10) / (time.perf_counter() - started)
+
+        print(
+            f"\nPBKDF2 x{self.iterations}: {serial:.0f} checks/s on one thread, "
+            f"{pooled:.0f}/s over {workers} workers ({pooled / workers:.0f}/s per core), "
+            f"{endpoint:.0f} token logins/s serially"
+        )
+
+
+class MaterialFileTestCase(CoreTestCase):
+    content = b"0123456789" * 10
+
+    def setUp(self):
+        super().setUp()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        staging = tempfile.TemporaryDirectory()
+        self.addCleanup(staging.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name, UCMS_UPLOAD_STAGING_DIR=staging.name))
+        self.media_root = Path(media.name)
+        self.staging_root = Path(staging.name)
+        self.course = self.make_course("CS101")
+        self.other = self.make_course("CS102")
+        self.student = make_student("s1")
+        Enrollment.objects.enroll(self.student, self.course)
+
+    def upload(self, course, name="lecture.PDF"):
+        self.client.force_authenticate(self.professor.user)
+        upload = SimpleUploadedFile(name, self.content, content_type="application/pdf")
+        response = self.client.post(
+            "/api/materials/", {"course": course.pk, "title": "Lecture 1", "file": upload}, format="multipart"
+        )
+        self.assertEqual(response.status_code, 201, response.content)
+        return Material.objects.get(pk=response.data["id"])
+
+    def download(self, material, user, **headers):
+        self.client.force_authenticate(user)
+        return self.client.get(f"/api/materials/{material.pk}/download/", headers=headers)
+
+
+class MaterialFileTests(MaterialFileTestCase):
+    def test_identical_uploads_are_stored_once(self):
+        first = self.upload(self.course)
+        second = self.upload(self.other, name="copy.pdf")
+
+        checksum = hashlib.sha256(self.content).hexdigest()
+        self.assertEqual(first.checksum, checksum)
+        self.assertEqual(first.size, len(self.content))
+        self.assertEqual(first.file.name, f"materials/{checksum[:2]}/{checksum}.pdf")
+        self.assertEqual(second.file.name, first.file.name)
+        self.assertEqual(len([p for p in self.media_root.rglob("*") if p.is_file()]), 1)
+
+    def test_download_checks_enrollment(self):
+        material = self.upload(self.other)
+        self.assertEqual(self.download(material, self.student.user).status_code, 404)
+
+        material = self.upload(self.course)
+        response = self.download(material, self.student.user, accept="application/pdf")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b"".join(response.streaming_content), self.content)
+        self.assertEqual(response["ETag"], f'"{material.checksum}"')
+        self.assertIn('filename="Lecture 1.pdf"', response["Content-Disposition"])
+
+    def test_download_errors_are_json(self):
+        material = self.upload(self.other)
+        for accept in ({}, {"accept": "application/pdf"}):
+            response = self.download(material, self.student.user, **accept)
+            self.assertEqual(response.status_code, 404)
+            self.assertTrue(response["Content-Type"].startswith("application/json"), response["Content-Type"])
+            self.assertIn("detail", json.loads(response.content))
+
+        self.client.force_authenticate(None)
+        response = self.client.get(f"/api/materials/{material.pk}/download/", headers={"accept": "application/pdf"})
+        self.assertEqual(response.status_code, 401)
+        self.assertIn("detail", json.loads(response.content))
+
+    def test_download_ranges_and_conditional_requests(self):
+        material = self.upload(self.course)
+        user = self.student.user
+
+        response = self.download(material, user, range="bytes=10-19")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b"".join(response.streaming_content), self.content[10:20])
+        self.assertEqual(response["Content-Range"], f"bytes 10-19/{len(self.content)}")
+
+        response = self.download(material, user, range="bytes=-5")
+        self.assertEqual(b"".join(response.streaming_content), self.content[-5:])
+
+        self.assertEqual(self.download(material, user, range="bytes=500-").status_code, 416)
+        self.assertEqual(self.download(material, user, if_none_match=f'"{material.checksum}"').status_code, 304)
+
+    @override_settings(UCMS_SENDFILE_HEADER="X-Accel-Redirect", UCMS_SENDFILE_PREFIX="/protected/")
+    def test_sendfile_offload(self):
+        material = self.upload(self.course)
+        response = self.download(material, self.student.user)
+        self.assertEqual(response["X-Accel-Redirect"], f"/protected/{material.file.name}")
+        self.assertEqual(response.content, b"")
+
+
+class ResumableUploadTests(MaterialFileTestCase):
+    def start(self, course=None, size=None):
+        self.client.force_authenticate(self.professor.user)
+        response = self.client.post("/api/materials/uploads/", {
+            "course": (course or self.course).pk,
+            "title": "Recording",
+            "filename": "recording.mp4",
+            "size": len(self.content) if size is None else size,
+        }, format="json")
+        return response
+
+    def put(self, upload_id, offset, data):
+        return self.client.put(
+            f"/api/materials/uploads/{upload_id}/", data=data,
+            content_type="application/octet-stream", headers={"Upload-Offset": str(offset)},
+        )
+
+    def test_chunked_upload_and_finalize(self):
+        upload_id = self.start().data["id"]
+
+        self.assertEqual(self.put(upload_id, 0, self.content[:40])["Upload-Offset"], "40")
+        response = self.put(upload_id, 10, self.content[10:])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data["received"], 40)
+        self.assertEqual(self.client.head(f"/api/materials/uploads/{upload_id}/")["Upload-Offset"], "40")
+        self.assertEqual(self.put(upload_id, 40, self.content[40:]).status_code, 200)
+
+        response = self.client.post(f"/api/materials/uploads/{upload_id}/finalize/")
+        self.assertEqual(response.status_code, 201, response.content)
+        material = Material.objects.get(pk=response.data["id"])
+        self.assertEqual(material.file.read(), self.content)
+        self.assertEqual(material.checksum, hashlib.sha256(self.content).hexdigest())
+        self.assertFalse(MaterialUpload.objects.exists())
+        self.assertEqual(list(self.staging_root.iterdir()), [])
+
+    def test_interrupted_chunk_is_discarded_on_resume(self):
+        upload_id = self.start().data["id"]
+        self.put(upload_id, 0, self.content[:30])
+        upload = MaterialUpload.objects.get(pk=upload_id)
+        with open(upload.staging_path, "ab") as handle:
+            handle.write(b"partial garbage from a dropped connection")
+
+        self.put(upload_id, 30, self.content[30:])
+        self.client.post(f"/api/materials/uploads/{upload_id}/finalize/")
+        self.assertEqual(Material.objects.get().file.read(), self.content)
+
+    def test_upload_is_authorized_at_start_and_finalize_needs_all_bytes(self):
+        self.assertEqual(self.start(course=self.make_course("CS999")).status_code, 201)
+        outsider = Course.objects.create(code="BIO1", title="Biology", department=self.department)
+        self.assertEqual(self.start(course=outsider).status_code, 400)
+
+        upload_id = self.start().data["id"]
+        self.assertEqual(self.put(upload_id, 0, self.content + b"x").status_code, 409)
+        self.assertEqual(self.client.post(f"/api/materials/uploads/{upload_id}/finalize/").status_code, 409)
+
+        self.client.force_authenticate(make_professor("other").user)
+        self.assertEqual(self.put(upload_id, 0, self.content).status_code, 404)
+
+    def test_malformed_upload_id_is_404(self):
+        self.client.force_authenticate(self.professor.user)
+        self.assertEqual(self.client.get("/api/materials/uploads/abc/").status_code, 404)
+        self.assertEqual(self.client.post("/api/materials/uploads/abc-def/finalize/").status_code, 404)
+
+    def test_offset_is_checked_against_the_locked_row(self):
+        upload_id = self.start().data["id"]
+        stale = MaterialUpload.objects.get(pk=upload_id)
+        self.put(upload_id, 0, self.content[:40])
+
+        with self.assertRaises(ValidationError):
+            stale.append(0, io.BytesIO(self.content[:40]))
+        self.assertEqual(stale.received, 40)
+        self.assertEqual(stale.staging_path.read_bytes(), self.content[:40])
+
+    @override_settings(UCMS_UPLOAD_MAX_CHUNK=30)
+    def test_chunks_are_capped(self):
+        upload_id = self.start().data["id"]
+        response = self.put(upload_id, 0, self.content[:40])
+        self.assertEqual(response.status_code, 413)
+        self.assertEqual(response["Upload-Offset"], "0")
+
+        upload = MaterialUpload.objects.get(pk=upload_id)
+        with self.assertRaises(ValidationError):
+            upload.append(0, io.BytesIO(self.content[:40]))
+        self.assertEqual(self.put(upload_id, 0, self.content[:30])["Upload-Offset"], "30")
+
+    def test_concurrent_writer_is_refused_without_touching_the_database(self):
+        upload_id = self.start().data["id"]
+        upload = MaterialUpload.objects.get(pk=upload_id)
+        upload.staging_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(upload.staging_path, "ab") as handle:
+            self.assertTrue(locks.lock(handle, locks.LOCK_EX | locks.LOCK_NB))
+            with self.assertNumQueries(0), self.assertRaises(ValidationError):
+                upload.append(0, io.BytesIO(self.content[:40]))
+
+    def test_expired_uploads_are_purged(self):
+        upload_id = self.start().data["id"]
+        self.put(upload_id, 0, self.content[:40])
+        orphan = self.staging_root / "orphan"
+        orphan.write_bytes(b"left behind")
+        old = time.time() - 2 * 86400
+        os.utime(orphan, (old, old))
+        MaterialUpload.objects.filter(pk=upload_id).update(created_at=timezone.now() - timedelta(days=2))
+
+        self.assertEqual(self.client.head(f"/api/materials/uploads/{upload_id}/").status_code, 404)
+        out = io.StringIO()
+        call_command("purge_uploads", stdout=out)
+        self.assertIn("Removed 2", out.getvalue())
+        self.assertFalse(MaterialUpload.objects.exists())
+        self.assertEqual(list(self.staging_root.iterdir()), [])
+
+
+class FeedTests(MaterialFileTestCase):
+    def setUp(self):
+        super().setUp()
+        self.start = timezone.now() - timedelta(hours=1)
+        self.expected = []
+        for i in range(6):
+            self.post(self.course, i)
+        self.post(self.other, 6)
+        self.client.force_authenticate(self.student.user)
+
+    def post(self, course, minute):
+        if minute % 2:
+            obj = Material.objects.create(
+                course=course, uploaded_by=self.professor, title=f"item {minute}",
+                file=SimpleUploadedFile("notes.pdf", self.content),
+            )
+        else:
+            obj = Announcement.objects.create(course=course, posted_by=self.professor, title=f"item {minute}", body="")
+        type(obj).objects.filter(pk=obj.pk).update(created_at=self.start + timedelta(minutes=minute))
+        if course == self.course:
+            self.expected.insert(0, f"item {minute}")
+
+    def titles(self, response):
+        self.assertEqual(response.status_code, 200, response.content)
+        return [row["title"] for row in response.data["results"]]
+
+    def test_feed_merges_visible_items_newest_first(self):
+        response = self.client.get("/api/feed/")
+        self.assertEqual(self.titles(response), self.expected)
+        self.assertEqual(
+            [row["type"] for row in response.data["results"][:2]], ["material", "announcement"]
+        )
+        self.assertIsNone(response.data["next"])
+
+    def test_before_pages_cover_every_item_once(self):
+        seen = []
+        url = "/api/feed/?page_size=4"
+        while url:
+            response = self.client.get(url)
+            seen.extend(self.titles(response))
+            url = response.data["next"]
+        self.assertEqual(seen, self.expected)
+
+    def test_since_returns_only_new_items(self):
+        cursor = self.client.get("/api/feed/").data["since"]
+        response = self.client.get("/api/feed/", {"since": cursor})
+        self.assertEqual(self.titles(response), [])
+        self.assertEqual(response.data["since"], cursor)
+
+        for minute in (7, 8, 9):
+            self.post(self.course, minute)
+        response = self.client.get("/api/feed/", {"since": cursor, "page_size": 2})
+        self.assertEqual(self.titles(response), ["item 8", "item 7"])
+        self.assertTrue(response.data["has_more"])
+
+        response = self.client.get("/api/feed/", {"since": response.data["since"], "page_size": 2})
+        self.assertEqual(self.titles(response), ["item 9"])
+        self.assertFalse(response.data["has_more"])
+
+    def test_query_count_does_not_grow_with_items(self):
+        accessible_course_ids(self.student.user)
+        few = self.count_queries("/api/feed/?page_size=2", self.student.user)
+        many = self.count_queries("/api/feed/", self.student.user)
+        self.assertEqual(few, many)
+
+    def test_invalid_cursor_is_rejected(self):
+        self.assertEqual(self.client.get("/api/feed/?since=nope").status_code, 400)
+
+
+class AnnouncementStreamTests(CoreTestCase):
+    def setUp(self):
+        super().setUp()
+        self.course = self.make_course("CS101")
+        self.other = self.make_course("CS102")
+        self.student = make_student("s1")
+        Enrollment.objects.enroll(self.student, self.course)
+        self.token = str(RoleTokenObtainPairSerializer.get_token(self.student.user).access_token)
+        self.factory = AsyncRequestFactory()
+
+    async def open_stream(self, **headers):
+        request = self.factory.get(f"/api/stream/announcements/?token={self.token}", headers=headers)
+        response = await announcement_stream(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        stream = aiter(response.streaming_content)
+        self.assertTrue((await self.next_event(stream)).startswith("retry:"))
+        return stream
+
+    async def next_event(self, stream):
+        return (await asyncio.wait_for(anext(stream), 1)).decode()
+
+    async def disconnect(self, stream):
+        # The ASGI handler cancels the response task when the client goes away.
+        pending = asyncio.ensure_future(anext(stream))
+        await asyncio.sleep(0.01)
+        pending.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await pending
+
+    def test_wsgi_requests_are_refused(self):
+        response = Client().get(f"/api/stream/announcements/?token={self.token}")
+        self.assertEqual(response.status_code, 501)
+        self.assertFalse(response.streaming)
+
+    async def test_published_announcements_reach_course_subscribers(self):
+        stream = await self.open_stream()
+        publish_announcement({"id": 1, "course": self.other.pk, "title": "Not yours"})
+        publish_announcement({"id": 2, "course": self.course.pk, "title": "Yours"})
+        event = await self.next_event(stream)
+        self.assertEqual(event, 'id: 2\nevent: announcement\ndata: {"id": 2, "course": %d, "title": "Yours"}\n\n' % self.course.pk)
+
+        self.assertEqual(get_broker().connection_count(), 1)
+        await self.disconnect(stream)
+        self.assertEqual(get_broker().connection_count(), 0)
+
+    async def test_idle_stream_sends_heartbeats(self):
+        with mock.patch("core.views.STREAM_HEARTBEAT", 0.05):
+            stream = await self.open_stream()
+            self.assertEqual(await self.next_event(stream), ": keep-alive\n\n")
+        await self.disconnect(stream)
+
+    async def test_reconnect_replays_missed_announcements(self):
+        first = await Announcement.objects.acreate(course=self.course, posted_by=self.professor, title="Seen", body="")
+        await Announcement.objects.acreate(course=self.other, posted_by=self.professor, title="Other", body="")
+        missed = await Announcement.objects.acreate(course=self.course, posted_by=self.professor, title="Missed", body="")
+        stream = await self.open_stream(**{"Last-Event-ID": str(first.pk)})
+        self.assertTrue((await self.next_event(stream)).startswith(f"id: {missed.pk}\n"))
+        await self.disconnect(stream)
+
+    async def test_stream_requires_token(self):
+        response = await announcement_stream(self.factory.get("/api/stream/announcements/"))
+        self.assertEqual(response.status_code, 401)
+        response = await announcement_stream(self.factory.get("/api/stream/announcements/?token=bogus"))
+        self.assertEqual(response.status_code, 401)
+
+    def test_created_announcements_are_published_on_commit(self):
+        self.client.force_authenticate(self.professor.user)
+        with mock.patch("core.views.publish_announcement") as publish:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(
+                    "/api/announcements/", {"course": self.course.pk, "title": "Hi", "body": "Welcome"}, format="json"
+                )
+        self.assertEqual(response.status_code, 201, response.content)
+        publish.assert_called_once_with(response.data)
+
+
+class AsyncReadTests(MaterialFileTestCase):
+    def setUp(self):
+        super().setUp()
+        for i in range(3):
+            Enrollment.objects.enroll(make_student(f"r{i}"), self.other)
+            Announcement.objects.create(course=self.course, posted_by=self.professor, title=f"News {i}", body="")
+        self.upload(self.course)
+        self.upload(self.other)
+
+    def compare(self, user, path):
+        token = str(RoleTokenObtainPairSerializer.get_token(user).access_token)
+        self.client.force_authenticate(None)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+        expected = self.client.get(f"/api/{path}")
+        response = async_to_sync(AsyncClient().get)(f"/api/async/{path}", headers={"Authorization": f"Bearer {token}"})
+        self.assertEqual(response.status_code, expected.status_code, response.content)
+        if "results" in expected.data:
+            self.assertEqual(response.json()["results"], expected.json()["results"])
+        else:
+            self.assertEqual(response.json(), expected.json())
+        return response.json()
+
+    def test_same_payloads_as_sync_views(self):
+        self.compare(self.student.user, "courses/")
+        self.compare(self.student.user, f"courses/{self.course.pk}/")
+        self.compare(self.admin, f"courses/{self.other.pk}/students/")
+        self.assertEqual(len(self.compare(self.student.user, "announcements/")["results"]), 3)
+        self.assertEqual(len(self.compare(self.student.user, "materials/")["results"]), 1)
+        self.assertEqual(len(self.compare(self.professor.user, "materials/")["results"]), 2)
+
+    def test_professor_roster_permission(self):
+        outsider = make_professor("outsider")
+        self.compare(outsider.user, f"courses/{self.other.pk}/students/")
+        self.compare(self.student.user, "courses/999/")
+
+    def test_cursor_pages_cover_every_row_once(self):
+        token = str(RoleTokenObtainPairSerializer.get_token(self.admin).access_token)
+        seen = []
+        url = f"/api/async/courses/{self.other.pk}/students/?page_size=2"
+        while url:
+            data = async_to_sync(AsyncClient().get)(url, headers={"Authorization": f"Bearer {token}"}).json()
+            seen.extend(row["id"] for row in data["results"])
+            url = data["next"]
+        expected = self.other.enrollments.order_by("-created_at", "-id").values_list("id", flat=True)
+        self.assertEqual(seen, list(expected))
+
+    def test_malformed_cursors_are_rejected(self):
+        token = str(RoleTokenObtainPairSerializer.get_token(self.admin).access_token)
+        for values in (["not-a-date", 1], ["2025-01-01T00:00:00", "x"], [{"a": 1}, 1], [1], "x"):
+            cursor = base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+            response = async_to_sync(AsyncClient().get)(
+                f"/api/async/announcements/?cursor={cursor}", headers={"Authorization": f"Bearer {token}"}
+            )
+            self.assertEqual(response.status_code, 404, values)
+
+    def test_requires_authentication(self):
+        response = async_to_sync(AsyncClient().get)("/api/async/courses/")
+        self.assertEqual(response.status_code, 401)
+
+
+@benchmark
+@override_settings(PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"])
+class AsyncReadBenchmark(TransactionTestCase):
+    """
+    Sync vs async handlers at 50 concurrent requests, through Django's own
+    WSGI and ASGI handlers (no HTTP server is installed here): WSGI requests
+    from a 50-thread pool, ASGI requests as 50 concurrent tasks. The numbers
+    compare handler overhead on the test database, not deployed throughput.
+    """
+    requests = 100
+    concurrency = 50
+
+    def setUp(self):
+        cache.clear()
+        department = Department.objects.create(name="Computer Science", code="CS")
+        professor = make_professor("prof", department)
+        course = Course.objects.create(code="CS101", title="Course CS101", department=department)
+        for i in range(20):
+            Announcement.objects.create(course=course, posted_by=professor, title=f"News {i}", body="")
+        token = str(RoleTokenObtainPairSerializer.get_token(make_user("admin", "admin")).access_token)
+        self.headers = {"Authorization": f"Bearer {token}"}
+
+    def report(self, label, latencies, elapsed):
+        latencies.sort()
+        p99 = latencies[int(len(latencies) * 0.99) - 1]
+        print(f"\n{label}: {self.requests / elapsed:.0f} req/s, p99 {p99 * 1000:.1f}ms")
+
+    def test_announcement_list_throughput(self):
+        def one():
+            began = time.perf_counter()
+            try:
+                response = Client(headers=self.headers).get("/api/announcements/")
+            finally:
+                connection.close()
+            return response.status_code, time.perf_counter() - began
+
+        # The WSGI side gets a thread per in-flight request, as a threaded
+        # server would, with the same concurrency as the ASGI side.
+        start = time.perf_counter()
+        with ThreadPoolExecutor(self.concurrency) as pool:
+            results = list(pool.map(lambda _: one(), range(self.requests)))
+        elapsed = time.perf_counter() - start
+        self.assertEqual({code for code, _ in results}, {200})
+        self.report("WSGI /api/announcements/", [latency for _, latency in results], elapsed)
+
+        async def run():
+            client = AsyncClient()
+            gate = asyncio.Semaphore(self.concurrency)
+            latencies = []
+
+            async def one():
+                async with gate:
+                    began = time.perf_counter()
+                    response = await client.get("/api/async/announcements/", headers=self.headers)
+                    latencies.append(time.perf_counter() - began)
+                    return response.status_code
+
+            start = time.perf_counter()
+            codes = await asyncio.gather(*(one() for _ in range(self.requests)))
+            return codes, latencies, time.perf_counter() - start
+
+        codes, latencies, elapsed = async_to_sync(run)()
+        self.assertEqual(set(codes), {200})
+        self.report("ASGI /api/async/announcements/", latencies, elapsed)
+
+
+class RowSerializerTests(MaterialFileTestCase):
+    """The row tables must render exactly what the ModelSerializers do."""
+
+    def setUp(self):
+        super().setUp()
+        self.professor.user.first_name = "Ada"
+        self.professor.user.save()
+        Announcement.objects.create(course=self.course, posted_by=self.professor, title="Hi", body="Welcome")
+        self.upload(self.course)
+        Material.objects.create(course=self.course, uploaded_by=None, title="Syllabus", file="")
+        self.request = APIRequestFactory().get("/api/")
+
+    def cases(self):
+        return [
+            (Department.objects.all(), DepartmentSerializer, DEPARTMENT_ROW),
+            (CourseViewSet.queryset.all(), CourseListSerializer, COURSE_ROW),
+            (
+                Enrollment.objects.select_related("student__user", "course__department")
+                .prefetch_related("course__professors__user"),
+                EnrollmentSerializer, ENROLLMENT_ROW,
+            ),
+            (MaterialViewSet.queryset.all(), MaterialSerializer, MATERIAL_ROW),
+            (AnnouncementViewSet.queryset.all(), AnnouncementSerializer, ANNOUNCEMENT_ROW),
+        ]
+
+    def test_rows_match_model_serializers(self):
+        request = Request(self.request)
+        for queryset, serializer_class, table in self.cases():
+            with self.subTest(serializer_class.__name__):
+                rows = list(queryset)
+                expected = serializer_class(rows, many=True, context={"request": request}).data
+                actual = RowListSerializer(rows, table, context={"request": request}).data
+                self.assertEqual(json.dumps(actual), json.dumps(expected))
+
+    def test_fields_parameter_is_honoured(self):
+        request = Request(APIRequestFactory().get("/api/", {"fields": "id,status"}))
+        data = RowListSerializer(list(Enrollment.objects.all()), ENROLLMENT_ROW, context={"request": request}).data
+        self.assertEqual(set(data[0]), {"id", "status"})
+
+
+@benchmark
+class RowSerializerBenchmark(CoreTestCase):
+    """Rows per second, ModelSerializer vs row table, for each list endpoint."""
+    rows = 300
+
+    def setUp(self):
+        super().setUp()
+        courses = [self.make_course(f"CS{i}", capacity=self.rows) for i in range(3)]
+        students = Student.objects.bulk_create(
+            Student(user=make_user(f"b{i}", "student"), national_id=f"90{i:06}") for i in range(self.rows)
+        )
+        Enrollment.objects.bulk_enroll(
+            {"student": student.pk, "course": courses[i % 3].pk} for i, student in enumerate(students)
+        )
+        Announcement.objects.bulk_create(
+            Announcement(course=courses[i % 3], posted_by=self.professor, title=f"News {i}", body="")
+            for i in range(self.rows)
+        )
+        Material.objects.bulk_create(
+            Material(course=courses[i % 3], uploaded_by=self.professor, title=f"File {i}", file=f"materials/{i}.pdf")
+            for i in range(self.rows)
+        )
+
+    def rate(self, serialize, rows, repeat=3):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            serialize(rows)
+        return len(rows) * repeat / (time.perf_counter() - start)
+
+    def test_rows_per_second(self):
+        request = Request(APIRequestFactory().get("/api/"))
+        context = {"request": request}
+        cases = [
+            ("courses", CourseViewSet.queryset.all(), CourseListSerializer, COURSE_ROW),
+            (
+                "enrollments",
+                Enrollment.objects.select_related("student__user", "course__department")
+                .prefetch_related("course__professors__user"),
+                EnrollmentSerializer, ENROLLMENT_ROW,
+            ),
+            ("materials", MaterialViewSet.queryset.all(), MaterialSerializer, MATERIAL_ROW),
+            ("announcements", AnnouncementViewSet.queryset.all(), AnnouncementSerializer, ANNOUNCEMENT_ROW),
+        ]
+        for name, queryset, serializer_class, table in cases:
+            rows = list(queryset)
+            before = self.rate(lambda rows: serializer_class(rows, many=True, context=context).data, rows)
+            after = self.rate(lambda rows: RowListSerializer(rows, table, context=context).data, rows)
+            print(f"\n{name}: {before:.0f} -> {after:.0f} rows/s ({after / before:.1f}x)")
+            self.assertGreater(after, before)
+
+
+PERF_SCALE = float(os.environ.get("UCMS_PERF_SCALE", "0.002"))
+PERF_LATENCY_MS = float(os.environ.get("UCMS_PERF_LATENCY_MS", "500"))
+
+
+@override_settings(PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"])
+class QueryBudgetTests(TestCase):
+    """
+    Every core route, called by each role with a real JWT against the seeded
+    data set (UCMS_PERF_SCALE of registration-day size), must stay within
+    its query budget and UCMS_PERF_LATENCY_MS. Budgets do not depend on the
+    scale, so an N+1 shows up as soon as a page holds more than one row.
+    Each call runs cold (empty cache) and is rolled back afterwards.
+    """
+    ADMIN, PROFESSOR, STUDENT = "admin", "professor", "student"
+
+    # route name -> (method, path, body, {role: (status, max queries)})
+    BUDGETS = {
+        "api-root": ("get", "/api/", None, {ADMIN: (200, 1), PROFESSOR: (200, 1), STUDENT: (200, 1)}),
+        "department-list": ("get", "/api/departments/", None, {ADMIN: (200, 2), PROFESSOR: (403, 1), STUDENT: (403, 1)}),
+        "department-detail": ("get", "/api/departments/{department}/", None, {ADMIN: (200, 2), PROFESSOR: (403, 1), STUDENT: (403, 1)}),
+        "course-list": ("get", "/api/courses/", None, {ADMIN: (200, 4), PROFESSOR: (200, 4), STUDENT: (200, 4)}),
+        "course-detail": ("get", "/api/courses/{course}/", None, {ADMIN: (200, 4), PROFESSOR: (200, 4), STUDENT: (200, 4)}),
+        "course-students": ("get", "/api/courses/{course}/students/", None, {ADMIN: (200, 5), PROFESSOR: (200, 5), STUDENT: (403, 4)}),
+        "enrollment-list": ("get", "/api/enrollments/", None, {ADMIN: (200, 4), PROFESSOR: (200, 4), STUDENT: (200, 4)}),
+        "enrollment-detail": ("get", "/api/enrollments/{enrollment}/", None, {ADMIN: (200, 4), PROFESSOR: (200, 4), STUDENT: (200, 4)}),
+        "enrollment-bulk": ("post", "/api/enrollments/bulk/", [{"student": "{student}", "course": "{other_course}"}], {ADMIN: (200, 9), PROFESSOR: (403, 1), STUDENT: (403, 1)}),
+        "material-list": ("get", "/api/materials/", None, {ADMIN: (200, 2), PROFESSOR: (200, 3), STUDENT: (200, 3)}),
+        "material-detail": ("get", "/api/materials/{material}/", None, {ADMIN: (200, 2), PROFESSOR: (200, 3), STUDENT: (200, 3)}),
+        "material-download": ("get", "/api/materials/{material}/download/", None, {ADMIN: (200, 2), PROFESSOR: (200, 3), STUDENT: (200, 3)}),
+        "announcement-list": ("get", "/api/announcements/", None, {ADMIN: (200, 3), PROFESSOR: (200, 4), STUDENT: (200, 4)}),
+        "announcement-detail": ("get", "/api/announcements/{announcement}/", None, {ADMIN: (200, 3), PROFESSOR: (200, 4), STUDENT: (200, 4)}),
+        "feed": ("get", "/api/feed/", None, {ADMIN: (200, 3), PROFESSOR: (200, 4), STUDENT: (200, 4)}),
+        "async_course_list": ("get", "/api/async/courses/", None, {ADMIN: (200, 4), PROFESSOR: (200, 4), STUDENT: (200, 4)}),
+        "async_course_detail": ("get", "/api/async/courses/{course}/", None, {ADMIN: (200, 4), PROFESSOR: (200, 4), STUDENT: (200, 4)}),
+        "async_course_students": ("get", "/api/async/courses/{course}/students/", None, {ADMIN: (200, 5), PROFESSOR: (200, 5), STUDENT: (403, 4)}),
+        "async_announcement_list": ("get", "/api/async/announcements/", None, {ADMIN: (200, 2), PROFESSOR: (200, 3), STUDENT: (200, 3)}),
+        "async_material_list": ("get", "/api/async/materials/", None, {ADMIN: (200, 2), PROFESSOR: (200, 3), STUDENT: (200, 3)}),
+        "token_obtain_pair": ("post", "/api/auth/token/", {"username": "{username}", "password": SEED_PASSWORD}, {ADMIN: (200, 2), PROFESSOR: (200, 2), STUDENT: (200, 2)}),
+        "token_refresh": ("post", "/api/auth/token/refresh/", {"refresh": "{refresh}"}, {ADMIN: (200, 1), PROFESSOR: (200, 1), STUDENT: (200, 1)}),
+    }
+    # Routes covered by their own tests instead: long-lived or multi-step.
+    EXEMPT = {
+        "announcement_stream": "streams until the client disconnects; see AnnouncementStreamTests",
+        "user_import": "bulk write path; see UserImportTests",
+        "material-start-upload": "multi-step upload; see ResumableUploadTests",
+        "material-upload-chunk": "multi-step upload; see ResumableUploadTests",
+        "material-finalize-upload": "multi-step upload; see ResumableUploadTests",
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        seeded = seed_data(scale=PERF_SCALE)
+        cls.users = {cls.ADMIN: seeded["admin"], cls.PROFESSOR: seeded["professor"], cls.STUDENT: seeded["student"]}
+        course = Course.objects.order_by("pk").first()
+        student = seeded["student"].student
+        cls.ids = {
+            "department": course.department_id,
+            "course": course.pk,
+            "other_course": Course.objects.exclude(enrollments__student=student).order_by("pk").first().pk,
+            "student": student.pk,
+            "enrollment": Enrollment.objects.get(student=student, course=course).pk,
+            "material": Material.objects.filter(course=course).order_by("pk").first().pk,
+            "announcement": Announcement.objects.filter(course=course).order_by("pk").first().pk,
+        }
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        material = Material.objects.get(pk=self.ids["material"])
+        Path(media.name, material.file.name).parent.mkdir(parents=True)
+        Path(media.name, material.file.name).write_bytes(b"%PDF-1.4 seed")
+
+    def fill(self, value, role):
+        if isinstance(value, str):
+            return value.format(**self.ids, username=self.users[role].username, refresh=self.refresh)
+        if isinstance(value, list):
+            return [self.fill(item, role) for item in value]
+        if isinstance(value, dict):
+            return {key: self.fill(item, role) for key, item in value.items()}
+        return value
+
+    def call(self, method, path, body, role):
+        user = self.users[role]
+        self.refresh = str(RoleTokenObtainPairSerializer.get_token(user))
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {RoleTokenObtainPairSerializer.get_token(user).access_token}")
+        cache.clear()
+        with transaction.atomic():
+            with CaptureQueriesContext(connection) as ctx:
+                start = time.perf_counter()
+                response = getattr(client, method)(self.fill(path, role), self.fill(body, role), format="json")
+                elapsed = (time.perf_counter() - start) * 1000
+            transaction.set_rollback(True)
+        return response, len(ctx.captured_queries), elapsed
+
+    def test_every_route_has_a_budget(self):
+        names = {pattern.name for pattern in core_urls.urlpatterns + core_urls.router.urls if getattr(pattern, "name", None)}
+        self.assertEqual(names - set(self.EXEMPT), set(self.BUDGETS))
+
+    def test_routes_stay_within_budget(self):
+        for name, (method, path, body, roles) in self.BUDGETS.items():
+            for role, (status, max_queries) in roles.items():
+                with self.subTest(route=name, role=role):
+                    response, queries, elapsed = self.call(method, path, body, role)
+                    self.assertEqual(response.status_code, status, getattr(response, "content", b"")[:200])
+                    self.assertLessEqual(queries, max_queries)
+                    self.assertLess(elapsed, PERF_LATENCY_MS)
+
+
+@override_settings(PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"])
+class LoadHarnessTests(TestCase):
+    def test_command_reports_every_endpoint_of_the_mix(self):
+        seed_data(scale=PERF_SCALE)
+        out = io.StringIO()
+        call_command(
+            "loadtest", "--operations", "60", "--concurrency", "1", "--users", "5", "--seed", "7", stdout=out,
+        )
+        report = json.loads(out.getvalue())
+        self.assertEqual(report["mix"], "registration")
+        self.assertEqual(set(report["endpoints"]), {
+            "POST /api/auth/token/", "GET /api/courses/", "GET /api/courses/{id}/", "POST /api/enrollments/",
+            "GET /api/feed/", "GET /api/materials/", "GET /api/materials/{id}/download/",
+        })
+        for label, row in report["endpoints"].items():
+            self.assertLessEqual(row["p50_ms"], row["p99_ms"])
+            if label != "GET /api/materials/{id}/download/":  # seeded materials have no files
+                self.assertEqual(row["errors"], 0, (label, row["statuses"]))
+        self.assertEqual(set(report["endpoints"]["POST /api/auth/token/"]["statuses"]), {"200"})
+
+
+@override_settings(PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"])
+class LockRetryTests(TransactionTestCase):
+    def flaky(self, failures, message="database is locked"):
+        calls = []
+
+        @retry_on_locked(delay=0)
+        def write():
+            calls.append(1)
+            if len(calls) <= failures:
+                raise OperationalError(message)
+            return "done"
+
+        return write, calls
+
+    def test_retries_lock_errors(self):
+        write, calls = self.flaky(2)
+        self.assertEqual(write(), "done")
+        self.assertEqual(len(calls), 3)
+
+    def test_gives_up_after_attempts(self):
+        write, calls = self.flaky(10)
+        with self.assertRaises(OperationalError):
+            write()
+        self.assertEqual(len(calls), settings.UCMS_DB_LOCK_RETRIES)
+
+        write, calls = self.flaky(10)
+        with override_settings(UCMS_DB_LOCK_RETRIES=2), self.assertRaises(OperationalError):
+            write()
+        self.assertEqual(len(calls), 2)
+
+    def test_other_errors_and_inner_transactions_not_retried(self):
+        write, calls = self.flaky(1, "no such table: core_course")
+        with self.assertRaises(OperationalError):
+            write()
+        self.assertEqual(len(calls), 1)
+
+        write, calls = self.flaky(1)
+        with self.assertRaises(OperationalError), transaction.atomic():
+            write()
+        self.assertEqual(len(calls), 1)
+
+    def test_enroll_retried_after_lock(self):
+        department = Department.objects.create(name="Computer Science", code="CS")
+        course = Course.objects.create(code="CS101", title="Intro", department=department, capacity=5)
+        student = make_student("s1")
+        save = Enrollment.save
+        calls = []
+
+        def locked_once(instance, *args, **kwargs):
+            calls.append(1)
+            if len(calls) == 1:
+                raise OperationalError("database is locked")
+            return save(instance, *args, **kwargs)
+
+        with mock.patch.object(Enrollment, "save", locked_once):
+            Enrollment.objects.enroll(student, course)
+        self.assertEqual(len(calls), 2)
+        course.refresh_from_db()
+        self.assertEqual(course.approved_count, 1)
+
+
+@benchmark
+class SQLiteTuningBenchmark(TransactionTestCase):
+    """
+    Concurrent writers (with readers alongside) against SQLite files opened
+    with Django's defaults and with the tuned OPTIONS from settings.
+    """
+    writers = 4
+    readers = 2
+    transactions = 100
+
+    def run_workload(self, path, options):
+        handler = ConnectionHandler({"default": {"ENGINE": "django.db.backends.sqlite3", "NAME": path, "OPTIONS": options}})
+        setup = handler["default"]
+        with setup.cursor() as cursor:
+            cursor.execute("CREATE TABLE seats (course INTEGER PRIMARY KEY, taken INTEGER)")
+            cursor.execute("CREATE TABLE enrollment (id INTEGER PRIMARY KEY, course INTEGER)")
+            cursor.execute("INSERT INTO seats VALUES (1, 0)")
+        setup.close()
+
+        lock_errors = []
+        reads = []
+        done = threading.Event()
+
+        def write():
+            conn = handler["default"]
+            begin = f"BEGIN {options.get('transaction_mode', 'DEFERRED')}"
+            for _ in range(self.transactions):
+                while True:
+                    try:
+                        with conn.cursor() as cursor:
+                            cursor.execute(begin)
+                            cursor.execute("SELECT taken FROM seats WHERE course = 1")
+                            cursor.execute("INSERT INTO enrollment (course) VALUES (1)")
+                            cursor.execute("UPDATE seats SET taken = taken + 1 WHERE course = 1")
+                            cursor.execute("COMMIT")
+                        break
+                    except OperationalError:
+                        lock_errors.append(1)
+                        if conn.connection.in_transaction:
+                            conn.connection.rollback()
+            conn.close()
+
+        def read():
+            conn = handler["default"]
+            while not done.is_set():
+                try:
+                    with conn.cursor() as cursor:
+                        cursor.execute("SELECT COUNT(*) FROM enrollment")
+                    reads.append(1)
+                except OperationalError:
+                    lock_errors.append(1)
+            conn.close()
+
+        writers = [threading.Thread(target=write) for _ in range(self.writers)]
+        readers = [threading.Thread(target=read) for _ in range(self.readers)]
+        started = time.perf_counter()
+        for thread in writers + readers:
+            thread.start()
+        for thread in writers:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        done.set()
+        for thread in readers:
+            thread.join()
+
+        check = handler["default"]
+        with check.cursor() as cursor:
+            cursor.execute("SELECT taken FROM seats")
+            taken = cursor.fetchone()[0]
+        check.close()
+        self.assertEqual(taken, self.writers * self.transactions)
+        return self.writers * self.transactions / elapsed, len(reads) / elapsed, len(lock_errors)
+
+    def test_concurrent_writes_with_tuned_sqlite(self):
+        if settings.DATABASES["default"]["ENGINE"] != "django.db.backends.sqlite3":
+            self.skipTest("SQLite profile not in use.")
+        with tempfile.TemporaryDirectory() as tmp:
+            default = self.run_workload(os.path.join(tmp, "default.sqlite3"), {})
+            tuned = self.run_workload(os.path.join(tmp, "tuned.sqlite3"), settings.DATABASES["default"]["OPTIONS"])
+        for label, (writes, reads, errors) in (("default", default), ("tuned", tuned)):
+            print(f"\nSQLite {label}: {writes:.0f} writes/s, {reads:.0f} reads/s alongside, {errors} lock errors", end="")
+        print()
+        self.assertEqual(tuned[2], 0)
+
+
+@override_settings(PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"], UCMS_READ_REPLICAS=["replica"])
+class ReplicaRoutingTests(TransactionTestCase):
+    """
+    The replica is a second SQLite file: a snapshot of the primary taken in
+    setUp, so anything written afterwards shows up as replication lag.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        # The alias only exists for this class, so it is added here rather
+        # than declared to the test runner; as a mirror it is never flushed.
+        connections.settings["replica"] = {**connection.settings_dict, "TEST": {"MIRROR": "default"}}
+        cls.databases = {"default", "replica"}
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        del connections["replica"]
+        del connections.settings["replica"]
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.department = Department.objects.create(name="Computer Science", code="CS")
+        self.professor = make_professor("prof", self.department)
+        self.course = Course.objects.create(code="CS101", title="Intro", department=self.department, capacity=30)
+        self.course.professors.add(self.professor)
+        self.student = make_student("s1")
+        Enrollment.objects.enroll(self.student, self.course)
+        Announcement.objects.create(course=self.course, posted_by=self.professor, title="Week 1", body="Hi")
+
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        path = os.path.join(tmp.name, "replica.sqlite3")
+        with connection.cursor() as cursor:
+            cursor.execute("VACUUM INTO %s", [path])
+        replica = connections["replica"]
+        replica.close()
+        replica.settings_dict["NAME"] = path
+        self.addCleanup(replica.close)
+
+    def titles(self, user):
+        self.client.force_authenticate(user)
+        response = self.client.get("/api/announcements/")
+        self.assertEqual(response.status_code, 200)
+        return sorted(row["title"] for row in response.data["results"])
+
+    def test_reads_go_to_replica_and_writes_to_primary(self):
+        Announcement.objects.create(course=self.course, posted_by=self.professor, title="Week 2", body="Late")
+        self.assertEqual(self.titles(self.student.user), ["Week 1"])
+
+        self.client.force_authenticate(self.professor.user)
+        with CaptureQueriesContext(connections["replica"]) as replica:
+            response = self.client.post(
+                "/api/announcements/", {"course": self.course.pk, "title": "Week 3", "body": "New"}, format="json"
+            )
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(len(replica.captured_queries), 0)
+        self.assertTrue(Announcement.objects.filter(title="Week 3").exists())
+
+    def test_writer_reads_own_writes_until_window_ends(self):
+        self.client.force_authenticate(self.professor.user)
+        response = self.client.post(
+            "/api/announcements/", {"course": self.course.pk, "title": "Week 2", "body": "New"}, format="json"
+        )
+        self.assertEqual(response.status_code, 201, response.content)
+
+        self.assertEqual(self.titles(self.professor.user), ["Week 1", "Week 2"])
+        self.assertEqual(self.titles(self.student.user), ["Week 1"])
+
+        cache.delete(f"core:db-primary:{self.professor.user.pk}")
+        self.assertEqual(self.titles(self.professor.user), ["Week 1"])
+
+    def test_enrollment_writes_stay_on_primary(self):
+        other = Course.objects.create(code="CS102", title="Data", department=self.department, capacity=30)
+        self.client.force_authenticate(self.student.user)
+        with CaptureQueriesContext(connections["replica"]) as replica:
+            response = self.client.post("/api/enrollments/", {"course_id": other.pk}, format="json")
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(replica.captured_queries, [])
+        other.refresh_from_db()
+        self.assertEqual(other.approved_count, 1)
+
+    def test_roster_read_from_replica(self):
+        late = make_student("s2")
+        Enrollment.objects.enroll(late, self.course)
+        self.client.force_authenticate(self.professor.user)
+
+        response = self.client.get(f"/api/courses/{self.course.pk}/students/")
+        self.assertEqual([row["student"]["id"] for row in response.data["results"]], [self.student.pk])
+        response = self.client.get(f"/api/courses/{self.course.pk}/students/?format=csv")
+        rows = list(csv.DictReader(io.StringIO(b"".join(response.streaming_content).decode())))
+        self.assertEqual([int(row["student_id"]) for row in rows], [self.student.pk])
+
+    def test_catalog_etag_never_paired_with_replica_body(self):
+        self.client.force_authenticate(self.student.user)
+        Course.objects.filter(pk=self.course.pk).update(title="Renamed")
+        bump_content_version("catalog")
+
+        response = self.client.get(f"/api/courses/{self.course.pk}/")
+        self.assertEqual(response.data["title"], "Renamed")
+        etag = response["ETag"]
+        response = self.client.get(f"/api/courses/{self.course.pk}/", headers={"if-none-match": etag})
+        self.assertEqual(response.status_code, 304)
+
+        response = self.client.get("/api/courses/")
+        self.assertEqual([row["title"] for row in response.data["results"]], ["Renamed"])
+
+    def test_replicas_require_a_shared_cache(self):
+        self.assertEqual([error.id for error in replica_stickiness_cache(None)], ["core.E001"])
+        redis = {"default": {"BACKEND": "django.core.cache.backends.redis.RedisCache", "LOCATION": "redis://cache"}}
+        with override_settings(CACHES=redis):
+            self.assertEqual(replica_stickiness_cache(None), [])
+        with override_settings(UCMS_READ_REPLICAS=[]):
+            self.assertEqual(replica_stickiness_cache(None), [])
+
+    def test_without_replicas_everything_uses_primary(self):
+        Announcement.objects.create(course=self.course, posted_by=self.professor, title="Week 2", body="Late")
+        with override_settings(UCMS_READ_REPLICAS=[]):
+            self.assertEqual(self.titles(self.student.user), ["Week 1", "Week 2"])
+
+
+@override_settings(PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"])
+class ConcurrentEnrollmentTests(TransactionTestCase):
+    students = 40
+    capacity = 15
+
+    def test_concurrent_enrollments_never_overbook(self):
+        department = Department.objects.create(name="Computer Science", code="CS")
+        course = Course.objects.create(code="CS101", title="Intro", department=department, capacity=self.capacity)
+        students = [make_student(f"s{i}") for i in range(self.students)]
+        barrier = threading.Barrier(self.students)
+        outcomes = []
+
+        def attempt(student):
+            barrier.wait()
+            try:
+                while True:
+                    try:
+                        Enrollment.objects.enroll(student, course)
+                        outcomes.append(True)
+                    except ValidationError:
+                        outcomes.append(False)
+                    except OperationalError:
+                        # The shared-cache in-memory test database reports
+                        # write contention as "table is locked" instead of
+                        # waiting on busy_timeout; back off and retry.
+                        time.sleep(0.001)
+                        continue
+                    break
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=attempt, args=(student,)) for student in students]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        course.refresh_from_db()
+        self.assertEqual(outcomes.count(True), self.capacity)
+        self.assertEqual(len(outcomes), self.students)
+        self.assertEqual(course.approved_count, self.capacity)
+        self.assertEqual(course.enrollments.filter(status="approved").count(), self.capacity)
+
 
@@ -2,12 +2,16 @@ from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 
+from . import async_views
 from .views import (
     DepartmentViewSet,
     CourseViewSet,
     EnrollmentViewSet,
     MaterialViewSet,
     AnnouncementViewSet,
+    UserImportView,
+    FeedView,
+    announcement_stream,
 )
 
 
@@ -20,6 +24,15 @@ router.register(r"announcements", AnnouncementViewSet)
 
 urlpatterns = [
     path("", include(router.urls)),
+    path("users/import/", UserImportView.as_view(), name="user_import"),
+    path("feed/", FeedView.as_view(), name="feed"),
+    path("stream/announcements/", announcement_stream, name="announcement_stream"),
+
+    path("async/courses/", async_views.course_list, name="async_course_list"),
+    path("async/courses/<int:pk>/", async_views.course_detail, name="async_course_detail"),
+    path("async/courses/<int:pk>/students/", async_views.course_students, name="async_course_students"),
+    path("async/announcements/", async_views.announcement_list, name="async_announcement_list"),
+    path("async/materials/", async_views.material_list, name="async_material_list"),
 
     path("auth/token/", TokenObtainPairView.as_view(), name="token_obtain_pair"),
     path("auth/token/refresh/", TokenRefreshView.as_view(), name="token_refresh"),
@@ -1,10 +1,30 @@
+import csv
+import hashlib
+import io
+from contextlib import ExitStack
+from itertools import islice
+
+from asgiref.sync import sync_to_async
 from django.shortcuts import render
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
+from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import SAFE_METHODS, IsAuthenticated
 from django.shortcuts import get_object_or_404
-from .models import Department, Professor, Student, Course, Enrollment, Material, Announcement
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
+from django.db.models import Count, Max
+from django.http import HttpResponseNotAllowed, JsonResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.renderers import JSONRenderer
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param, remove_query_param
+from .models import Department, Professor, Student, Course, Enrollment, Material, MaterialUpload, Announcement
 from .serializers import (
     DepartmentSerializer,
     ProfessorSerializer,
@@ -13,8 +33,26 @@ from .serializers import (
     CourseDetailSerializer,
     EnrollmentSerializer,
     MaterialSerializer,
+    MaterialUploadSerializer,
     AnnouncementSerializer,
+    requested_fields,
+    RowListSerializer,
+    DEPARTMENT_ROW,
+    COURSE_ROW,
+    ENROLLMENT_ROW,
+    MATERIAL_ROW,
+    ANNOUNCEMENT_ROW,
 )
+from .authentication import authenticate_request
+from .db import pin_to_primary, pinned_to_primary, replica_reads
+from .caching import CATALOG_CACHE_TTL, accessible_course_ids, content_version, get_or_build
+from .feed import activity_feed, decode_cursor, encode_cursor
+from .files import serve_file
+from .pagination import InvalidCursor
+from .provisioning import UserImporter
+from .realtime import format_event, get_broker, publish_announcement
+from .exports import stream_roster
+from .renderers import CSVRenderer, JSONLinesRenderer, PassthroughRenderer
 from .permissions import (
     IsAdmin,
     IsProfessor,
@@ -24,15 +62,118 @@ from .permissions import (
 )
 
 
-class DepartmentViewSet(viewsets.ModelViewSet):
+class ConditionalReadMixin:
+    """
+    Answer list/retrieve with 304 Not Modified when the client's
+    If-None-Match/If-Modified-Since still match, before any query or
+    serialization runs. Views implement get_validators() returning
+    ``(version, last_modified)`` for the current request.
+    """
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(request, super().retrieve, *args, **kwargs)
+
+    def get_validators(self, request):
+        raise NotImplementedError
+
+    def conditional_response(self, request, handler, *args, **kwargs):
+        version, last_modified = self.get_validators(request)
+        # The same rows render differently per path (?fields=, cursors) and format.
+        seed = f"{version}|{request.get_full_path()}|{request.META.get('HTTP_ACCEPT', '')}"
+        etag = f'"{hashlib.md5(seed.encode()).hexdigest()}"'
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = handler(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+        response['ETag'] = etag
+        if last_modified:
+            response['Last-Modified'] = http_date(last_modified)
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+
+
+class CachedListMixin:
+    """
+    Serve list pages from the cache, keyed by the URL under the current
+    ``content_version(list_cache_version)``; any bump orphans them.
+    """
+    list_cache_version = None
+
+    def list(self, request, *args, **kwargs):
+        uri = hashlib.md5(request.build_absolute_uri().encode()).hexdigest()
+        key = f"core:{self.list_cache_version}-page:{content_version(self.list_cache_version)}:{uri}"
+        build = super().list
+        data = get_or_build(key, lambda: build(request, *args, **kwargs).data, CATALOG_CACHE_TTL)
+        return Response(data)
+
+
+class RowListMixin:
+    """
+    Serialize list pages through a plain-function row table (see
+    RowListSerializer) instead of the ModelSerializer; same JSON, less CPU.
+    """
+    list_row = None
+
+    def get_serializer(self, *args, **kwargs):
+        if self.action == 'list' and kwargs.get('many') and self.list_row is not None:
+            return RowListSerializer(args[0], self.list_row, context=self.get_serializer_context())
+        return super().get_serializer(*args, **kwargs)
+
+
+class ReplicaReadMixin:
+    """
+    Run the ``replica_actions`` of a viewset against a read replica (see
+    core.db.ReplicaRouter), unless the user wrote something in the last
+    UCMS_REPLICA_STICKY_SECONDS. Any successful write pins the user to the
+    primary for that window, so they read their own writes.
+    """
+    replica_actions = ('list', 'retrieve')
+
+    def dispatch(self, request, *args, **kwargs):
+        with ExitStack() as self._replica_stack:
+            return super().dispatch(request, *args, **kwargs)
+
+    def initial(self, request, *args, **kwargs):
+        # Authentication and permission checks above run on the primary.
+        super().initial(request, *args, **kwargs)
+        if (
+            request.method in SAFE_METHODS
+            and self.action in self.replica_actions
+            and not pinned_to_primary(request.user.pk)
+        ):
+            self._replica_stack.enter_context(replica_reads())
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        if request.method not in SAFE_METHODS and response.status_code < 400 and request.user.is_authenticated:
+            pin_to_primary(request.user.pk)
+        return super().finalize_response(request, response, *args, **kwargs)
+
+
+class DepartmentViewSet(ReplicaReadMixin, RowListMixin, viewsets.ModelViewSet):
     queryset = Department.objects.all()
     serializer_class = DepartmentSerializer
+    list_row = DEPARTMENT_ROW
     permission_classes = [IsAuthenticated, IsAdmin]
 
 
 
-class CourseViewSet(viewsets.ModelViewSet):
-    queryset = Course.objects.all().select_related('department').prefetch_related('professors')
+class CourseViewSet(ReplicaReadMixin, ConditionalReadMixin, CachedListMixin, RowListMixin, viewsets.ModelViewSet):
+    queryset = Course.objects.all().select_related('department').prefetch_related('professors__user')
+    list_row = COURSE_ROW
+    list_cache_version = 'catalog'
+    # list/retrieve answer conditional requests from the catalog version,
+    # which tracks the primary; a lagging replica would pair that ETag
+    # with a stale body. Only the roster is read from a replica.
+    replica_actions = ('students',)
+
+    def get_validators(self, request):
+        # The catalog is the same for every user, so the version alone decides.
+        version = content_version('catalog')
+        return version, version // 10**9
 
     def get_serializer_class(self):
         if self.action == 'retrieve':
@@ -44,25 +185,53 @@ class CourseViewSet(viewsets.ModelViewSet):
             return [IsAuthenticated(), IsAdmin()]
         return [IsAuthenticated()]
 
-    @action(detail=True, methods=['get'], permission_classes=[IsAuthenticated])
+    @action(
+        detail=True, methods=['get'], permission_classes=[IsAuthenticated],
+        renderer_classes=[*api_settings.DEFAULT_RENDERER_CLASSES, CSVRenderer, JSONLinesRenderer],
+    )
     def students(self, request, pk=None):
         course = self.get_object()
 
-        if request.user.role == 'professor':
-            if not course.professors.filter(user=request.user).exists():
-                return Response({"detail": "Not allowed"}, status=403)
+        # The roster (and its bulk exports) carries contact details and
+        # national IDs: admins and the course's own professors only.
+        # professors__user is prefetched by the queryset, so check in memory.
+        if request.user.role != 'admin' and not (
+            request.user.role == 'professor'
+            and any(professor.user_id == request.user.pk for professor in course.professors.all())
+        ):
+            return Response({"detail": "Not allowed"}, status=403)
+
+        if request.accepted_renderer.format in ('csv', 'jsonl'):
+            return stream_roster(
+                course, request.accepted_renderer.format, asynchronous=isinstance(request._request, ASGIRequest)
+            )
 
-        enrollments = course.enrollments.filter(status='approved')
-        serializer = EnrollmentSerializer(enrollments, many=True)
-        return Response(serializer.data)
+        enrollments = course.enrollments.filter(status='approved').select_related('student__user')
+        page = self.paginate_queryset(enrollments)
+        for enrollment in page:
+            enrollment.course = course
+        serializer = RowListSerializer(page, ENROLLMENT_ROW, context=self.get_serializer_context())
+        return self.get_paginated_response(serializer.data)
 
 
 
-class EnrollmentViewSet(viewsets.ModelViewSet):
-    queryset = Enrollment.objects.all().select_related('student__user', 'course')
+class EnrollmentViewSet(ReplicaReadMixin, RowListMixin, viewsets.ModelViewSet):
+    queryset = Enrollment.objects.all()
     serializer_class = EnrollmentSerializer
+    list_row = ENROLLMENT_ROW
+
+    def get_queryset(self):
+        qs = super().get_queryset()
+        fields = requested_fields(self.request)
+        if fields is None or 'student' in fields:
+            qs = qs.select_related('student__user')
+        if fields is None or 'course' in fields:
+            qs = qs.select_related('course__department').prefetch_related('course__professors__user')
+        return qs
 
     def get_permissions(self):
+        if self.action == 'bulk':
+            return [IsAuthenticated(), IsAdmin()]
         if self.action in ['create', 'destroy']:
             return [IsAuthenticated(), IsStudent()]
         if self.action in ['update', 'partial_update']:
@@ -72,27 +241,46 @@ class EnrollmentViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         return serializer.save(student=self.request.user.student)
 
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        upload = request.FILES.get('file')
+        if upload is not None:
+            rows = csv.DictReader(io.TextIOWrapper(upload.file, encoding='utf-8-sig'))
+        elif isinstance(request.data, list):
+            rows = request.data
+        else:
+            rows = request.data.get('enrollments')
+            if not isinstance(rows, list):
+                return Response(
+                    {"detail": "Send a list of {student, course} objects or a CSV file."},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+
+        results = Enrollment.objects.bulk_enroll(rows)
+        created = sum(1 for result in results if result["status"] == "created")
+        return Response({"created": created, "failed": len(results) - created, "results": results})
+
+
 
+UUID_PATTERN = r'[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}'
 
-class MaterialViewSet(viewsets.ModelViewSet):
-    queryset = Material.objects.all().select_related('course', 'uploaded_by')
+
+class MaterialViewSet(ReplicaReadMixin, RowListMixin, viewsets.ModelViewSet):
+    queryset = Material.objects.all().select_related('course', 'uploaded_by__user')
     serializer_class = MaterialSerializer
+    list_row = MATERIAL_ROW
+    upload_actions = ['start_upload', 'upload_chunk', 'finalize_upload']
 
     def get_permissions(self):
-        if self.action in ['create', 'update', 'partial_update', 'destroy']:
+        if self.action in ['create', 'update', 'partial_update', 'destroy'] + self.upload_actions:
             return [IsAuthenticated(), IsProfessor()]
         return [IsAuthenticated()]
 
     def get_queryset(self):
         qs = super().get_queryset()
 
-        if self.request.user.role == 'student':
-            student = self.request.user.student
-            return qs.filter(course__enrollments__student=student, course__enrollments__status='approved')
-
-        if self.request.user.role == 'professor':
-            professor = self.request.user.professor
-            return qs.filter(course__professors=professor)
+        if self.request.user.role in ('student', 'professor'):
+            return qs.filter(course_id__in=accessible_course_ids(self.request.user))
 
         return qs
 
@@ -100,11 +288,79 @@ class MaterialViewSet(viewsets.ModelViewSet):
         professor = self.request.user.professor
         serializer.save(uploaded_by=professor)
 
-
-
-class AnnouncementViewSet(viewsets.ModelViewSet):
-    queryset = Announcement.objects.all().select_related('course', 'posted_by')
+    @action(detail=True, methods=['get'], renderer_classes=[JSONRenderer, PassthroughRenderer])
+    def download(self, request, pk=None):
+        material = self.get_object()
+        etag = f'"{material.checksum}"' if material.checksum else None
+        return serve_file(request, material.file, material.download_name(), etag=etag)
+
+    # Resumable uploads: POST uploads/ to start (course access is checked
+    # here), PUT raw bytes to uploads/<id>/ with an Upload-Offset header,
+    # GET/HEAD uploads/<id>/ to learn the offset to resume from, then POST
+    # uploads/<id>/finalize/ to create the Material.
+
+    @action(detail=False, methods=['post'], url_path='uploads')
+    def start_upload(self, request):
+        serializer = MaterialUploadSerializer(data=request.data, context=self.get_serializer_context())
+        serializer.is_valid(raise_exception=True)
+        upload = serializer.save(uploaded_by=request.user.professor)
+        return self._upload_response(upload, status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=['get', 'put'], url_path=rf'uploads/(?P<upload_id>{UUID_PATTERN})')
+    def upload_chunk(self, request, upload_id=None):
+        upload = self._get_upload(upload_id)
+        if request.method == 'PUT':
+            try:
+                offset = int(request.headers.get('Upload-Offset', ''))
+            except ValueError:
+                return Response({"detail": "Upload-Offset header is required."}, status=status.HTTP_400_BAD_REQUEST)
+            max_bytes = settings.UCMS_UPLOAD_MAX_CHUNK
+            if int(request.META.get('CONTENT_LENGTH') or 0) > max_bytes:
+                return self._upload_response(
+                    upload, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=f"Chunks are limited to {max_bytes} bytes."
+                )
+            try:
+                upload.append(offset, request.stream or io.BytesIO())
+            except DjangoValidationError as exc:
+                return self._upload_response(upload, status.HTTP_409_CONFLICT, detail=exc.messages[0])
+        return self._upload_response(upload)
+
+    @action(detail=False, methods=['post'], url_path=rf'uploads/(?P<upload_id>{UUID_PATTERN})/finalize')
+    def finalize_upload(self, request, upload_id=None):
+        upload = self._get_upload(upload_id)
+        try:
+            material = upload.finalize()
+        except DjangoValidationError as exc:
+            return self._upload_response(upload, status.HTTP_409_CONFLICT, detail=exc.messages[0])
+        return Response(self.get_serializer(material).data, status=status.HTTP_201_CREATED)
+
+    def _get_upload(self, upload_id):
+        return get_object_or_404(MaterialUpload.objects.active(), pk=upload_id, uploaded_by=self.request.user.professor)
+
+    def _upload_response(self, upload, status_code=status.HTTP_200_OK, detail=None):
+        data = MaterialUploadSerializer(upload).data
+        if detail:
+            data["detail"] = detail
+        response = Response(data, status=status_code)
+        response['Upload-Offset'] = str(upload.received)
+        return response
+
+
+
+class AnnouncementViewSet(ReplicaReadMixin, ConditionalReadMixin, RowListMixin, viewsets.ModelViewSet):
+    queryset = Announcement.objects.all().select_related('course', 'posted_by__user')
     serializer_class = AnnouncementSerializer
+    list_row = ANNOUNCEMENT_ROW
+
+    def get_validators(self, request):
+        # Newest row and row count over what this user can see; the global
+        # version covers edits and deletes that leave both unchanged.
+        version = content_version('announcements')
+        stats = self.get_queryset().order_by().aggregate(last=Max('created_at'), count=Count('id'))
+        last_modified = version // 10**9
+        if stats['last'] is not None:
+            last_modified = max(last_modified, int(stats['last'].timestamp()))
+        return f"{version}:{stats['count']}:{stats['last']}", last_modified
 
     def get_permissions(self):
         if self.action in ['create', 'update', 'partial_update', 'destroy']:
@@ -114,16 +370,162 @@ class AnnouncementViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         qs = super().get_queryset()
 
-        if self.request.user.role == 'student':
-            student = self.request.user.student
-            return qs.filter(course__enrollments__student=student, course__enrollments__status='approved')
-
-        if self.request.user.role == 'professor':
-            professor = self.request.user.professor
-            return qs.filter(course__professors=professor)
+        if self.request.user.role in ('student', 'professor'):
+            return qs.filter(course_id__in=accessible_course_ids(self.request.user))
 
         return qs
 
     def perform_create(self, serializer):
         professor = self.request.user.professor
         serializer.save(posted_by=professor)
+        data = serializer.data
+        transaction.on_commit(lambda: publish_announcement(data))
+
+
+
+class UserImportView(APIView):
+    """
+    Import a small users CSV within the request. Passwords are hashed in
+    this worker, so files are capped at UCMS_IMPORT_API_MAX_ROWS rows;
+    larger ones go through the ``import_users`` command and its process pool.
+    """
+    permission_classes = [IsAuthenticated, IsAdmin]
+
+    def post(self, request):
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({"detail": "Upload the users CSV in the 'file' field."}, status=status.HTTP_400_BAD_REQUEST)
+
+        max_rows = settings.UCMS_IMPORT_API_MAX_ROWS
+        rows = list(islice(csv.DictReader(io.TextIOWrapper(upload.file, encoding='utf-8-sig')), max_rows + 1))
+        if len(rows) > max_rows:
+            return Response(
+                {"detail": f"At most {max_rows} rows can be imported here; use the import_users command for larger files."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        summary = UserImporter(workers=0).run(rows)
+        return Response(summary)
+
+
+
+class FeedView(APIView):
+    """
+    Announcements and new materials from the user's courses, newest first.
+
+    ``?before=<cursor>`` pages back (follow ``next``); ``?since=<cursor>``
+    returns only what was posted after it. Poll with the ``since`` value
+    of the previous response, immediately again while ``has_more`` is set.
+    """
+    permission_classes = [IsAuthenticated]
+    page_size = 50
+    max_page_size = 500
+
+    def get(self, request):
+        try:
+            limit = min(int(request.query_params.get('page_size', self.page_size)), self.max_page_size)
+            before = request.query_params.get('before')
+            since = request.query_params.get('since')
+            before = decode_cursor(before) if before else None
+            since = decode_cursor(since) if since else None
+        except (ValueError, InvalidCursor):
+            return Response({"detail": "Invalid page_size or cursor."}, status=status.HTTP_400_BAD_REQUEST)
+        if limit < 1 or (before and since):
+            return Response({"detail": "Invalid page_size or cursor."}, status=status.HTTP_400_BAD_REQUEST)
+
+        items, has_more = activity_feed(request.user, limit, before=before, since=since)
+
+        context = {'request': request, 'view': self}
+        serializers = {'announcement': AnnouncementSerializer, 'material': MaterialSerializer}
+        data = {}
+        for kind, serializer_class in serializers.items():
+            objs = [obj for item_kind, obj in items if item_kind == kind]
+            for obj, row in zip(objs, serializer_class(objs, many=True, context=context).data):
+                data[kind, obj.pk] = row
+
+        url = request.build_absolute_uri()
+        next_url = None
+        if has_more and since is None:
+            next_url = replace_query_param(remove_query_param(url, 'since'), 'before', encode_cursor(*items[-1]))
+        return Response({
+            "results": [{"type": kind, **data[kind, obj.pk]} for kind, obj in items],
+            "next": next_url,
+            "since": encode_cursor(*items[0]) if items else request.query_params.get('since'),
+            "has_more": has_more if since is not None else False,
+        })
+
+
+STREAM_HEARTBEAT = getattr(settings, 'UCMS_STREAM_HEARTBEAT', 15)
+STREAM_BACKLOG = 100
+
+
+def _stream_backlog(course_ids, last_event_id):
+    announcements = (
+        Announcement.objects.select_related('posted_by__user')
+        .filter(course_id__in=course_ids, pk__gt=last_event_id)
+        .order_by('pk')
+    )
+    data = AnnouncementSerializer(announcements[:STREAM_BACKLOG], many=True, context={'request': None}).data
+    return [{'event': 'announcement', 'id': row['id'], 'data': row} for row in data]
+
+
+def _stream_course_ids(user):
+    if user.role in ('student', 'professor'):
+        return accessible_course_ids(user)
+    return list(Course.objects.values_list('pk', flat=True))
+
+
+async def _event_stream(subscription, backlog):
+    try:
+        yield f"retry: {STREAM_HEARTBEAT * 1000}\n\n"
+        seen = 0
+        for event in backlog:
+            seen = event['id']
+            yield format_event(event)
+        while True:
+            event = await subscription.get(STREAM_HEARTBEAT)
+            if event is None:
+                yield ": keep-alive\n\n"
+            elif event['id'] > seen:
+                yield format_event(event)
+    finally:
+        subscription.close()
+
+
+async def announcement_stream(request):
+    """
+    Server-Sent Events stream of new announcements in the user's courses.
+
+    Authenticates with the usual JWT, from the Authorization header or a
+    ``?token=`` parameter (EventSource cannot set headers). Reconnecting
+    clients send Last-Event-ID and get what they missed replayed first.
+    Served from ucms/asgi.py, where an idle connection is a coroutine
+    rather than a worker thread. Under WSGI Django would drain the endless
+    generator into a list before sending anything, so there the endpoint
+    answers 501.
+    """
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse({"detail": "Event streams are only served over ASGI."}, status=501)
+    if request.method != 'GET':
+        return HttpResponseNotAllowed(['GET'])
+    token = request.GET.get('token')
+    if token and 'HTTP_AUTHORIZATION' not in request.META:
+        request.META['HTTP_AUTHORIZATION'] = f"Bearer {token}"
+    try:
+        user = await sync_to_async(authenticate_request)(request)
+    except AuthenticationFailed as e:
+        return JsonResponse({"detail": str(e.detail)}, status=401)
+    if user is None:
+        return JsonResponse({"detail": "Authentication credentials were not provided."}, status=401)
+
+    course_ids = await sync_to_async(_stream_course_ids)(user)
+    # Subscribe before reading the backlog so nothing falls in between.
+    subscription = get_broker().subscribe(course_ids)
+    backlog = []
+    last_event_id = request.headers.get('Last-Event-ID', '')
+    if last_event_id.isdigit():
+        backlog = await sync_to_async(_stream_backlog)(course_ids, int(last_event_id))
+
+    response = StreamingHttpResponse(_event_stream(subscription, backlog), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -48,13 +48,19 @@ MEDIA_ROOT = BASE_DIR / "media"
 AUTH_USER_MODEL = 'core.User'
 
 
+# Set UCMS_STATELESS_JWT_AUTH=1 to authenticate read requests from the token
+# claims alone, without loading the user row (see core.authentication).
+UCMS_STATELESS_JWT_AUTH = os.environ.get("UCMS_STATELESS_JWT_AUTH") == "1"
+
 REST_FRAMEWORK = {
 "DEFAULT_AUTHENTICATION_CLASSES": (
-"rest_framework_simplejwt.authentication.JWTAuthentication",
+"core.authentication.StatelessJWTAuthentication" if UCMS_STATELESS_JWT_AUTH else "core.authentication.ProfileJWTAuthentication",
 ),
 "DEFAULT_PERMISSION_CLASSES": (
 "rest_framework.permissions.IsAuthenticated",
 ),
+"DEFAULT_PAGINATION_CLASS": "core.pagination.CreatedAtCursorPagination",
+"PAGE_SIZE": 50,
 }
 
 
@@ -62,9 +68,12 @@ from datetime import timedelta
 SIMPLE_JWT = {
 "ACCESS_TOKEN_LIFETIME": timedelta(minutes=60),
 "REFRESH_TOKEN_LIFETIME": timedelta(days=1),
+"TOKEN_OBTAIN_SERIALIZER": "core.serializers.RoleTokenObtainPairSerializer",
+"TOKEN_REFRESH_SERIALIZER": "core.serializers.CachedTokenRefreshSerializer",
 }
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'core.middleware.RequestMetricsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -96,12 +105,156 @@ WSGI_APPLICATION = 'ucms.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# Configured from the environment. UCMS_DB_ENGINE is a Django backend name
+# (sqlite3, postgresql, mysql); server databases also read UCMS_DB_NAME,
+# UCMS_DB_USER, UCMS_DB_PASSWORD, UCMS_DB_HOST and UCMS_DB_PORT.
+
+UCMS_DB_ENGINE = os.environ.get("UCMS_DB_ENGINE", "sqlite3")
+# Seconds a connection is kept open between requests. Server databases
+# keep theirs (with health checks) for a minute under WSGI, so requests do
+# not each pay for a new connection; opening a SQLite file is cheap, so it
+# is closed after each request. Under ASGI, where a request may run on any
+# thread and persistent connections pile up, set 0 and use UCMS_DB_POOL.
+UCMS_DB_CONN_MAX_AGE = int(os.environ.get("UCMS_DB_CONN_MAX_AGE", 0 if UCMS_DB_ENGINE == "sqlite3" else 60))
+# Seconds a write waits for a lock before "database is locked".
+UCMS_DB_TIMEOUT = float(os.environ.get("UCMS_DB_TIMEOUT", 5))
+
+if UCMS_DB_ENGINE == "sqlite3":
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get("UCMS_DB_NAME", BASE_DIR / 'db.sqlite3'),
+            'CONN_MAX_AGE': UCMS_DB_CONN_MAX_AGE,
+            'OPTIONS': {
+                # WAL lets readers run alongside the writer; NORMAL syncs at
+                # checkpoints rather than every commit (safe under WAL).
+                'init_command': (
+                    "PRAGMA journal_mode=WAL;"
+                    "PRAGMA synchronous=NORMAL;"
+                    f"PRAGMA mmap_size={int(os.environ.get('UCMS_SQLITE_MMAP_SIZE', 256 * 1024 * 1024))};"
+                ),
+                # Sets busy_timeout.
+                'timeout': UCMS_DB_TIMEOUT,
+                # Take the write lock at BEGIN, so a transaction never fails
+                # half-way upgrading a read lock.
+                'transaction_mode': 'IMMEDIATE',
+            },
+        }
     }
-}
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': f'django.db.backends.{UCMS_DB_ENGINE}',
+            'NAME': os.environ.get("UCMS_DB_NAME", "ucms"),
+            'USER': os.environ.get("UCMS_DB_USER", ""),
+            'PASSWORD': os.environ.get("UCMS_DB_PASSWORD", ""),
+            'HOST': os.environ.get("UCMS_DB_HOST", ""),
+            'PORT': os.environ.get("UCMS_DB_PORT", ""),
+            'CONN_MAX_AGE': UCMS_DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {},
+        }
+    }
+    if UCMS_DB_ENGINE == "postgresql" and os.environ.get("UCMS_DB_POOL"):
+        # psycopg 3 pool (pip install "psycopg[pool]"); it replaces persistent
+        # connections, which Django does not allow alongside it.
+        DATABASES['default']['CONN_MAX_AGE'] = 0
+        DATABASES['default']['OPTIONS']['pool'] = {
+            'min_size': int(os.environ.get("UCMS_DB_POOL_MIN", 2)),
+            'max_size': int(os.environ.get("UCMS_DB_POOL_MAX", 20)),
+            'timeout': UCMS_DB_TIMEOUT,
+        }
+
+# Read replicas: a comma-separated UCMS_DB_REPLICAS list of SQLite files or,
+# for server databases, hosts. core.db.ReplicaRouter sends list/retrieve
+# reads to them; a user who just wrote reads from the primary for
+# UCMS_REPLICA_STICKY_SECONDS so they see their own change. That pin is kept
+# in the cache, so replicas require a shared one (UCMS_REDIS_URL); the
+# core.E001 system check refuses to start with a per-process cache.
+UCMS_READ_REPLICAS = []
+for number, replica in enumerate(filter(None, os.environ.get("UCMS_DB_REPLICAS", "").split(",")), start=1):
+    alias = f"replica{number}"
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        'NAME' if UCMS_DB_ENGINE == "sqlite3" else 'HOST': replica.strip(),
+        'OPTIONS': dict(DATABASES['default']['OPTIONS']),
+        'TEST': {'MIRROR': 'default'},
+    }
+    UCMS_READ_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ["core.db.ReplicaRouter"]
+UCMS_REPLICA_STICKY_SECONDS = int(os.environ.get("UCMS_REPLICA_STICKY_SECONDS", 5))
+
+# Retries of writes that lost a lock race (core.db.retry_on_locked). Each
+# attempt can wait UCMS_DB_TIMEOUT, so a write blocks for at most about
+# RETRIES * TIMEOUT seconds (15s by default); keep that under the proxy's
+# request timeout.
+UCMS_DB_LOCK_RETRIES = int(os.environ.get("UCMS_DB_LOCK_RETRIES", 3))
+UCMS_DB_LOCK_RETRY_DELAY = float(os.environ.get("UCMS_DB_LOCK_RETRY_DELAY", 0.05))
+
+
+# Cache
+# Per-process memory by default; set UCMS_REDIS_URL in production so every
+# worker shares the catalog versions, cached pages and rebuild locks.
+
+UCMS_REDIS_URL = os.environ.get("UCMS_REDIS_URL")
+
+if UCMS_REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': UCMS_REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Seconds a serialized course-list page stays cached under a catalog version.
+UCMS_CATALOG_CACHE_TTL = int(os.environ.get("UCMS_CATALOG_CACHE_TTL", 600))
+
+# Request metrics (core.middleware): with DEBUG on, or for staff and admin
+# users, responses carry Server-Timing (db, serialize, render, total); set
+# UCMS_METRICS_LOG to a file path to append a sample of requests as JSON
+# lines, summarised by "manage.py metrics_report".
+UCMS_METRICS_LOG = os.environ.get("UCMS_METRICS_LOG") or None
+UCMS_METRICS_SAMPLE_RATE = float(os.environ.get("UCMS_METRICS_SAMPLE_RATE", 0.1))
+UCMS_METRICS_DUPLICATE_THRESHOLD = 3
+
+# Fan-out for the announcement event stream (/api/stream/announcements/).
+# The in-process broker only reaches connections held by the same worker;
+# multi-node deployments point this at a broker backed by a shared channel.
+UCMS_REALTIME_BROKER = os.environ.get("UCMS_REALTIME_BROKER", "core.realtime.InProcessBroker")
+
+
+# Password hashing and login
+# PBKDF2 work factor; changing it re-encodes each user's hash at their next login.
+UCMS_PBKDF2_ITERATIONS = int(os.environ.get("UCMS_PBKDF2_ITERATIONS", 1_000_000))
+
+PASSWORD_HASHERS = [
+    "core.hashers.ConfigurablePBKDF2PasswordHasher",
+    "django.contrib.auth.hashers.PBKDF2PasswordHasher",
+    "django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher",
+    "django.contrib.auth.hashers.Argon2PasswordHasher",
+    "django.contrib.auth.hashers.BCryptSHA256PasswordHasher",
+    "django.contrib.auth.hashers.ScryptPasswordHasher",
+]
+
+# Logins verify passwords in a bounded thread pool (core.hashers.HashPool):
+# at most WORKERS + QUEUE_SIZE at once, later ones wait QUEUE_TIMEOUT
+# seconds for a slot and then get 503 with Retry-After.
+AUTHENTICATION_BACKENDS = ["core.backends.PooledModelBackend"]
+UCMS_LOGIN_HASH_WORKERS = int(os.environ.get("UCMS_LOGIN_HASH_WORKERS", 0)) or os.cpu_count()
+UCMS_LOGIN_QUEUE_SIZE = int(os.environ.get("UCMS_LOGIN_QUEUE_SIZE", UCMS_LOGIN_HASH_WORKERS * 8))
+UCMS_LOGIN_QUEUE_TIMEOUT = float(os.environ.get("UCMS_LOGIN_QUEUE_TIMEOUT", 2))
+
+# The users import API hashes every row's password within the request
+# (~0.5s each at the default work factor); bigger files go through the
+# "manage.py import_users" command.
+UCMS_IMPORT_API_MAX_ROWS = int(os.environ.get("UCMS_IMPORT_API_MAX_ROWS", 50))
 
 
 # Password validation
@@ -150,4 +303,20 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Uploads are written to disk as they arrive and hashed on the way
+# (core.files.ChecksumUploadHandler) so materials can be de-duplicated.
+FILE_UPLOAD_HANDLERS = ["core.files.ChecksumUploadHandler"]
+
+# Resumable uploads are staged outside MEDIA_ROOT and expire after
+# UCMS_UPLOAD_EXPIRY_HOURS; run "manage.py purge_uploads" periodically.
+UCMS_UPLOAD_STAGING_DIR = os.environ.get("UCMS_UPLOAD_STAGING_DIR") or os.path.join(BASE_DIR, 'upload_staging')
+UCMS_UPLOAD_EXPIRY_HOURS = int(os.environ.get("UCMS_UPLOAD_EXPIRY_HOURS", 24))
+# Most bytes one PUT may carry; clients split larger files into chunks.
+UCMS_UPLOAD_MAX_CHUNK = int(os.environ.get("UCMS_UPLOAD_MAX_CHUNK", 8 * 1024 * 1024))
+
+# Hand material downloads to the front-end server, e.g. "X-Accel-Redirect"
+# (nginx, served from UCMS_SENDFILE_PREFIX) or "X-Sendfile" (Apache).
+UCMS_SENDFILE_HEADER = os.environ.get("UCMS_SENDFILE_HEADER") or None
+UCMS_SENDFILE_PREFIX = os.environ.get("UCMS_SENDFILE_PREFIX", "/protected/")
+
 ALLOWED_HOSTS = ['yara2004.pythonanywhere.com', 'localhost', '127.0.0.1']